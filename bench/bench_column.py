@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.column import ColumnCache, text_column
+from textlib.piecetable import PieceTable
+
+LINE_LENGTHS = (1000, 0x10000, 0x100000)  # chars
+MOVES = 2000
+TAB_SIZE = 4
+WORDS = ('if', 'x', 'value', '=', 'call(a, b)', '#', 'comment')
+
+
+########################################
+# Returns a document of three lines, the middle one long and with tabs between its words
+########################################
+def make_doc(length, rnd):
+    parts = []
+    size = 0
+    while size < length:
+        part = rnd.choice(WORDS) + rnd.choice(('\t', ' ', '\t\t'))
+        parts.append(part)
+        size += len(part)
+    return PieceTable('first line\r\n' + ''.join(parts)[:length] + '\r\nlast line\r\n')
+
+
+########################################
+# The column without a cache: looks up the line and expands the tabs of the text before pos
+# on each move, like it's done in viewer mode
+########################################
+def line_column_old(doc, pos, tab_size):
+    line = doc.line_from_offset(pos)
+    start = doc.line_offset(line)
+    return line, text_column(doc.substring(start, pos), tab_size)
+
+
+########################################
+# Moves the caret along the long line, char by char (typing, cursor keys) and to random
+# positions in it (mouse), prints the mean time per move of both
+########################################
+def main():
+    rnd = random.Random(13)
+    print('{:>8}  {:>10}  {:>14}  {:>14}'.format('line', 'moves', 'ColumnCache us', 'per move us'))
+    for length in LINE_LENGTHS:
+        doc = make_doc(length, rnd)
+        start = doc.line_offset(1)
+        for name, positions in (
+                ('by char', [start + (length // 2 + i) % (length + 1) for i in range(MOVES)]),
+                ('random', [start + rnd.randrange(length + 1) for _ in range(MOVES)])):
+            cache = ColumnCache()
+            t = time.perf_counter()
+            cols = [cache.line_column(doc, pos, TAB_SIZE) for pos in positions]
+            new = (time.perf_counter() - t) / MOVES * 1e6
+            t = time.perf_counter()
+            old_cols = [line_column_old(doc, pos, TAB_SIZE) for pos in positions]
+            old = (time.perf_counter() - t) / MOVES * 1e6
+            assert cols == old_cols
+            print('{:>8}  {:>10}  {:14.2f}  {:14.2f}'.format(length, name, new, old))
+
+
+if __name__ == '__main__':
+    main()
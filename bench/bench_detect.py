@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resources.const import *
+from textlib.encoding import sniff_encoding
+
+SIZES = (0x2800, 0x100000, 0x6400000)  # 10 KB, 1 MB, 100 MB
+CORPUS_FILES = 200  # generated texts per script, encoding and size class
+WORDS = {
+    'english': 'the quick brown fox jumps over lazy dog window editor file line'.split(),
+    'german': 'größe änderung über prüfen fenster straße müde öffnen'.split(),
+    'french': 'éditeur fenêtre déjà où garçon à côté être'.split(),
+    'russian': 'окно файл строка редактор кодировка текст'.split(),
+    'japanese': '文字 コード 判定 難しい 問題 です 編集'.split(),
+}
+ENCODINGS = {
+    IDM_UTF_8: 'utf-8',
+    IDM_UTF_8_BOM: 'utf-8-sig',
+    IDM_UTF_16_LE: 'utf-16-le',
+    IDM_UTF_16_BE: 'utf-16-be',
+    IDM_ANSI: 'cp1252',  # stands for the ANSI code page, which only exists on Windows
+}
+NAMES = {IDM_UTF_8: 'utf-8', IDM_UTF_8_BOM: 'utf-8 BOM', IDM_UTF_16_LE: 'utf-16-le', IDM_UTF_16_BE: 'utf-16-be',
+        IDM_ANSI: 'ansi'}
+
+
+########################################
+#
+########################################
+def random_text(rnd, words, size):
+    lines = []
+    n = 0
+    while n < size:
+        line = ' '.join(rnd.choice(words) for _ in range(rnd.randrange(1, 12))) + rnd.choice(('\r\n', '\n'))
+        lines.append(line)
+        n += len(line)
+    return ''.join(lines)
+
+
+########################################
+# Detects the encoding of generated texts of all scripts (that the encoding can represent) in
+# sizes of up to 64 KB, prints the accuracy and mean confidence per encoding
+########################################
+def accuracy():
+    rnd = random.Random(5)
+    print('{:<10} {:<9} {:>6}  {:>9}  {:>10}  {}'.format('script', 'encoding', 'files', 'accuracy', 'confidence',
+            'misdetected as'))
+    for script, words in WORDS.items():
+        for encoding_id, encoding in ENCODINGS.items():
+            try:
+                ''.join(words).encode(encoding)
+            except UnicodeEncodeError:
+                continue
+            if encoding_id == IDM_ANSI and ''.join(words).isascii():
+                continue  # the same bytes as UTF-8
+            hits = 0
+            confidence = 0.0
+            wrong = Counter()
+            for i in range(CORPUS_FILES):
+                data = random_text(rnd, words, rnd.randrange(1, 0x10000 >> (i % 8))).encode(encoding)
+                detected, conf = sniff_encoding(data)
+                confidence += conf
+                if detected == encoding_id:
+                    hits += 1
+                else:
+                    wrong[NAMES[detected]] += 1
+            print('{:<10} {:<9} {:>6}  {:8.1f}%  {:10.2f}  {}'.format(script, NAMES[encoding_id], CORPUS_FILES,
+                    100 * hits / CORPUS_FILES, confidence / CORPUS_FILES, dict(wrong) or ''))
+
+
+########################################
+# Prints the detection time per data size, which should stay about the same
+########################################
+def latency():
+    rnd = random.Random(5)
+    print('\n{:<9} {:>10}  {:>10}'.format('encoding', 'size', 'ms'))
+    text = random_text(rnd, WORDS['german'], 0x100000)
+    for encoding_id in (IDM_UTF_8, IDM_UTF_16_LE, IDM_ANSI):
+        block = text.encode(ENCODINGS[encoding_id])
+        for size in SIZES:
+            data = (block * (size // len(block) + 1))[:size]
+            runs = 0
+            t = time.perf_counter()
+            while time.perf_counter() - t < 0.2:
+                sniff_encoding(data)
+                runs += 1
+            print('{:<9} {:>10}  {:10.3f}'.format(NAMES[encoding_id], size, (time.perf_counter() - t) / runs * 1000))
+
+
+if __name__ == '__main__':
+    accuracy()
+    latency()
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+from ctypes import create_unicode_buffer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.dirty import DirtyTracker, block_hashes
+from textlib.piecetable import PieceTable
+
+SIZES = (0x100000, 0x1000000, 0x4000000)  # chars
+KEYSTROKES = 200
+LINE = 'The quick brown fox jumps over the lazy dog\r\n'
+
+
+########################################
+# The former check: copy the whole text (WM_GETTEXT) and compare it with the saved copy
+########################################
+def is_dirty_old(doc, saved_text):
+    if len(doc) != len(saved_text):
+        return True
+    text_buf = create_unicode_buffer(str(doc), len(doc) + 1)
+    return text_buf.value != saved_text
+
+
+########################################
+# Types a char and deletes it again in the middle of the text (so every second check has
+# to compare the text), prints the mean time per keystroke of both checks
+########################################
+def main():
+    print('{:>5}  {:>16}  {:>16}'.format('M', 'DirtyTracker ms', 'full compare ms'))
+    for size in SIZES:
+        text = (LINE * (size // len(LINE) + 1))[:size]
+        doc = PieceTable(text)
+        tracker = DirtyTracker(len(text), block_hashes(text))
+        pos = size // 2
+        t = time.perf_counter()
+        for i in range(KEYSTROKES):
+            if i % 2:
+                doc.delete(pos, pos + 1)
+                tracker.edited(pos, pos + 1, pos)
+            else:
+                doc.insert(pos, 'x')
+                tracker.edited(pos, pos, pos + 1)
+            assert tracker.is_dirty(len(doc), doc.substring) == (i % 2 == 0)
+        new = (time.perf_counter() - t) / KEYSTROKES * 1000
+        saved_text = text
+        t = time.perf_counter()
+        for i in range(KEYSTROKES):
+            if i % 2:
+                doc.delete(pos, pos + 1)
+            else:
+                doc.insert(pos, 'x')
+            assert is_dirty_old(doc, saved_text) == (i % 2 == 0)
+        old = (time.perf_counter() - t) / KEYSTROKES * 1000
+        print('{:>5}  {:16.3f}  {:16.3f}'.format(size >> 20, new, old))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.indent import detect_indentation, iter_indent_deltas
+from textlib.piecetable import PieceTable
+from textlib.undo import apply_deltas
+
+SIZE = 0x6400000  # 100 M chars
+TAB_SIZE = 4
+SOURCE = '''class Example(object):
+
+\tdef method(self, value):
+\t\tif value:
+\t\t\t# comment\twith a tab
+\t\t\treturn value * 2
+\t\treturn None
+'''.replace('\n', '\r\n')
+
+
+########################################
+# The former conversion: split into lines, rewrite them in a loop and join them again
+########################################
+def convert_lines(text, tab_size, use_spaces):
+    lines = text.split('\r\n')
+    if use_spaces:
+        tab_new = ' ' * tab_size
+        for i, line in enumerate(lines):
+            num_tabs = len(line) - len(line.lstrip('\t'))
+            if num_tabs:
+                lines[i] = tab_new * num_tabs + lines[i][num_tabs:]
+    else:
+        for i, line in enumerate(lines):
+            num_tabs = (len(line) - len(line.lstrip(' '))) // tab_size
+            if num_tabs:
+                lines[i] = '\t' * num_tabs + lines[i][num_tabs * tab_size:]
+    return '\r\n'.join(lines)
+
+
+########################################
+#
+########################################
+def measure(func, *args):
+    t = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - t
+    # measured separately, tracemalloc slows down the conversion itself
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 0x100000
+
+
+########################################
+# Prints time and peak memory of computing the deltas from the document's piece table (which is
+# all the Edit control needs) and of the former line loop for both directions, and the time of
+# the detection
+########################################
+def main():
+    text = (SOURCE * (SIZE // len(SOURCE) + 1))[:SIZE]
+    print('{:<16}  {:>20}  {:>20}  {:>9}'.format('100 M chars', 'deltas', 'line loop', 'deltas'))
+    for use_spaces in (True, False):
+        doc = PieceTable(text)
+        deltas, seconds, peak = measure(lambda: list(iter_indent_deltas(doc, TAB_SIZE, use_spaces)))
+        converted, old_seconds, old_peak = measure(convert_lines, text, TAB_SIZE, use_spaces)
+        assert apply_deltas(text, deltas) == converted
+        print('{:<16}  {:7.3f} s {:7.1f} MB  {:7.3f} s {:7.1f} MB  {:>9}'.format(
+                'tabs -> spaces' if use_spaces else 'spaces -> tabs', seconds, peak, old_seconds, old_peak, len(deltas)))
+        text = converted
+    t = time.perf_counter()
+    result = detect_indentation(text)
+    print('detect_indentation: {} in {:.3f} ms'.format(result, (time.perf_counter() - t) * 1000))
+
+
+if __name__ == '__main__':
+    main()
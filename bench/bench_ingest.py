@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.ingest import read_text_file
+
+SIZES = (0x100000, 0x1000000, 0x4000000)  # bytes
+SAMPLES = {
+    'ascii LF': ('The quick brown fox jumps over the lazy dog\n', 'utf-8'),
+    'latin CRLF': ('Größenänderung der Fenster überprüfen\r\n', 'utf-8'),
+    'utf-16 LF': ('The quick brown fox jumps over the lazy dog\n', 'utf-16-le'),
+}
+
+
+########################################
+# The former _load_file path: each step makes a full copy (the last one stands for the
+# unicode buffer passed to the Edit control). The byte loop UTF-8 check is left out, so
+# this is faster than it was.
+########################################
+def read_text_file_old(filename, encoding):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    text = data.decode(encoding)
+    # (it replaced EOLs before decoding, which broke UTF-16)
+    if '\r\n' not in text and '\n' in text:
+        text = text.replace('\n', '\r\n')
+    return text[:]
+
+
+########################################
+#
+########################################
+def measure(func, *args):
+    t = time.perf_counter()
+    func(*args)
+    seconds = time.perf_counter() - t
+    # measured separately, tracemalloc slows down the reading itself
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 0x100000
+
+
+########################################
+# Prints time and peak memory of read_text_file() and the former path for each sample
+########################################
+def main():
+    print('{:<11} {:>5}  {:>20}  {:>20}'.format('file', 'MB', 'read_text_file', 'former path'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'bench.txt')
+        for name, (line, encoding) in SAMPLES.items():
+            for size in SIZES:
+                data = line.encode(encoding)
+                with open(filename, 'wb') as f:
+                    f.write(data * (size // len(data)))
+                text, eol_mode_id, encoding_id = read_text_file(filename)
+                assert text == read_text_file_old(filename, encoding)
+                new = measure(read_text_file, filename)
+                old = measure(read_text_file_old, filename, encoding)
+                print('{:<11} {:>5}  {:7.3f} s {:7.1f} MB  {:7.3f} s {:7.1f} MB'.format(
+                        name, size >> 20, *new, *old))
+
+
+if __name__ == '__main__':
+    main()
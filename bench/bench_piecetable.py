@@ -0,0 +1,89 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.piecetable import PieceTable
+
+SIZES = (0x100000, 0x1000000, 0x4000000)  # chars
+EDITS = 300
+LINE = 'The quick brown fox jumps over the lazy dog\r\n'
+
+
+########################################
+# Edit positions: typing on one line with a jump every 50 edits, or random positions all over
+# the text (the worst case for the line index, which has to shift the lines in between)
+########################################
+def local_positions(rnd, n):
+    pos = rnd.randrange(n)
+    for i in range(EDITS):
+        if i % 50 == 49:
+            pos = rnd.randrange(n)
+        yield pos + i % 50
+
+
+def random_positions(rnd, n):
+    for _ in range(EDITS):
+        yield rnd.randrange(n)
+
+
+########################################
+# Edits at the specified positions, each followed by the queries features make (length, a
+# substring, the text of the edited line), returns the time per edit in ms
+########################################
+def run(doc, edit, substring, line_text, positions):
+    t = time.perf_counter()
+    for i, pos in enumerate(positions):
+        doc = edit(doc, pos, min(len(doc), pos + i % 2), 'x')
+        substring(doc, pos, pos + 100)
+        line_text(doc, pos // len(LINE))
+    return (time.perf_counter() - t) / EDITS * 1000, doc
+
+
+########################################
+# The former way: every query copies the whole text out of the Edit control (WM_GETTEXT),
+# here a str that is rebuilt on each edit
+########################################
+def str_edit(text, start, end, new):
+    return text[:start] + new + text[end:]
+
+
+def str_substring(text, start, end):
+    return text[:][start:end]
+
+
+def str_line_text(text, line):
+    return text[:].split('\r\n', line + 1)[line]
+
+
+########################################
+#
+########################################
+def table_edit(doc, start, end, new):
+    doc.replace(start, end, new)
+    return doc
+
+
+def table_line_text(doc, line):
+    return doc.line_text(line)
+
+
+########################################
+# Prints the time per edit (with queries) of the piece table and of str copies
+########################################
+def main():
+    print('{:>5}  {:<6}  {:>14}  {:>14}'.format('M', 'edits', 'PieceTable ms', 'str copy ms'))
+    for size in SIZES:
+        text = (LINE * (size // len(LINE) + 1))[:size]
+        for name, positions in (('local', local_positions), ('random', random_positions)):
+            new, doc = run(PieceTable(text), table_edit, PieceTable.substring, table_line_text,
+                    positions(random.Random(size), size))
+            old, ref = run(text, str_edit, str_substring, str_line_text, positions(random.Random(size), size))
+            assert str(doc) == ref
+            print('{:>5}  {:<6}  {:14.3f}  {:14.3f}'.format(size >> 20, name, new, old))
+
+
+if __name__ == '__main__':
+    main()
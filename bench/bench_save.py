@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resources.const import *
+from textlib.encoding import ENCODINGS
+from textlib.save import write_text_file
+
+SIZES = (0x100000, 0x1000000, 0x4000000)  # chars
+LINE = 'The quick brown fox jumps over the lazy dog \t\r\n'
+EOL_NAMES = {IDM_EOL_CRLF: 'CRLF', IDM_EOL_LF: 'LF', IDM_EOL_CR: 'CR'}
+
+
+########################################
+# Saves texts of SIZES chars with each EOL mode and encoding, prints the time and the peak
+# memory used on top of the text (which should stay at about a few chunks)
+########################################
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'bench.txt')
+        for size in SIZES:
+            text = (LINE * (size // len(LINE) + 1))[:size]
+            for eol_mode_id, encoding_id, options in (
+                    (IDM_EOL_CRLF, IDM_UTF_8, {}),
+                    (IDM_EOL_LF, IDM_UTF_8_BOM, {}),
+                    (IDM_EOL_LF, IDM_UTF_16_LE, {}),
+                    (IDM_EOL_LF, IDM_UTF_8, {'trim_whitespace': True, 'final_newline': True})):
+                t = time.perf_counter()
+                write_text_file(filename, text, eol_mode_id, encoding_id, **options)
+                seconds = time.perf_counter() - t
+                # measured separately, tracemalloc slows down the save itself
+                tracemalloc.start()
+                write_text_file(filename, text, eol_mode_id, encoding_id, **options)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('{:>4} M chars  {:<4}  {:<9}  {:<30}  {:7.3f} s  peak {:6.1f} MB'.format(
+                        size >> 20, EOL_NAMES[eol_mode_id], ENCODINGS[encoding_id], ' '.join(options),
+                        seconds, peak / 0x100000))
+
+
+if __name__ == '__main__':
+    main()
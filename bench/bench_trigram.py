@@ -0,0 +1,100 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.findfiles import FindInFiles
+from textlib.trigram import IndexedFindInFiles, TrigramIndex
+
+FILE_COUNT = 50000
+FILES_PER_FOLDER = 500
+CHANGED_FILES = 100
+QUERIES = (('meeting notes', False), ('Kubernetes', False), ('invoice #4711', False), (r'TODO\(\w+\):', True),
+        ('not in any file', False))
+# phrases found by the queries, with the probability of each line to be one
+PHRASES = (('meeting notes', 0.003), ('Kubernetes', 0.0003), ('invoice #4711', 0.00003), ('TODO(anna): call back', 0.0003))
+VOCABULARY = 20000
+SYLLABLES = ('ka ri to na me lo su de ar en ter in ro la ve mi sa po ne ti ko an or es al'.split())
+
+
+########################################
+# Generates FILE_COUNT notes of 1-8 KB of words made of syllables (with a Zipf-like
+# distribution, so some words are in most files and most words in few of them), plus the
+# phrases to search for
+########################################
+def generate(folder, rnd):
+    words = [''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randrange(1, 5))) for _ in range(VOCABULARY)]
+    cum_weights = list(accumulate(1 / (i + 1) for i in range(VOCABULARY)))
+    for i in range(FILE_COUNT):
+        sub = os.path.join(folder, 'f{:03}'.format(i // FILES_PER_FOLDER))
+        if i % FILES_PER_FOLDER == 0:
+            os.makedirs(sub)
+        line_count = rnd.randrange(20, 160)
+        text = rnd.choices(words, cum_weights=cum_weights, k=8 * line_count)
+        lines = [' '.join(text[k:k + 8]) for k in range(0, len(text), 8)]
+        for phrase, p in PHRASES:
+            for _ in range(int(rnd.random() < p * line_count)):
+                lines.insert(rnd.randrange(len(lines)), phrase)
+        with open(os.path.join(sub, 'note{}.txt'.format(i)), 'w', newline='\r\n') as f:
+            f.write('\n'.join(lines))
+
+
+########################################
+#
+########################################
+def run(search):
+    hits = []
+    t = time.perf_counter()
+    search.start(lambda results: hits.extend(results or ()))
+    search.join()
+    return time.perf_counter() - t, len(hits)
+
+
+########################################
+# Prints the time of the first indexed search (which builds the index), of searches with an
+# up-to-date index, after changing CHANGED_FILES files, and of the same searches without index
+########################################
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        folder = os.path.join(tmp_dir, 'notes')
+        index_file = os.path.join(tmp_dir, 'index', 'notes.sqlite3')
+        t = time.perf_counter()
+        generate(folder, random.Random(50))
+        print('generated {} files in {:.1f} s'.format(FILE_COUNT, time.perf_counter() - t))
+
+        seconds, hits = run(IndexedFindInFiles(folder, *QUERIES[0], index_file=index_file))
+        size = os.path.getsize(index_file) / 0x100000
+        print('index build + first search: {:.2f} s, index {:.1f} MB'.format(seconds, size))
+
+        rnd = random.Random(1)
+        for i in rnd.sample(range(FILE_COUNT), CHANGED_FILES):
+            with open(os.path.join(folder, 'f{:03}'.format(i // FILES_PER_FOLDER), 'note{}.txt'.format(i)), 'a') as f:
+                f.write('\nchanged')
+        search = IndexedFindInFiles(folder, *QUERIES[0], index_file=index_file)
+        seconds, hits = run(search)
+        print('search after changing {} files: {:.2f} s ({} reindexed)'.format(CHANGED_FILES, seconds, search.files_indexed))
+
+        print('\n{:<24} {:>6}  {:>10}  {:>10}  {:>12}'.format('query', 'hits', 'index s', 'no index s', 'candidates'))
+        for term, regex in QUERIES:
+            search = IndexedFindInFiles(folder, term, regex, index_file=index_file)
+            seconds, hits = run(search)
+            with TrigramIndex(index_file) as index:
+                t = time.perf_counter()
+                candidates = index.candidates(term, regex)
+                lookup = time.perf_counter() - t
+            plain, plain_hits = run(FindInFiles(folder, term, regex))
+            assert hits == plain_hits
+            print('{:<24} {:>6}  {:10.3f}  {:10.3f}  {:>6} {:4.0f}ms'.format(term, hits, seconds, plain,
+                    len(candidates) if candidates is not None else 'all', lookup * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
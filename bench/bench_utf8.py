@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textlib.encoding import is_utf8
+
+SIZES = (0x400, 0x10000, 0x100000, 0xA00000, 0x6400000)  # 1 KB - 100 MB
+LOOP_MAX_SIZE = 0xA00000  # the byte loop takes minutes beyond this
+SAMPLES = {
+    'ascii': 'The quick brown fox jumps over the lazy dog\r\n',
+    'latin': 'Größenänderung der Fenster überprüfen\r\n',
+    'cjk': '文字コードの判定は難しい問題です\r\n',
+}
+
+
+########################################
+# The byte loop App._is_utf8 used before, for comparison (with the truncation check fixed)
+########################################
+def is_utf8_loop(data):
+    data_len = len(data)
+    i = -1
+    while True:
+        i += 1
+        if i >= data_len:
+            break
+        o = data[i]
+        if o < 128:
+            continue
+        elif o & 224 == 192 and o > 193:
+            n = 1
+        elif o & 240 == 224:
+            n = 2
+        elif o & 248 == 240 and o < 245:
+            n = 3
+        else:
+            return False
+        for c in range(n):
+            i += 1
+            if i >= data_len:
+                return False
+            if data[i] & 192 != 128:
+                return False
+    return True
+
+
+########################################
+#
+########################################
+def throughput(func, data):
+    runs = 0
+    t = time.perf_counter()
+    while True:
+        result = func(data)
+        runs += 1
+        seconds = time.perf_counter() - t
+        if seconds > 0.2:
+            return result, len(data) * runs / seconds / 0x100000
+
+
+########################################
+# Prints the throughput in MB/s of is_utf8() and the byte loop for each sample text and size
+########################################
+def main():
+    print('{:<6} {:>10}  {:>14}  {:>14}'.format('text', 'size', 'is_utf8 MB/s', 'loop MB/s'))
+    for name, sample in SAMPLES.items():
+        line = sample.encode()
+        for size in SIZES:
+            data = (line * (size // len(line) + 1))[:size]
+            # cut at a char boundary, so all data is valid
+            while data and not is_utf8(data):
+                data = data[:-1]
+            result, mbs = throughput(is_utf8, data)
+            assert result
+            loop_mbs = ''
+            if size <= LOOP_MAX_SIZE:
+                result, loop_mbs = throughput(is_utf8_loop, data)
+                assert result
+                loop_mbs = '{:14.1f}'.format(loop_mbs)
+            print('{:<6} {:>10}  {:14.1f}  {:>14}'.format(name, size, mbs, loop_mbs))
+
+
+if __name__ == '__main__':
+    main()
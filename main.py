@@ -1,7 +1,11 @@
+import collections
 import contextlib
+import multiprocessing
 import os
 import re
 import sys
+import tempfile
+import threading
 import time
 
 from winapp.mainwin import *
@@ -10,6 +14,8 @@ from winapp.dlls import *
 from winapp.controls.edit import *
 from winapp.controls.statusbar import *
 
+from ctypes import string_at
+
 from platform import win32_ver
 WIN_VERSION = win32_ver()[0]
 DARK_SUPPORTED = float(WIN_VERSION) >= 10
@@ -18,6 +24,19 @@ import locale
 locale.setlocale(locale.LC_TIME, '')  # use system locale for formatting date/time
 
 from resources.const import *
+from textlib.column import ColumnCache, text_column
+from textlib.dirty import DirtyTracker, block_hashes
+from textlib.encoding import ENCODINGS, detect_encoding
+from textlib.findfiles import FindInFiles, ReplaceInFiles, REPLACE_SKIPPED, split_globs
+from textlib.indent import detect_indentation, indent_block, iter_indent_deltas, unindent_block
+from textlib.ingest import EOL_MODES, detect_eol, read_text_file, to_utf16_units
+from textlib.pager import MappedFile
+from textlib.pagination import Pagination
+from textlib.piecetable import PieceTable
+from textlib.save import write_text_file
+from textlib.search import IncrementalSearch, MatchCounter, SearchSnapshot, expand_match, search_backward, search_forward, search_pattern
+from textlib.trigram import IndexedFindInFiles, index_filename
+from textlib.undo import UndoHistory, delta_ranges, shift_offset
 
 APP_NAME = 'PyNotepad'
 APP_VERSION = 2
@@ -34,27 +53,57 @@ with open(os.path.join(APP_DIR, 'resources', LANG, 'strings.pson'), 'rb') as f:
 def tr(s):
     return __[s] if s in __ else s
 
-ENCODINGS = {
-    IDM_ANSI:       'ansi',
-    IDM_UTF_16_LE:  'utf-16-le',
-    IDM_UTF_16_BE:  'utf-16-be',
-    IDM_UTF_8:      'utf-8',
-    IDM_UTF_8_BOM:  'utf-8-sig',
-}
-
-EOL_MODES = {
-    IDM_EOL_CRLF:   '\r\n',
-    IDM_EOL_LF:     '\n',
-    IDM_EOL_CR:     '\r',
-}
-
 TAB_SIZES = {
     IDM_TAB_SIZE_2: 2,
     IDM_TAB_SIZE_4: 4,
     IDM_TAB_SIZE_8: 8,
 }
 
-EDIT_MAX_TEXT_LEN = 0x80000  # 512 KB (Edit control's default: 30.000)
+PREVIEW_BG_COLOR = 0x808080
+PREVIEW_MARGIN = 8  # pixels around the page in the print preview
+
+EDIT_MAX_TEXT_LEN = 0x4000000  # 64 M chars (Edit control's default: 30.000)
+
+# bigger files are opened in read-only viewer mode, which only loads VIEW_PAGES pages at once
+VIEW_PAGES = 3
+VIEW_DISABLED_ITEMS = (IDM_SAVE, IDM_SAVE_AS, IDM_PASTE, IDM_REPLACE, IDM_TIME_DATE)
+VIEW_SCROLL_TIMER_ID = 1
+
+# UI updates after edits/caret moves are coalesced into a single refresh per frame
+REFRESH_TIMER_ID = 2
+REFRESH_DELAY = 16  # ms
+REFRESH_TEXT = 1
+REFRESH_CARET = 2
+REFRESH_SELECTION = 4
+
+# matches of the search term are counted in slices of COUNT_SLICE seconds
+COUNT_TIMER_ID = 3
+COUNT_INTERVAL = 10  # ms
+COUNT_SLICE = 0.01
+
+# find as you type runs once all pending keystrokes are processed, so outdated terms are skipped
+INCREMENTAL_TIMER_ID = 4
+INCREMENTAL_DELAY = 0  # ms (i.e. USER_TIMER_MINIMUM)
+
+# progress of Find in Files is shown every FIND_FILES_INTERVAL ms
+FIND_FILES_TIMER_ID = 5
+FIND_FILES_INTERVAL = 100
+
+# with "Use index", Find in Files keeps a trigram index per folder in here
+FIND_FILES_INDEX_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or tempfile.gettempdir(), APP_NAME, 'index')
+
+# groups of deltas (undo/redo, Replace All) are applied range by range, ranges at most
+# DELTAS_MERGE_GAP chars apart are merged, or more if needed to replace at most about
+# DELTAS_APPLY_MAX ranges (each replacement moves the rest of the text in the Edit control)
+DELTAS_APPLY_MAX = 0x1000
+DELTAS_MERGE_GAP = 0x1000
+
+# posted by the save thread
+WM_SAVE_PROGRESS = WM_APP + 1
+WM_SAVE_DONE = WM_APP + 2
+
+# posted by the Find in Files thread
+WM_FIND_FILES_RESULTS = WM_APP + 3
 
 STATUSBAR_PART_CARET = 1
 STATUSBAR_PART_ZOOM = 2
@@ -87,21 +136,63 @@ class App(MainWin):
         self._match_case = FALSE
         self._wrap_arround = FALSE
         self._search_up = FALSE
-        self._tab_size = 4
+        self._regex = FALSE
+        self._match = None  # last regex match, for replacements with backreferences
+        self._snapshot = None  # (doc, SearchSnapshot) of the current document version
+        self._counter = None  # MatchCounter of the last counted search term
+        self._incremental = None  # IncrementalSearch of the Find dialog
+        self._incremental_args = None  # pending (term, match_case, regex, search_up, wrap_around)
+        self._find_status = ''
+        self._tab_size = 4  # of the current document, maybe detected when it was loaded
         self._use_spaces = False
+        self._default_tab_size = 4  # chosen in the menu, saved in the registry
+        self._default_use_spaces = False
+        self._trim_whitespace = False  # save options
+        self._final_newline = False
         self._zoom = 100
         self._filename = None
         self._is_dirty = False
-        self._saved_text_len = 1
-        self._saved_text = ''
+        self._doc = PieceTable()  # mirrors the text of the Edit control
+        self._dirty = DirtyTracker()
+        self._edit_state = None
+        self._columns = ColumnCache()
+        self._undo = UndoHistory()
+        self._record_undo = True
         self._eol_mode_id = IDM_EOL_CRLF
         self._encoding_id = IDM_UTF_8
         self._print_paper_size = [21000, 29700]  # in mm/100
         self._print_margins = [1000, 1500, 1000, 1500]  # in mm/100
+        self._pagination = None  # Pagination of the last print (preview), reused until anything changes
+        self._preview = None  # [hdc, page_size, rc, pagination, page] while the print preview is shown
 
         self._last_sel = [0, 0]
         self._current_sel = [0, 0]
 
+        self._refresh_flags = 0
+        self._menu_enabled = {}
+        self._caption = None
+        self._caret_text = None
+
+        self._view = None
+        self._view_first_page = 0
+        self._view_page_starts = []
+
+        self._save_thread = None
+        self._save_job = None  # (job_id, filename, tracker) of the save that isn't finished yet
+        self._save_job_id = 0
+        self._save_error = None
+
+        self._find_files = None  # FindInFiles or ReplaceInFiles job
+        self._find_files_folder = ''
+        self._find_files_include = '*'
+        self._find_files_exclude = '.git; .hg; .svn; node_modules'
+        self._find_files_results = collections.deque()  # (job, results) passed from its thread
+        self._find_files_hits = []  # (filename, offset, length, line) of each item in the results list
+        self._find_files_matched = 0  # number of files with hits
+        self._find_files_count = 0  # number of hits (or replaced occurrences)
+        self._find_files_dry_run = True
+        self._find_files_use_index = False
+
         left, top, width, height = self._load_state()
 
         # load menu resource
@@ -114,10 +205,14 @@ class App(MainWin):
             IDM_OPEN:               self.action_open,
             IDM_SAVE:               self.action_save,
             IDM_SAVE_AS:            self.action_save_as,
+            IDM_TRIM_WHITESPACE:    self.action_toggle_trim_whitespace,
+            IDM_FINAL_NEWLINE:      self.action_toggle_final_newline,
             IDM_PAGE_SETUP:         self.action_page_setup,
+            IDM_PRINT_PREVIEW:      self.action_print_preview,
             IDM_PRINT:              self.action_print,
             IDM_EXIT:               self.quit,
             IDM_UNDO:               self.action_undo,
+            IDM_REDO:               self.action_redo,
             IDM_CUT:                self.action_cut,
             IDM_COPY:               self.action_copy,
             IDM_PASTE:              self.action_paste,
@@ -125,6 +220,8 @@ class App(MainWin):
             IDM_FIND_NEXT:          self.action_find_next,
             IDM_FIND_PREVIOUS:      self.action_find_previous,
             IDM_REPLACE:            self.action_replace,
+            IDM_FIND_IN_FILES:      self.action_find_in_files,
+            IDM_REPLACE_IN_FILES:   self.action_replace_in_files,
             IDM_GO_TO:              self.action_go_to,
             IDM_SELECT_ALL:         self.action_select_all,
             IDM_TIME_DATE:          self.action_insert_time_date,
@@ -170,6 +267,10 @@ class App(MainWin):
             user32.CheckMenuItem(self.hmenu, IDM_TABS_AS_SPACES, MF_BYCOMMAND | MF_CHECKED)
         tab_size_id= list(TAB_SIZES.keys())[list(TAB_SIZES.values()).index(self._tab_size)]
         user32.CheckMenuItem(self.hmenu, tab_size_id, MF_BYCOMMAND | MF_CHECKED)
+        if self._trim_whitespace:
+            user32.CheckMenuItem(self.hmenu, IDM_TRIM_WHITESPACE, MF_BYCOMMAND | MF_CHECKED)
+        if self._final_newline:
+            user32.CheckMenuItem(self.hmenu, IDM_FINAL_NEWLINE, MF_BYCOMMAND | MF_CHECKED)
 
         self._create_statusbar()
         self._create_dialogs()
@@ -194,11 +295,12 @@ class App(MainWin):
                 command_id = LOWORD(wparam)
                 if command_id in self.COMMAND_MESSAGE_MAP:
                     self.COMMAND_MESSAGE_MAP[command_id]()
-            elif lparam == self.edit.hwnd and command == EN_CHANGE:
-                is_dirty = self._check_if_text_changed()
-                if is_dirty != self._is_dirty:
-                    self._is_dirty = is_dirty
-                    self.set_window_text(self._get_caption())
+            elif lparam == self.edit.hwnd and command == EN_VSCROLL and self._view:
+                # EN_VSCROLL is sent before the control scrolls, so check afterwards
+                self.create_timer(self._view_check_scroll, 10, True, VIEW_SCROLL_TIMER_ID)
+            elif lparam == self.edit.hwnd and command == EN_CHANGE and not self._view:
+                self._track_change()
+                self._schedule_refresh(REFRESH_TEXT)
             return FALSE
         self.register_message_callback(WM_COMMAND, _on_WM_COMMAND)
 
@@ -211,6 +313,30 @@ class App(MainWin):
                 self._load_file(dropped_items[0])
         self.register_message_callback(WM_DROPFILES, _on_WM_DROPFILES)
 
+        ########################################
+        #
+        ########################################
+        def _on_WM_SAVE_PROGRESS(hwnd, wparam, lparam):
+            if self._save_thread and self._save_job[0] == wparam:
+                self.statusbar.set_text(tr('SAVING_PROGRESS').format(lparam))
+        self.register_message_callback(WM_SAVE_PROGRESS, _on_WM_SAVE_PROGRESS)
+
+        ########################################
+        # wparam is the id of the save job, messages of a job that was already finished (e.g. by
+        # starting the next save before the message arrived) are ignored
+        ########################################
+        def _on_WM_SAVE_DONE(hwnd, wparam, lparam):
+            if self._save_job and self._save_job[0] == wparam:
+                self._finish_save()
+        self.register_message_callback(WM_SAVE_DONE, _on_WM_SAVE_DONE)
+
+        ########################################
+        #
+        ########################################
+        def _on_WM_FIND_FILES_RESULTS(hwnd, wparam, lparam):
+            self._add_find_files_results()
+        self.register_message_callback(WM_FIND_FILES_RESULTS, _on_WM_FIND_FILES_RESULTS)
+
         if DARK_SUPPORTED:
             def _on_WM_SETTINGCHANGE(hwnd, wparam, lparam):
                 if lparam and cast(lparam, LPCWSTR).value == 'ImmersiveColorSet':
@@ -237,6 +363,7 @@ class App(MainWin):
         if not self._handle_dirty():
             user32.SetFocus(self.edit.hwnd)
             return 1
+        self._cancel_find_in_files()
         self._save_state()
         super().quit()
 
@@ -247,6 +374,36 @@ class App(MainWin):
         with open(os.path.join(APP_DIR, 'resources', LANG, 'dialog_find.pson'), 'rb') as f:
             dialog_dict = eval(f.read())
 
+        ########################################
+        # Returns the text of a dialog's edit control (by default the search term)
+        ########################################
+        def _get_item_text(hwnd, control_id=ID_EDIT_FIND):
+            hwnd_edit = user32.GetDlgItem(hwnd, control_id)
+            text_len = user32.SendMessageW(hwnd_edit, WM_GETTEXTLENGTH, 0, 0) + 1
+            text_buf = create_unicode_buffer(text_len)
+            user32.SendMessageW(hwnd_edit, WM_GETTEXT, text_len, text_buf)
+            return text_buf.value
+
+        ########################################
+        # Counts matches of the term in the Find dialog with its current options
+        ########################################
+        def _count_dialog_matches(hwnd):
+            self._count_matches(_get_item_text(hwnd),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_GETCHECK, 0, 0),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_GETCHECK, 0, 0))
+
+        ########################################
+        # Schedules selecting the match of the term in the Find dialog. Only the latest term
+        # is searched, once all keystrokes in the queue are processed.
+        ########################################
+        def _find_as_you_type(hwnd):
+            self._incremental_args = (_get_item_text(hwnd),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_GETCHECK, 0, 0),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_GETCHECK, 0, 0),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_UP), BM_GETCHECK, 0, 0),
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_WRAP_AROUND), BM_GETCHECK, 0, 0))
+            self.create_timer(self._find_incremental, INCREMENTAL_DELAY, True, INCREMENTAL_TIMER_ID)
+
         def _dialog_proc_find(hwnd, msg, wparam, lparam):
 
             if msg == WM_INITDIALOG:
@@ -254,15 +411,12 @@ class App(MainWin):
 
                 # limit search input to 127 chars
                 user32.SendMessageW(hwnd_edit, EM_SETLIMITTEXT, 127, 0)
+                self._incremental = None
 
                 # check if something is selected
-                pos_start, pos_end = DWORD(), DWORD()
-                self.edit.send_message(EM_GETSEL, byref(pos_start), byref(pos_end))
-                if pos_end.value > pos_start.value:
-                    text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-                    text_buf = create_unicode_buffer(text_len)
-                    self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-                    self._search_term = text_buf.value[pos_start.value:pos_end.value][:127]
+                pos_start, pos_end = self._get_sel()
+                if pos_end > pos_start:
+                    self._search_term = self._get_text(pos_start, min(pos_end, pos_start + 127))
                 elif self._search_term == '':
                     self._search_term = self._saved_search_term
 
@@ -279,6 +433,12 @@ class App(MainWin):
                     user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_SETCHECK, BST_CHECKED, 0)
                 if self._wrap_arround:
                     user32.SendMessageW(user32.GetDlgItem(hwnd, ID_WRAP_AROUND), BM_SETCHECK, BST_CHECKED, 0)
+                if self._regex:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_SETCHECK, BST_CHECKED, 0)
+
+                # only typing searches, not the initial term
+                self.kill_timer(INCREMENTAL_TIMER_ID)
+                self._incremental_args = None
 
             elif msg == WM_COMMAND:
                 control_id = LOWORD(wparam)
@@ -288,11 +448,18 @@ class App(MainWin):
                     if command == EN_UPDATE:
                         text_len = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_EDIT_FIND), WM_GETTEXTLENGTH, 0, 0)
                         user32.EnableWindow(user32.GetDlgItem(hwnd, ID_OK), int(text_len > 0))
+                        _count_dialog_matches(hwnd)
+                        _find_as_you_type(hwnd)
 
                 elif command == BN_CLICKED:
-                    if control_id == ID_OK:
+                    if control_id in (ID_MATCH_CASE, ID_REGEX):
+                        _count_dialog_matches(hwnd)
+                        _find_as_you_type(hwnd)
+
+                    elif control_id == ID_OK:
                         self._match_case = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_GETCHECK, 0, 0)
                         self._wrap_arround = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_WRAP_AROUND), BM_GETCHECK, 0, 0)
+                        self._regex = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_GETCHECK, 0, 0)
                         self._search_up = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_UP), BM_GETCHECK, 0, 0)
                         hwnd_edit = user32.GetDlgItem(hwnd, ID_EDIT_FIND)
                         text_len = user32.SendMessageW(hwnd_edit, WM_GETTEXTLENGTH, 0, 0) + 1
@@ -300,6 +467,8 @@ class App(MainWin):
                         user32.SendMessageW(hwnd_edit, WM_GETTEXT, text_len, text_buf)
                         self._search_term = text_buf.value
                         self._find()
+                        # typing on starts at the found match
+                        self._incremental = None
 
                     elif control_id == ID_CANCEL:
                         user32.PostMessageW(hwnd, WM_CLOSE, 0, 0)
@@ -324,13 +493,9 @@ class App(MainWin):
                 user32.SendMessageW(hwnd_replace_edit, EM_SETLIMITTEXT, 127, 0)
 
                 # check if something is selected
-                pos_start, pos_end = DWORD(), DWORD()
-                self.edit.send_message(EM_GETSEL, byref(pos_start), byref(pos_end))
-                if pos_end.value > pos_start.value:
-                    text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-                    text_buf = create_unicode_buffer(text_len)
-                    self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-                    self._search_term = text_buf.value[pos_start.value:pos_end.value][:127]
+                pos_start, pos_end = self._get_sel()
+                if pos_end > pos_start:
+                    self._search_term = self._get_text(pos_start, min(pos_end, pos_start + 127))
                 # update button states
                 if self._search_term:
                     user32.SendMessageW(hwnd_search_edit, WM_SETTEXT, 0, create_unicode_buffer(self._search_term))
@@ -344,6 +509,8 @@ class App(MainWin):
                     user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_SETCHECK, BST_CHECKED, 0)
                 if self._wrap_arround:
                     user32.SendMessageW(user32.GetDlgItem(hwnd, ID_WRAP_AROUND), BM_SETCHECK, BST_CHECKED, 0)
+                if self._regex:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_SETCHECK, BST_CHECKED, 0)
 
             elif msg == WM_COMMAND:
                 control_id = LOWORD(wparam)
@@ -360,6 +527,7 @@ class App(MainWin):
                     if control_id in (ID_OK, ID_REPLACE, ID_REPLACE_ALL):
                         self._match_case = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_GETCHECK, 0, 0)
                         self._wrap_arround = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_WRAP_AROUND), BM_GETCHECK, 0, 0)
+                        self._regex = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_GETCHECK, 0, 0)
 
                         hwnd_search_edit = user32.GetDlgItem(hwnd, ID_EDIT_FIND)
                         text_len = user32.SendMessageW(hwnd_search_edit, WM_GETTEXTLENGTH, 0, 0) + 1
@@ -396,7 +564,7 @@ class App(MainWin):
         def _dialog_proc_goto(hwnd, msg, wparam, lparam):
             if msg == WM_INITDIALOG:
                 hwnd_edit = user32.GetDlgItem(hwnd, ID_EDIT_GOTO)
-                line_idx = self.edit.send_message(EM_LINEFROMCHAR, -1, 0)
+                line_idx = self._line_from_char(self._get_sel()[0])
                 user32.SendMessageW(hwnd_edit, WM_SETTEXT, 0,
                         create_unicode_buffer(str(line_idx + 1)))
                 user32.SendMessageW(hwnd_edit, EM_SETSEL, 0, -1)
@@ -421,6 +589,115 @@ class App(MainWin):
 
         self.dialog_goto = Dialog(self, dialog_dict, _dialog_proc_goto)
 
+        with open(os.path.join(APP_DIR, 'resources', LANG, 'dialog_print_preview.pson'), 'rb') as f:
+            dialog_dict = eval(f.read())
+
+        def _update_preview(hwnd):
+            page, page_count = self._preview[4], self._preview[3].page_count()
+            user32.SetWindowTextW(user32.GetDlgItem(hwnd, ID_PREVIEW_STATUS), tr('PREVIEW_PAGE').format(page, page_count))
+            user32.EnableWindow(user32.GetDlgItem(hwnd, ID_PREVIOUS_PAGE), page > 1)
+            user32.EnableWindow(user32.GetDlgItem(hwnd, ID_NEXT_PAGE), page < page_count)
+            user32.InvalidateRect(user32.GetDlgItem(hwnd, ID_PREVIEW), None, FALSE)
+
+        def _dialog_proc_print_preview(hwnd, msg, wparam, lparam):
+            if msg == WM_INITDIALOG:
+                _update_preview(hwnd)
+
+            elif msg == WM_DRAWITEM:
+                dis = cast(lparam, POINTER(DRAWITEMSTRUCT)).contents
+                if dis.CtlID == ID_PREVIEW:
+                    self._draw_preview(dis.hDC, dis.rcItem)
+                    return TRUE
+
+            elif msg == WM_COMMAND:
+                control_id = LOWORD(wparam)
+                command = HIWORD(wparam)
+                if command == BN_CLICKED:
+                    if control_id in (ID_PREVIOUS_PAGE, ID_NEXT_PAGE):
+                        self._preview[4] += 1 if control_id == ID_NEXT_PAGE else -1
+                        _update_preview(hwnd)
+                    elif control_id == ID_OK:
+                        user32.EndDialog(hwnd, 1)
+                    elif control_id == ID_CANCEL:
+                        user32.EndDialog(hwnd, 0)
+
+            return FALSE
+
+        self.dialog_print_preview = Dialog(self, dialog_dict, _dialog_proc_print_preview)
+
+        with open(os.path.join(APP_DIR, 'resources', LANG, 'dialog_find_files.pson'), 'rb') as f:
+            dialog_dict = eval(f.read())
+
+        def _dialog_proc_find_files(hwnd, msg, wparam, lparam):
+            if msg == WM_INITDIALOG:
+                # limit search and replace input to 127 chars
+                user32.SendMessageW(user32.GetDlgItem(hwnd, ID_EDIT_FIND), EM_SETLIMITTEXT, 127, 0)
+                user32.SendMessageW(user32.GetDlgItem(hwnd, ID_EDIT_REPLACE), EM_SETLIMITTEXT, 127, 0)
+
+                if not self._find_files_folder:
+                    self._find_files_folder = os.path.dirname(self._filename) if self._filename else os.getcwd()
+                for control_id, text in ((ID_EDIT_FIND, self._search_term), (ID_EDIT_REPLACE, self._replace_term),
+                        (ID_EDIT_FOLDER, self._find_files_folder), (ID_EDIT_INCLUDE, self._find_files_include),
+                        (ID_EDIT_EXCLUDE, self._find_files_exclude)):
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, control_id), WM_SETTEXT, 0, create_unicode_buffer(text))
+
+                # update button states
+                if not self._search_term:
+                    user32.EnableWindow(user32.GetDlgItem(hwnd, ID_OK), 0)
+                    user32.EnableWindow(user32.GetDlgItem(hwnd, ID_REPLACE_ALL), 0)
+                user32.EnableWindow(user32.GetDlgItem(hwnd, ID_STOP), 0)
+                if self._match_case:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_SETCHECK, BST_CHECKED, 0)
+                if self._regex:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_SETCHECK, BST_CHECKED, 0)
+                if self._find_files_dry_run:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_DRY_RUN), BM_SETCHECK, BST_CHECKED, 0)
+                if self._find_files_use_index:
+                    user32.SendMessageW(user32.GetDlgItem(hwnd, ID_USE_INDEX), BM_SETCHECK, BST_CHECKED, 0)
+
+            elif msg == WM_COMMAND:
+                control_id = LOWORD(wparam)
+                command = HIWORD(wparam)
+
+                if control_id == ID_EDIT_FIND:
+                    if command == EN_UPDATE:
+                        text_len = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_EDIT_FIND), WM_GETTEXTLENGTH, 0, 0)
+                        user32.EnableWindow(user32.GetDlgItem(hwnd, ID_OK), int(text_len > 0))
+                        user32.EnableWindow(user32.GetDlgItem(hwnd, ID_REPLACE_ALL), int(text_len > 0))
+
+                elif control_id == ID_RESULTS:
+                    if command == LBN_DBLCLK:
+                        index = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_RESULTS), LB_GETCURSEL, 0, 0)
+                        if index > -1:
+                            self._open_find_files_hit(index)
+
+                elif command == BN_CLICKED:
+                    if control_id in (ID_OK, ID_REPLACE_ALL):
+                        self._match_case = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_MATCH_CASE), BM_GETCHECK, 0, 0)
+                        self._regex = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_REGEX), BM_GETCHECK, 0, 0)
+                        self._find_files_dry_run = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_DRY_RUN), BM_GETCHECK, 0, 0)
+                        self._find_files_use_index = user32.SendMessageW(user32.GetDlgItem(hwnd, ID_USE_INDEX), BM_GETCHECK, 0, 0)
+                        self._search_term = _get_item_text(hwnd)
+                        self._replace_term = _get_item_text(hwnd, ID_EDIT_REPLACE)
+                        self._find_files_folder = _get_item_text(hwnd, ID_EDIT_FOLDER)
+                        self._find_files_include = _get_item_text(hwnd, ID_EDIT_INCLUDE)
+                        self._find_files_exclude = _get_item_text(hwnd, ID_EDIT_EXCLUDE)
+                        self._find_in_files(control_id == ID_REPLACE_ALL)
+
+                    elif control_id == ID_STOP:
+                        self._cancel_find_in_files()
+
+                    elif control_id == ID_CANCEL:
+                        user32.PostMessageW(hwnd, WM_CLOSE, 0, 0)
+
+            elif msg == WM_CLOSE:
+                self._cancel_find_in_files()
+                user32.SetFocus(self.edit.hwnd)
+
+            return FALSE
+
+        self.dialog_find_files = Dialog(self, dialog_dict, _dialog_proc_find_files)
+
     ########################################
     #
     ########################################
@@ -441,14 +718,17 @@ class App(MainWin):
         #
         ########################################
         def _on_WM_KEYUP(hwnd, wparam, lparam):
-            self._check_caret_pos()
-            self._check_if_text_selected()
+            if self._view:
+                self._view_check_scroll()
+            self._schedule_refresh(REFRESH_CARET | REFRESH_SELECTION)
         self.edit.register_message_callback(WM_KEYUP, _on_WM_KEYUP)
 
         ########################################
         #
         ########################################
         def _on_WM_CHAR(hwnd, wparam, lparam):
+            if self._view:
+                return
             if wparam == VK_BACK and self._use_spaces:
                 return self._handle_back()
             elif wparam == VK_TAB:
@@ -464,25 +744,12 @@ class App(MainWin):
                 # Edit control only knows about selections, not about the active caret position.
                 # So we have to find out the active (=changing) side of the selection ourself.
                 self._last_sel = self._current_sel
-                res = self.edit.send_message(EM_GETSEL, 0, 0)
-                pos_from, pos_to = res & 0xFFFF, (res >> 16) & 0xFFFF
+                pos_from, pos_to = self._get_sel()
                 self._current_sel = [pos_from, pos_to]
                 if self._current_sel == self._last_sel:
                     return
                 pos = pos_to if self._current_sel[1] != self._last_sel[1] else pos_from
-                line_idx = self.edit.send_message(EM_LINEFROMCHAR, pos, 0)
-                res = self.edit.send_message(EM_POSFROMCHAR, pos, 0)
-                if res == -1:
-                    # special case, position is EOF, so go one char back
-                    line_idx_new = self.edit.send_message(EM_LINEFROMCHAR, pos - 1, 0)
-                    if line_idx_new < line_idx:
-                        col_idx = 0
-                    else:
-                        res = self.edit.send_message(EM_POSFROMCHAR, pos - 1, 0)
-                        col_idx = (res & 0xFFFF - self._margin) // self._char_width + 1
-                else:
-                    col_idx = (res & 0xFFFF - self._margin) // self._char_width
-                self._show_caret_pos(line_idx, col_idx)
+                self._show_caret_pos(*self._line_column(pos))
 
         self.edit.register_message_callback(WM_MOUSEMOVE, _on_WM_MOUSEMOVE)
 
@@ -490,10 +757,38 @@ class App(MainWin):
         #
         ########################################
         def _on_WM_LBUTTONUP(hwnd, wparam, lparam):
-            self._check_caret_pos()
-            self._check_if_text_selected()
+            self._schedule_refresh(REFRESH_CARET | REFRESH_SELECTION)
         self.edit.register_message_callback(WM_LBUTTONUP, _on_WM_LBUTTONUP)
 
+        ########################################
+        # The Edit control's own (single level) undo is replaced by self._undo
+        ########################################
+        def _on_WM_UNDO(hwnd, wparam, lparam):
+            self.action_undo()
+            return TRUE
+        self.edit.register_message_callback(WM_UNDO, _on_WM_UNDO)
+        self.edit.register_message_callback(EM_UNDO, _on_WM_UNDO)
+
+        ########################################
+        # Remembers selection and length before messages that might change the text, so
+        # _track_change() knows which range was replaced. Registered last, so other handlers
+        # of these messages run first.
+        ########################################
+        def _on_edit_message(hwnd, msg, wparam, lparam):
+            state = self._edit_state
+            if msg == WM_CHAR and wparam == 0x1A:
+                # Ctrl+Z
+                self.action_undo()
+                return 0
+            self._edit_state = self._get_sel() + (self.edit.send_message(WM_GETTEXTLENGTH, 0, 0), msg)
+            try:
+                return self.edit.old_proc(hwnd, msg, wparam, lparam)
+            finally:
+                self._edit_state = state
+        for msg in (WM_CHAR, WM_KEYDOWN, WM_CUT, WM_PASTE, WM_CLEAR, EM_REPLACESEL):
+            self.edit.register_message_callback(msg,
+                    lambda hwnd, wparam, lparam, msg=msg: _on_edit_message(hwnd, msg, wparam, lparam))
+
     ########################################
     #
     ########################################
@@ -546,9 +841,13 @@ class App(MainWin):
             if advapi32.RegQueryValueExW(hkey, 'fWrap', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
                 self._word_wrap = cast(data, POINTER(DWORD)).contents.value == 1
             if advapi32.RegQueryValueExW(hkey, 'fUseSpaces', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
-                self._use_spaces = cast(data, POINTER(DWORD)).contents.value == 1
+                self._use_spaces = self._default_use_spaces = cast(data, POINTER(DWORD)).contents.value == 1
             if advapi32.RegQueryValueExW(hkey, 'iTabSize', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
-                self._tab_size = cast(data, POINTER(DWORD)).contents.value
+                self._tab_size = self._default_tab_size = cast(data, POINTER(DWORD)).contents.value
+            if advapi32.RegQueryValueExW(hkey, 'fTrimWhitespace', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
+                self._trim_whitespace = cast(data, POINTER(DWORD)).contents.value == 1
+            if advapi32.RegQueryValueExW(hkey, 'fFinalNewline', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
+                self._final_newline = cast(data, POINTER(DWORD)).contents.value == 1
 
             if advapi32.RegQueryValueExW(hkey, 'fMatchCase', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
                 self._match_case = cast(data, POINTER(DWORD)).contents.value == 1
@@ -556,6 +855,8 @@ class App(MainWin):
                 self._wrap_arround = cast(data, POINTER(DWORD)).contents.value == 1
             if advapi32.RegQueryValueExW(hkey, 'fReverse', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
                 self._search_up = cast(data, POINTER(DWORD)).contents.value == 1
+            if advapi32.RegQueryValueExW(hkey, 'fRegex', None, None, byref(data), byref(cbData)) == ERROR_SUCCESS:
+                self._regex = cast(data, POINTER(DWORD)).contents.value == 1
             data = (BYTE * 128)()
             cbData = DWORD(sizeof(data))
             if advapi32.RegQueryValueExW(hkey, 'lfFaceName', None, None, data, byref(cbData)) == ERROR_SUCCESS:
@@ -584,8 +885,10 @@ class App(MainWin):
             advapi32.RegSetValueExW(hkey, 'lfItalic', 0, REG_DWORD, byref(DWORD(int(self._font[3]))), dwsize)
 
             advapi32.RegSetValueExW(hkey, 'fWrap', 0, REG_DWORD, byref(DWORD(int(self._word_wrap))), dwsize)
-            advapi32.RegSetValueExW(hkey, 'fUseSpaces', 0, REG_DWORD, byref(DWORD(int(self._use_spaces))), dwsize)
-            advapi32.RegSetValueExW(hkey, 'iTabSize', 0, REG_DWORD, byref(DWORD(self._tab_size)), dwsize)
+            advapi32.RegSetValueExW(hkey, 'fUseSpaces', 0, REG_DWORD, byref(DWORD(int(self._default_use_spaces))), dwsize)
+            advapi32.RegSetValueExW(hkey, 'iTabSize', 0, REG_DWORD, byref(DWORD(self._default_tab_size)), dwsize)
+            advapi32.RegSetValueExW(hkey, 'fTrimWhitespace', 0, REG_DWORD, byref(DWORD(int(self._trim_whitespace))), dwsize)
+            advapi32.RegSetValueExW(hkey, 'fFinalNewline', 0, REG_DWORD, byref(DWORD(int(self._final_newline))), dwsize)
 
             # search
             buf = create_unicode_buffer(self._saved_search_term)
@@ -596,6 +899,7 @@ class App(MainWin):
             advapi32.RegSetValueExW(hkey, 'fWrapAround', 0, REG_DWORD, byref(DWORD(int(self._wrap_arround))), dwsize)
 
             advapi32.RegSetValueExW(hkey, 'fReverse', 0, REG_DWORD, byref(DWORD(int(self._search_up))), dwsize)
+            advapi32.RegSetValueExW(hkey, 'fRegex', 0, REG_DWORD, byref(DWORD(int(self._regex))), dwsize)
             # window
             advapi32.RegSetValueExW(hkey, 'DarkMode', 0, REG_DWORD, byref(DWORD(int(self._dark_mode))), dwsize)
             advapi32.RegSetValueExW(hkey, 'StatusBar', 0, REG_DWORD, byref(DWORD(int(self._show_statusbar))), dwsize)
@@ -609,57 +913,38 @@ class App(MainWin):
             advapi32.RegCloseKey(hkey)
 
     ########################################
-    # indents/unindents selected block
+    # indents/unindents selected block. The block is transformed as a whole and replaced with a
+    # single EM_REPLACESEL, so it's also undone as one.
     ########################################
     def _handle_tab(self):
         tab = ' ' * self._tab_size if self._use_spaces else '\t'
-        tab_len = len(tab)
         is_shift = user32.GetAsyncKeyState(VK_SHIFT) > 1
-        res = self.edit.send_message(EM_GETSEL, 0, 0)
-        pos_from, pos_to = res & 0xFFFF, (res >> 16) & 0xFFFF
-        line_from = self.edit.send_message(EM_LINEFROMCHAR, pos_from, 0)
-        if pos_to > pos_from:
-            line_to = self.edit.send_message(EM_LINEFROMCHAR, pos_to, 0)
+        pos_from, pos_to = self._get_sel()
+        # block indent works on logical lines (also with word wrap), taken from the line index
+        if pos_to > pos_from and not self._view:
+            line_from = self._doc.line_from_offset(pos_from)
+            line_to = self._doc.line_from_offset(pos_to)
             is_multline = line_to > line_from
         else:
             is_multline = False
 
         if is_multline:
             # get full block
-            sel_pos_from = self.edit.send_message(EM_LINEINDEX, line_from, 0)
-
-            line_start_pos = self.edit.send_message(EM_LINEINDEX, line_to, 0)
-            sel_pos_to = line_start_pos + self.edit.send_message(EM_LINELENGTH, line_start_pos, 0)
-
-            if is_shift:
-                # unindent block
-                stripped = 0
-                with no_redraw(self.edit):
-                    for line_index in range(line_from, line_to + 1):
-                        # check the line starts with tab
-                        buf = (WCHAR * (tab_len + 1))()
-                        buf[0] = chr(tab_len)
-                        self.edit.send_message(EM_GETLINE, line_index, byref(buf))
-                        if buf.value == tab:  #.startswith(tab):
-                            line_start_pos = self.edit.send_message(EM_LINEINDEX, line_index, 0)
-                            self.edit.send_message(EM_SETSEL, line_start_pos, line_start_pos + tab_len)
-                            self.edit.send_message(WM_CLEAR, 0, 0)
-                            stripped += tab_len
-                    # update selection to new size
-                    self.edit.send_message(EM_SETSEL, sel_pos_from, sel_pos_to - stripped)
-            else:
-                # indent block
-                tab_buf = create_unicode_buffer(tab)
-                with no_redraw(self.edit):
-                    for line_index in range(line_from, line_to + 1):
-                        line_start_pos = self.edit.send_message(EM_LINEINDEX, line_index, 0)
-                        self.edit.send_message(EM_SETSEL, line_start_pos, line_start_pos)
-                        self.edit.send_message(EM_REPLACESEL, TRUE, tab_buf)  # TRUE for undoable
-                    # update selection to new size
-                    self.edit.send_message(EM_SETSEL, sel_pos_from, sel_pos_to + tab_len * (line_to - line_from + 1))
+            sel_pos_from = self._doc.line_offset(line_from)
+            sel_pos_to = self._doc.line_offset(line_to) + len(self._doc.line_text(line_to))
+            block = self._doc.substring(sel_pos_from, sel_pos_to)
+            new_block = unindent_block(block, tab) if is_shift else indent_block(block, tab)
+            with no_redraw(self.edit):
+                if new_block != block:
+                    self.edit.send_message(EM_SETSEL, sel_pos_from, sel_pos_to)
+                    self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(new_block))
+                # select the whole block (with its new size)
+                self.edit.send_message(EM_SETSEL, sel_pos_from, sel_pos_from + len(new_block))
+            user32.InvalidateRect(self.edit.hwnd, None, TRUE)
 
         elif is_shift:
             # jump back to preceding tab pos
+            line_from = self.edit.send_message(EM_LINEFROMCHAR, pos_from, 0)
             res = self.edit.send_message(EM_POSFROMCHAR, pos_from, 0)
             if res == -1:
                 # special case, position is EOF
@@ -667,26 +952,26 @@ class App(MainWin):
                 if line_from_new < line_from:
                     return
                 res = self.edit.send_message(EM_POSFROMCHAR, pos_from - 1, 0)
-                x, y = res & 0xFFFF + self._char_width, (res >> 16) & 0xFFFF
+                x, y = LOWORD(res) + self._char_width, HIWORD(res)
             else:
-                x, y = res & 0xFFFF, (res >> 16) & 0xFFFF
+                x, y = LOWORD(res), HIWORD(res)
             pos_char_px = (x - self._margin) // self._char_width
             if pos_char_px == 0:
                 return
             pos_char_px_new = (pos_char_px - 1) // self._tab_size * self._tab_size
-            pos_new = LOWORD(self.edit.send_message(EM_CHARFROMPOS, 0, MAKELONG(self._margin + pos_char_px_new * self._char_width, y)))
+            pos_new = self._char_from_pos(self._margin + pos_char_px_new * self._char_width, y,
+                    self.edit.send_message(EM_LINEINDEX, line_from, 0))
             self.edit.send_message(EM_SETSEL, pos_new, pos_new)
 
         else:
-            self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(tab))
+            self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(tab))
 
     ########################################
     # if _use_spaces is True and there are only spaces before caret,
     # remove according to self._tab_size
     ########################################
     def _handle_back(self):
-        res = self.edit.send_message(EM_GETSEL, 0, 0)
-        pos_from, pos_to = res & 0xFFFF, (res >> 16) & 0xFFFF
+        pos_from, pos_to = self._get_sel()
         if pos_from == pos_to:
             line_index = self.edit.send_message(EM_LINEFROMCHAR, pos_from, 0)
             line_start_pos = self.edit.send_message(EM_LINEINDEX, line_index, 0)
@@ -722,44 +1007,90 @@ class App(MainWin):
         self._char_width = tm.tmAveCharWidth
 
     ########################################
-    #
+    # Returns the current selection as (start, end). Unlike the return value of EM_GETSEL,
+    # the DWORD pointer form isn't limited to 16 bit, so it works for any text length.
     ########################################
-    def _find(self, search_up=None):
-        sel_start_pos = DWORD()
-        sel_end_pos = DWORD()
-        self.edit.send_message(EM_GETSEL, byref(sel_start_pos), byref(sel_end_pos))
+    def _get_sel(self):
+        pos_start, pos_end = DWORD(), DWORD()
+        self.edit.send_message(EM_GETSEL, byref(pos_start), byref(pos_end))
+        return pos_start.value, pos_end.value
 
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        txt = text_buf.value
+    ########################################
+    # EM_CHARFROMPOS only returns the low 16 bits of the char index. Restores the full index,
+    # based on a position known to be at most 64K chars before it (e.g. the start of its line).
+    ########################################
+    def _char_from_pos(self, x, y, pos_before):
+        pos = LOWORD(self.edit.send_message(EM_CHARFROMPOS, 0, MAKELONG(x, y)))
+        return pos_before + ((pos - pos_before) & 0xFFFF)
 
-        haystack = txt if self._match_case else txt.lower()
-        needle = self._search_term if self._match_case else self._search_term.lower()
+    ########################################
+    #
+    ########################################
+    def _find(self, search_up=None):
+        if self._view:
+            return self._view_find(search_up)
+        sel_start_pos, sel_end_pos = self._get_sel()
+        # the document's text counts UTF-16 code units, so must the term
+        term = to_utf16_units(self._search_term)
 
         if search_up is None:
             search_up = self._search_up
 
+        if self._regex:
+            try:
+                pattern = search_pattern(term, True, self._match_case)
+            except re.error as e:
+                self.show_message_box(tr('INVALID_REGEX').format(e), APP_NAME)
+                return False
+            haystack = self._get_search_snapshot().text
+
+            # returns (start, end) of the next match in haystack[start:end] or None
+            def search(start, end):
+                if search_up:
+                    self._match = search_backward(haystack, pattern, start, end)
+                else:
+                    self._match = search_forward(haystack, pattern, start, end)
+                    if self._match and self._match.end() == sel_end_pos == sel_start_pos and start < end:
+                        # don't get stuck at an empty match
+                        self._match = search_forward(haystack, pattern, start + 1, end)
+                return self._match.span() if self._match else None
+        elif self._match_case:
+            # case-sensitive search runs directly on the pieces of the document
+            haystack = self._doc
+
+            def search(start, end):
+                pos = haystack.rfind(term, start, end) if search_up else haystack.find(term, start, end)
+                return (pos, pos + len(term)) if pos > -1 else None
+        else:
+            snapshot = self._get_search_snapshot()
+            haystack = snapshot.text
+
+            def search(start, end):
+                return snapshot.find(term, start, end, False, search_up)
+
         if search_up:
-            pos = haystack.rfind(needle, 0, sel_start_pos.value)
+            found = search(0, sel_start_pos)
         else:
-            pos = haystack.find(needle, sel_end_pos.value)
+            found = search(sel_end_pos, len(haystack))
 
-        if pos < 0 and self._wrap_arround:
+        self._find_status = ''
+        if found is None and self._wrap_arround:
             if search_up:
-                pos = haystack.rfind(needle, sel_start_pos.value)
-                self.statusbar.set_text(tr('Found next from the bottom') if pos > -1 else '')
+                found = search(sel_start_pos, len(haystack))
+                if found:
+                    self._find_status = tr('Found next from the bottom')
             else:
-                pos = haystack.find(needle, 0, sel_end_pos.value)
-                self.statusbar.set_text(tr('Found next from the top') if pos > -1 else '')
-        else:
-            self.statusbar.set_text()
+                found = search(0, sel_end_pos)
+                if found:
+                    self._find_status = tr('Found next from the top')
 
-        if pos > -1:
-            self.edit.send_message(EM_SETSEL, pos, pos + len(self._search_term))
+        if found:
+            self.edit.send_message(EM_SETSEL, *found)
+            self._count_matches(self._search_term, self._match_case, self._regex)
             self._check_caret_pos()
             return True
         else:
+             self.statusbar.set_text()
              self.show_message_box(tr('CANNOT_FIND').format(self._search_term), APP_NAME)
              return False
 
@@ -768,176 +1099,656 @@ class App(MainWin):
     ########################################
     def _replace(self):
         if self._find():
-            self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(self._replace_term))
+            try:
+                text = expand_match(self._match, self._replace_term, self._regex)
+            except (re.error, IndexError) as e:
+                self.show_message_box(tr('INVALID_REGEX').format(e), APP_NAME)
+                return
+            self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(text))
 
     ########################################
     #
     ########################################
     def _replace_all(self):
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        txt = text_buf.value
-        if self._match_case:
-            txt_new = txt.replace(self._search_term, self._replace_term)
-        else:
-            txt_new = re.compile(re.escape(self._search_term), re.IGNORECASE).sub(self._replace_term, txt)
-        if txt_new != txt:
-            self.edit.send_message(EM_SETSEL, 0, -1)
-            self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(txt_new))
-            self._check_caret_pos()
+        txt = self._get_search_snapshot().text
+        try:
+            pattern = search_pattern(to_utf16_units(self._search_term), self._regex, self._match_case)
+            replace_term = to_utf16_units(self._replace_term)
+            deltas = []
+            shift = 0
+            for m in pattern.finditer(txt):
+                replace = expand_match(m, replace_term, self._regex)
+                # offsets after the previous replacements, as the deltas are applied in order
+                deltas.append((m.start() + shift, m.group(), replace))
+                shift += len(replace) - len(m.group())
+        except (re.error, IndexError) as e:
+            self.show_message_box(tr('INVALID_REGEX').format(e), APP_NAME)
+            return
+        self._find_status = ''
+        self.statusbar.set_text(tr('REPLACED').format(len(deltas)))
+        if deltas:
+            self._replace_ranges(deltas)
+
+    ########################################
+    # Applies ascending deltas (offset, old, new) and records them as undo group. Selection and
+    # scroll position stay at the same place in the text.
+    ########################################
+    def _replace_ranges(self, deltas):
+        first_line = self.edit.send_message(EM_GETFIRSTVISIBLELINE, 0, 0)
+        keep = [*self._get_sel(), self.edit.send_message(EM_LINEINDEX, first_line, 0)]
+        self._undo.add_group(deltas)
+        self._apply_deltas(deltas)
+        sel_start, sel_end, pos = [shift_offset(deltas, pos) for pos in keep]
+        self.edit.send_message(EM_SETSEL, sel_start, sel_end)
+        line = self.edit.send_message(EM_LINEFROMCHAR, pos, 0)
+        self.edit.send_message(EM_LINESCROLL, 0, line - self.edit.send_message(EM_GETFIRSTVISIBLELINE, 0, 0))
+        self._check_caret_pos()
+
+    ########################################
+    # Returns the search snapshot of the current document version, which is reused by all
+    # searches until the text changes
+    ########################################
+    def _get_search_snapshot(self):
+        if self._snapshot is None or self._snapshot[0] is not self._doc:
+            self._snapshot = (self._doc, SearchSnapshot(str(self._doc)))
+        return self._snapshot[1]
+
+    ########################################
+    # Selects the match of the pending term of the Find dialog, continuing from the current
+    # match if the term was extended
+    ########################################
+    def _find_incremental(self):
+        args, self._incremental_args = self._incremental_args, None
+        if args is None or self._view:
+            return
+        term, match_case, regex, search_up, wrap_around = args
+        term = to_utf16_units(term)
+        inc = self._incremental
+        if inc is None:
+            inc = IncrementalSearch(*self._get_sel(), search_up, wrap_around)
+        elif inc.search_up != search_up or inc.wrap_around != wrap_around:
+            inc = IncrementalSearch(inc.anchor_start, inc.anchor_end, search_up, wrap_around)
+        self._incremental = inc
+        try:
+            found = inc.find(self._get_search_snapshot(), term, match_case, regex)
+        except re.error:
+            # regular expression not completely typed yet
+            return
+        self._find_status = ''
+        if found is None:
+            # back to where the search started
+            found = inc.anchor_start, inc.anchor_end
+        elif inc.wrapped:
+            self._find_status = tr('Found next from the bottom' if search_up else 'Found next from the top')
+        self.edit.send_message(EM_SETSEL, *found)
+        self.edit.send_message(EM_SCROLLCARET, 0, 0)
+        self._show_match_count()
+        self._check_caret_pos()
+
+    ########################################
+    # Starts counting the matches of term in the background (reusing the count of a prefix of
+    # it, if possible) and shows the result once it's done
+    ########################################
+    def _count_matches(self, term, match_case, regex):
+        if self._view or not term:
+            self.kill_timer(COUNT_TIMER_ID)
+            self._counter = None
+            self._show_match_count()
+            return
+        term = to_utf16_units(term)
+        snapshot = self._get_search_snapshot()
+        if self._counter and self._counter.is_counting(snapshot, term, match_case, regex):
+            self._show_match_count()
+            return
+        try:
+            self._counter = MatchCounter(snapshot, term, match_case, regex, self._counter)
+        except re.error:
+            self._counter = None
+        self._show_match_count()
+        if self._counter:
+            self.create_timer(self._count_step, COUNT_INTERVAL, False, COUNT_TIMER_ID)
+
+    ########################################
+    #
+    ########################################
+    def _count_step(self):
+        if self._counter is None or self._counter.step(COUNT_SLICE):
+            self.kill_timer(COUNT_TIMER_ID)
+            self._show_match_count()
+
+    ########################################
+    # Shows "Match N of M" (N is the match at the start of the selection) in the status bar
+    # and the Find dialog
+    ########################################
+    def _show_match_count(self):
+        text = ''
+        counter = self._counter
+        if counter and counter.done and self._snapshot and counter.snapshot is self._snapshot[1]:
+            index = counter.index(self._get_sel()[0])
+            text = tr('MATCH_COUNT').format(index, counter.count) if index else tr('MATCHES').format(counter.count)
+        if self.dialog_find.hwnd:
+            user32.SendMessageW(user32.GetDlgItem(self.dialog_find.hwnd, ID_MATCH_COUNT), WM_SETTEXT, 0,
+                    create_unicode_buffer(text))
+        self.statusbar.set_text(' - '.join(filter(None, (self._find_status, text))))
+
+    ########################################
+    # Applies deltas (offset, old, new) in order, without recording them for undo. Only the
+    # replaced ranges are changed in the Edit control, back to front and with nearby ones merged.
+    ########################################
+    def _apply_deltas(self, deltas):
+        max_gap = max(DELTAS_MERGE_GAP, len(self._doc) // DELTAS_APPLY_MAX)
+        self._record_undo = False
+        try:
+            with no_redraw(self.edit):
+                for start, end, new in delta_ranges(self._doc, deltas, max_gap):
+                    self.edit.send_message(EM_SETSEL, start, end)
+                    self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(new))
+            user32.InvalidateRect(self.edit.hwnd, None, TRUE)
+        finally:
+            self._record_undo = True
+
+    ########################################
+    # Applies deltas returned by undo/redo and selects the last new text
+    ########################################
+    def _undo_deltas(self, deltas):
+        self._apply_deltas(deltas)
+        offset, old, new = deltas[-1]
+        self.edit.send_message(EM_SETSEL, offset, offset + len(new))
+        self.edit.send_message(EM_SCROLLCARET, 0, 0)
 
     ########################################
     # Tries to detect the EOL mode of the specified bytes
     ########################################
     def _detect_eol(self, data):
-        if b'\n' in data and not b'\r' in data:
-            return IDM_EOL_LF
-        if b'\r' in data and not b'\n' in data:
-            return IDM_EOL_CR
-        return IDM_EOL_CRLF
+        return detect_eol(data)
 
     ########################################
     # Tries to detect the encoding of the specified bytes
     ########################################
     def _detect_encoding(self, data):
-        if len(data) == 0:
-            return IDM_UTF_8
-        bom = self._get_bom(data)
-        if bom:
-            return bom
-        if data[0] == 0:
-            return IDM_UTF_16_BE
-        if len(data) > 1 and data[1] == 0:
-            return IDM_UTF_16_LE
-        if self._is_utf8(data):
-            return IDM_UTF_8
-        return IDM_ANSI
-
-    ########################################
-    # Checks bytes for Byte-Order-Mark (BOM), returns BOM type or None
-    ########################################
-    def _get_bom(self, data):
-    	if len(data) >= 3 and data[:3] == b'\xEF\xBB\xBF':
-    		return IDM_UTF_8_BOM
-    	elif len(data) >= 2:
-            if data[:2] == b'\xFF\xFE':
-                return IDM_UTF_16_LE
-            elif data[:2] == b'\xFE\xFF':
-                return IDM_UTF_16_BE
-
-    ########################################
-    # Checks bytes for invalid UTF-8 sequences
-    # Notice: since ASCII is a UTF-8 subset, function also returns True for pure ASCII data
-    ########################################
-    def _is_utf8(self, data):
-    	data_len = len(data)
-    	i = -1
-    	while True:
-    		i += 1
-    		if i >= data_len:
-    		    break
-    		o = data[i]
-    		if (o < 128):
-    		    continue
-    		elif o & 224 == 192 and o > 193:
-    		    n = 1
-    		elif o & 240 == 224:
-    		    n = 2
-    		elif o & 248 == 240 and o < 245:
-    		    n = 3
-    		else:
-    		    return False  # invalid UTF-8 sequence
-    		for c in range(n):
-    			i += 1
-    			if i > data_len:
-    			    return False  # invalid UTF-8 sequence
-    			if data[i] & 192 != 128:
-    			    return False  # invalid UTF-8 sequence
-    	return True
+        return detect_encoding(data)
 
     ########################################
     #
     ########################################
     def _check_caret_pos(self):
-        pt = POINT()
-        ok = user32.GetCaretPos(byref(pt))
-        pos = self.edit.send_message(EM_CHARFROMPOS, 0, MAKELONG(pt.x, pt.y))
-        if pos > -1:
-            line_idx = HIWORD(pos)
-            col_idx = (pt.x - self._margin) // self._char_width
-            self._show_caret_pos(line_idx, col_idx)
+        pos, pos_to = self._get_sel()
+        if pos_to > pos:
+            # the caret is at one of the two ends of the selection, EM_CHARFROMPOS (16 bit)
+            # only tells which one
+            pt = POINT()
+            user32.GetCaretPos(byref(pt))
+            res = self.edit.send_message(EM_CHARFROMPOS, 0, MAKELONG(pt.x, pt.y))
+            if res > -1 and LOWORD(res) == LOWORD(pos_to):
+                pos = pos_to
+        self._show_caret_pos(*self._line_column(pos))
 
     ########################################
     #
     ########################################
     def _show_caret_pos(self, line_idx=0, col_idx=0):
-        self.statusbar.set_text(tr('LINE_COLUMN').format(line_idx + 1, col_idx + 1), STATUSBAR_PART_CARET)
+        text = tr('LINE_COLUMN').format(line_idx + 1, col_idx + 1)
+        if text != self._caret_text:
+            self._caret_text = text
+            self.statusbar.set_text(text, STATUSBAR_PART_CARET)
+
+    ########################################
+    # Schedules a refresh of the UI state specified by flags (REFRESH_*). Requests are
+    # coalesced, so key repeat bursts or paste storms only cause one refresh per frame.
+    ########################################
+    def _schedule_refresh(self, flags):
+        if not self._refresh_flags:
+            self.create_timer(self._refresh, REFRESH_DELAY, True, REFRESH_TIMER_ID)
+        self._refresh_flags |= flags
+
+    ########################################
+    #
+    ########################################
+    def _refresh(self):
+        flags, self._refresh_flags = self._refresh_flags, 0
+        if flags & REFRESH_TEXT and not self._view:
+            self._is_dirty = self._check_if_text_changed()
+            self._update_caption()
+        if flags & REFRESH_CARET:
+            self._check_caret_pos()
+        if flags & REFRESH_SELECTION:
+            self._check_if_text_selected()
+
+    ########################################
+    # Runs a scheduled refresh right now, so e.g. the dirty state is up to date
+    ########################################
+    def _flush_refresh(self):
+        if self._refresh_flags:
+            self.kill_timer(REFRESH_TIMER_ID)
+            self._refresh()
+
+    ########################################
+    # Only menu items whose state actually changes are updated
+    ########################################
+    def _enable_menu_items(self, item_ids, flag):
+        for item_id in item_ids:
+            if self._menu_enabled.get(item_id) != flag:
+                self._menu_enabled[item_id] = flag
+                user32.EnableMenuItem(self.hmenu, item_id, MF_BYCOMMAND | (MF_ENABLED if flag else MF_GRAYED))
+
+    ########################################
+    #
+    ########################################
+    def _update_caption(self):
+        caption = self._get_caption()
+        if caption != self._caption:
+            self._caption = caption
+            self.set_window_text(caption)
 
     ########################################
     #
     ########################################
     def _load_file(self, filename):
+        self._close_view()
         if os.stat(filename).st_size > EDIT_MAX_TEXT_LEN:
-            return self.show_message_box(tr('FILE_TOO_BIG'), APP_NAME, MB_ICONWARNING | MB_OK)
-        with open(filename, 'rb') as f:
-            data = f.read()
+            return self._load_view(filename)
+        text, eol_mode_id, encoding_id = read_text_file(filename)
         self._show_caret_pos()
+        self._set_file_modes(eol_mode_id, encoding_id)
+        # the Edit control stops at the first NUL char, so does the document. The text is only
+        # copied if it has to be cut, the document and the detection share it.
+        if '\0' in text:
+            text = text.partition('\0')[0]
+        self.edit.send_message(WM_SETTEXT, 0, text)
+        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0)
+        self._enable_menu_items((IDM_FIND, IDM_FIND_NEXT, IDM_FIND_PREVIOUS, IDM_REPLACE), text_len > 0)
+        self._doc = PieceTable(text if text_len == len(text) else text[:text_len])
+        del text
+        self._dirty = DirtyTracker(text_len, block_hashes(self._doc))
+        self._set_indentation(*detect_indentation(self._doc))
+        self._undo.clear()
+        self._enable_menu_items((IDM_UNDO, IDM_REDO), False)
+        self._is_dirty = False
+        self._filename = filename  # os.path.basename(filename)
+        self._update_caption()
+        user32.SetFocus(self.edit.hwnd)
+
+    ########################################
+    #
+    ########################################
+    def _set_file_modes(self, eol_mode_id, encoding_id):
         buf = create_unicode_buffer(24)
-        eol_mode_id = self._detect_eol(data)
         if eol_mode_id != self._eol_mode_id:
             user32.CheckMenuItem(self.hmenu, self._eol_mode_id, MF_BYCOMMAND | MF_UNCHECKED)
             self._eol_mode_id = eol_mode_id
             user32.CheckMenuItem(self.hmenu, self._eol_mode_id, MF_BYCOMMAND | MF_CHECKED)
         user32.GetMenuStringW(self.hmenu, self._eol_mode_id, buf, 24, MF_BYCOMMAND)
         self.statusbar.set_text(buf.value, STATUSBAR_PART_EOL)
-        encoding_id = self._detect_encoding(data)
         if encoding_id != self._encoding_id:
             user32.CheckMenuItem(self.hmenu, self._encoding_id, MF_BYCOMMAND | MF_UNCHECKED)
             self._encoding_id = encoding_id
             user32.CheckMenuItem(self.hmenu, self._encoding_id, MF_BYCOMMAND | MF_CHECKED)
         user32.GetMenuStringW(self.hmenu, self._encoding_id, buf, 24, MF_BYCOMMAND)
         self.statusbar.set_text(buf.value, STATUSBAR_PART_ENCODING)
-        if self._eol_mode_id != IDM_EOL_CRLF:
-            data = data.replace(EOL_MODES[self._eol_mode_id].encode(), b'\r\n')
-        text_buf = create_unicode_buffer(data.decode(ENCODINGS[self._encoding_id]))
-        self.edit.send_message(WM_SETTEXT, 0, text_buf)
-        self._saved_text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(self._saved_text_len)
-        self.edit.send_message(WM_GETTEXT, self._saved_text_len, text_buf)
-        flag = MF_BYCOMMAND | (MF_ENABLED if self._saved_text_len > 1 else MF_GRAYED)
-        for item_id in (IDM_FIND, IDM_FIND_NEXT, IDM_FIND_PREVIOUS, IDM_REPLACE):
-            user32.EnableMenuItem(self.hmenu, item_id, flag)
-        self._saved_text = text_buf.value
+
+    ########################################
+    # Switches to the (detected) indentation of the loaded file, without changing its text.
+    # None uses the default from the menu. Only applies to the current document, the defaults
+    # (saved in the registry) are kept.
+    ########################################
+    def _set_indentation(self, use_spaces, tab_size):
+        if use_spaces is None:
+            use_spaces = self._default_use_spaces
+        if use_spaces != self._use_spaces:
+            self._use_spaces = use_spaces
+            user32.CheckMenuItem(self.hmenu, IDM_TABS_AS_SPACES,
+                MF_BYCOMMAND | (MF_CHECKED if self._use_spaces else MF_UNCHECKED))
+        self._set_tab_size(self._default_tab_size if tab_size is None else tab_size)
+
+    ########################################
+    # Opens file that is too big for the Edit control as memory-mapped, read-only view.
+    # The Edit control then only contains VIEW_PAGES pages around the current position.
+    ########################################
+    def _load_view(self, filename):
+        self._view = MappedFile(filename)
+        self._view.start_indexing()
+        self._show_caret_pos()
+        self._set_file_modes(self._view.eol_mode_id, self._view.encoding_id)
+        self.edit.send_message(EM_SETREADONLY, TRUE, 0)
+        self._enable_menu_items(VIEW_DISABLED_ITEMS, False)
+        self._enable_menu_items((IDM_FIND, IDM_FIND_NEXT, IDM_FIND_PREVIOUS), True)
+        self._view_show_pages(0)
+        self._doc = PieceTable()
+        self._dirty = DirtyTracker()
+        self._set_indentation(None, None)
+        self._undo.clear()
+        self._enable_menu_items((IDM_UNDO, IDM_REDO), False)
         self._is_dirty = False
-        self._filename = filename  # os.path.basename(filename)
-        self.set_window_text(self._get_caption())
+        self._filename = filename
+        self._update_caption()
         user32.SetFocus(self.edit.hwnd)
 
     ########################################
     #
     ########################################
-    def _save_file(self, filename):
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        txt = text_buf.value
-        if self._eol_mode_id != IDM_EOL_CRLF:
-            txt = txt.replace('\r\n', EOL_MODES[self._eol_mode_id])
-        try:
-            with open(filename, 'wb') as f:
-                f.write(txt.encode(ENCODINGS[self._encoding_id]))
-            self._saved_text_len = text_len
-            self._saved_text = text_buf.value
+    def _close_view(self):
+        if not self._view:
+            return
+        self.kill_timer(VIEW_SCROLL_TIMER_ID)
+        self._view.close()
+        self._view = None
+        self.edit.send_message(EM_SETREADONLY, FALSE, 0)
+        self._enable_menu_items(VIEW_DISABLED_ITEMS, True)
+
+    ########################################
+    #
+    ########################################
+    def _view_show_pages(self, first_page):
+        text, self._view_page_starts = self._view.window(first_page, VIEW_PAGES)
+        self._view_first_page = first_page
+        self.edit.send_message(WM_SETTEXT, 0, text)
+
+    ########################################
+    # Converts byte offset in view file into char position in Edit control (clamped to the
+    # currently loaded pages)
+    ########################################
+    def _view_pos_from_offset(self, offset):
+        start = self._view.page_start(self._view_first_page)
+        end = self._view.page_start(self._view_first_page + len(self._view_page_starts))
+        return self._view.display_pos(self._view_first_page, min(max(offset, start), end))
+
+    ########################################
+    # Selects length chars at the specified byte offset, loading its pages if needed
+    ########################################
+    def _view_select(self, offset, length=0):
+        page = self._view.page_of(offset)
+        if not self._view_first_page < page < self._view_first_page + VIEW_PAGES - 1:
+            self._view_show_pages(max(0, min(page - 1, self._view.page_count - VIEW_PAGES)))
+        pos = self._view_pos_from_offset(offset)
+        self.edit.send_message(EM_SETSEL, pos, pos + length)
+
+    ########################################
+    # Loads previous/next page if the user scrolled into the first/last loaded page
+    ########################################
+    def _view_check_scroll(self):
+        first_line = self.edit.send_message(EM_GETFIRSTVISIBLELINE, 0, 0)
+        pos = self.edit.send_message(EM_LINEINDEX, first_line, 0)
+        starts = self._view_page_starts
+        if len(starts) > 1 and pos < starts[1] and self._view_first_page > 0:
+            first_page = self._view_first_page - 1
+        elif len(starts) == VIEW_PAGES and pos >= starts[-1] and self._view_first_page + VIEW_PAGES < self._view.page_count:
+            first_page = self._view_first_page + 1
+        else:
+            return
+        offset = self._view.display_offset(self._view_first_page, pos)
+        sel = [self._view.display_offset(self._view_first_page, p) for p in self._get_sel()]
+        with no_redraw(self.edit):
+            self._view_show_pages(first_page)
+            self.edit.send_message(EM_SETSEL, *[self._view_pos_from_offset(o) for o in sel])
+            line = self.edit.send_message(EM_LINEFROMCHAR, self._view_pos_from_offset(offset), 0)
+            self.edit.send_message(EM_LINESCROLL, 0, line - self.edit.send_message(EM_GETFIRSTVISIBLELINE, 0, 0))
+        user32.InvalidateRect(self.edit.hwnd, None, TRUE)
+
+    ########################################
+    #
+    ########################################
+    def _view_find(self, search_up=None):
+        if search_up is None:
+            search_up = self._search_up
+        sel_start_pos, sel_end_pos = self._get_sel()
+        offset = self._view.display_offset(self._view_first_page, sel_start_pos if search_up else sel_end_pos)
+        pos = self._view.find(self._search_term, offset, self._match_case, search_up)
+
+        if pos < 0 and self._wrap_arround:
+            pos = self._view.find(self._search_term, self._view.size if search_up else 0, self._match_case, search_up)
+            if search_up:
+                self.statusbar.set_text(tr('Found next from the bottom') if pos > -1 else '')
+            else:
+                self.statusbar.set_text(tr('Found next from the top') if pos > -1 else '')
+        else:
+            self.statusbar.set_text()
+
+        if pos > -1:
+            self._view_select(pos, len(self._search_term))
+            self._check_caret_pos()
             return True
+        else:
+             self.show_message_box(tr('CANNOT_FIND').format(self._search_term), APP_NAME)
+             return False
+
+    ########################################
+    # Starts searching the files specified in the Find in Files dialog in the background. Hits
+    # are added to its results list as they come in. With replace=True, the matches are replaced
+    # instead (or only counted, if Dry run is checked), and the list shows the count per file.
+    # With "Use index", searching only reads the files that are new or changed since the last
+    # indexed search of the folder, and the ones that may contain the term.
+    ########################################
+    def _find_in_files(self, replace=False):
+        self._cancel_find_in_files()
+        hwnd = self.dialog_find_files.hwnd
+        user32.SendMessageW(user32.GetDlgItem(hwnd, ID_RESULTS), LB_RESETCONTENT, 0, 0)
+        self._find_files_hits = []
+        self._find_files_matched = 0
+        self._find_files_count = 0
+        folder = os.path.abspath(self._find_files_folder)
+        if not os.path.isdir(folder):
+            self.show_message_box(tr('FOLDER_NOT_FOUND').format(folder), APP_NAME)
+            return
+        includes, excludes = split_globs(self._find_files_include), split_globs(self._find_files_exclude)
+        try:
+            if replace:
+                job = ReplaceInFiles(folder, self._search_term, self._replace_term, self._regex, self._match_case,
+                        includes, excludes, self._find_files_dry_run)
+            elif self._find_files_use_index:
+                job = IndexedFindInFiles(folder, self._search_term, self._regex, self._match_case, includes, excludes,
+                        index_filename(FIND_FILES_INDEX_DIR, folder))
+            else:
+                job = FindInFiles(folder, self._search_term, self._regex, self._match_case, includes, excludes)
+        except re.error as e:
+            self.show_message_box(tr('INVALID_REGEX').format(e), APP_NAME)
+            return
+
+        # called in the job's thread
+        def _on_results(results):
+            self._find_files_results.append((job, results))
+            user32.PostMessageW(self.hwnd, WM_FIND_FILES_RESULTS, 0, 0)
+
+        self._find_files = job
+        job.start(_on_results)
+        user32.EnableWindow(user32.GetDlgItem(hwnd, ID_STOP), 1)
+        self.create_timer(self._show_find_files_status, FIND_FILES_INTERVAL, False, FIND_FILES_TIMER_ID)
+        self._show_find_files_status()
+
+    ########################################
+    # Stops a running Find in Files, without waiting for its workers
+    ########################################
+    def _cancel_find_in_files(self):
+        if self._find_files and not self._find_files.done:
+            self._find_files.cancel()
+
+    ########################################
+    # Adds the hits (or replace counts) passed from the Find in Files thread to the results list
+    ########################################
+    def _add_find_files_results(self):
+        hwnd = self.dialog_find_files.hwnd
+        while self._find_files_results:
+            job, results = self._find_files_results.popleft()
+            if job is not self._find_files or not hwnd:
+                continue
+            if results is None:
+                # finished or cancelled
+                self.kill_timer(FIND_FILES_TIMER_ID)
+                user32.EnableWindow(user32.GetDlgItem(hwnd, ID_STOP), 0)
+                continue
+            hwnd_list = user32.GetDlgItem(hwnd, ID_RESULTS)
+            user32.SendMessageW(hwnd_list, WM_SETREDRAW, FALSE, 0)
+            if isinstance(job, ReplaceInFiles):
+                self._add_replace_files_results(job, hwnd_list, results)
+            else:
+                for filename, hits in results:
+                    name = os.path.relpath(filename, job.folder)
+                    self._find_files_matched += 1
+                    self._find_files_count += len(hits)
+                    for offset, length, line, line_text in hits:
+                        user32.SendMessageW(hwnd_list, LB_ADDSTRING, 0,
+                                create_unicode_buffer(f'{name}({line + 1}): {line_text.strip()}'))
+                        self._find_files_hits.append((filename, offset, length, line))
+            user32.SendMessageW(hwnd_list, WM_SETREDRAW, TRUE, 0)
+            user32.InvalidateRect(hwnd_list, None, TRUE)
+        self._show_find_files_status()
+
+    ########################################
+    # Adds an item with the replace count (or error) for each file. Items open the file at its
+    # start. If the current file was changed on disk and has no unsaved changes, it's reloaded.
+    ########################################
+    def _add_replace_files_results(self, job, hwnd_list, results):
+        for filename, count, error in results:
+            name = os.path.relpath(filename, job.folder)
+            if error:
+                text = f'{name}: {error}'
+            elif count == REPLACE_SKIPPED:
+                text = tr('REPLACE_FILES_SKIPPED').format(name)
+            else:
+                self._find_files_matched += 1
+                self._find_files_count += count
+                text = tr('REPLACE_FILES_DRY_ITEM' if job.dry_run else 'REPLACE_FILES_ITEM').format(name, count)
+                if (not job.dry_run and not self._is_dirty and self._filename and
+                        os.path.normcase(os.path.abspath(self._filename)) == os.path.normcase(filename)):
+                    self._load_file(filename)
+            user32.SendMessageW(hwnd_list, LB_ADDSTRING, 0, create_unicode_buffer(text))
+            self._find_files_hits.append((filename, 0, 0, 0))
+
+    ########################################
+    #
+    ########################################
+    def _show_find_files_status(self):
+        job = self._find_files
+        if job is None or not self.dialog_find_files.hwnd:
+            self.kill_timer(FIND_FILES_TIMER_ID)
+            return
+        if job.done and isinstance(job, ReplaceInFiles):
+            text = tr('REPLACE_FILES_DRY_STATUS' if job.dry_run else 'REPLACE_FILES_STATUS').format(
+                    self._find_files_count, self._find_files_matched, job.files_searched)
+        elif job.done:
+            text = tr('FIND_FILES_STATUS').format(self._find_files_count, self._find_files_matched, job.files_searched)
+        elif isinstance(job, IndexedFindInFiles) and job.indexing:
+            text = tr('FIND_FILES_INDEXING').format(job.files_indexed, job.files_outdated)
+        else:
+            text = tr('FIND_FILES_SEARCHING').format(self._find_files_count, self._find_files_matched,
+                    job.files_searched, job.files_found)
+        user32.SendMessageW(user32.GetDlgItem(self.dialog_find_files.hwnd, ID_FIND_FILES_STATUS), WM_SETTEXT, 0,
+                create_unicode_buffer(text))
+
+    ########################################
+    # Opens the file of the specified item in the Find in Files results and selects the hit
+    # (Replace in Files items have an empty hit at the start of the file)
+    ########################################
+    def _open_find_files_hit(self, index):
+        filename, offset, length, line = self._find_files_hits[index]
+        if not self._filename or os.path.normcase(os.path.abspath(self._filename)) != os.path.normcase(filename):
+            if not self._handle_dirty():
+                return
+            self._load_file(filename)
+        if self._view:
+            # viewer mode only knows line offsets
+            offset = self._view.line_offset(line)
+            if offset is not None:
+                self._view_select(offset)
+        else:
+            self.edit.send_message(EM_SETSEL, offset, offset + length)
+            self.edit.send_message(EM_SCROLLCARET, 0, 0)
+            self._check_caret_pos()
+        user32.SetFocus(self.edit.hwnd)
+
+    ########################################
+    # Returns the (absolute) line index of the specified char position
+    ########################################
+    def _line_from_char(self, pos):
+        if self._view:
+            return self._view.line_from_offset(self._view.display_offset(self._view_first_page, pos))
+        return self._doc.line_from_offset(pos)
+
+    ########################################
+    # Returns (line, column) of the specified char position, with tabs expanded
+    ########################################
+    def _line_column(self, pos):
+        if self._view:
+            text = self._get_text(0, pos)
+            return self._line_from_char(pos), text_column(text[text.rfind('\n') + 1:], self._tab_size)
+        return self._columns.line_column(self._doc, pos, self._tab_size)
+
+    ########################################
+    #
+    ########################################
+    def _save_file(self, filename, background=False):
+        self._finish_save()
+        # snapshots of the piece table are cheap (and immutable), chunks are sliced directly
+        # from it. Edits made until the save is finished are tracked against the snapshot.
+        doc = self._doc.snapshot()
+        tracker = DirtyTracker(len(doc))
+        self._save_job_id += 1
+        self._save_job = (self._save_job_id, filename, tracker)
+        options = {'trim_whitespace': self._trim_whitespace, 'final_newline': self._final_newline}
+        if not background:
+            try:
+                write_text_file(filename, doc, self._eol_mode_id, self._encoding_id, **options)
+                tracker.hashes = block_hashes(doc)
+            except Exception as e:
+                self._save_error = e
+            return self._finish_save()
+        self._save_error = None
+        self._save_thread = threading.Thread(target=self._save_worker,
+                args=(self._save_job_id, filename, doc, self._eol_mode_id, self._encoding_id, options, tracker),
+                daemon=True)
+        self._save_thread.start()
+        self.statusbar.set_text(tr('SAVING_PROGRESS').format(0))
+        self._update_caption()
+        return True
+
+    ########################################
+    # Runs in the save thread, results are passed back to the UI thread by posting messages
+    # with the job id as wparam
+    ########################################
+    def _save_worker(self, job_id, filename, doc, eol_mode_id, encoding_id, options, tracker):
+        percent = 0
+        def _progress(fraction):
+            nonlocal percent
+            if int(fraction * 100) > percent:
+                percent = int(fraction * 100)
+                user32.PostMessageW(self.hwnd, WM_SAVE_PROGRESS, job_id, percent)
+        try:
+            write_text_file(filename, doc, eol_mode_id, encoding_id, progress=_progress, **options)
+            tracker.hashes = block_hashes(doc)
         except Exception as e:
-            self.statusbar.set_text(f'{e.strerror}: {e.filename}')
+            self._save_error = e
+        user32.PostMessageW(self.hwnd, WM_SAVE_DONE, job_id, 0)
+
+    ########################################
+    # Waits for a running save (if any) and applies its result. Since edits made in the meantime
+    # were tracked against the saved snapshot, they keep the document dirty.
+    # Returns True if the save succeeded.
+    ########################################
+    def _finish_save(self):
+        if self._save_job is None:
+            return True
+        if self._save_thread:
+            self._save_thread.join()
+            self._save_thread = None
+        _, filename, tracker = self._save_job
+        self._save_job = None
+        e, self._save_error = self._save_error, None
+        if e:
+            self.statusbar.set_text(f'{e.strerror}: {e.filename}' if isinstance(e, OSError) else str(e))
+            self._update_caption()
             return False
+        self.statusbar.set_text()
+        self._filename = filename
+        self._dirty = tracker
+        self._is_dirty = self._check_if_text_changed()
+        self._update_caption()
+        return True
 
     ########################################
     #
     ########################################
     def _handle_dirty(self):
+        self._finish_save()
+        self._flush_refresh()
         if not self._is_dirty:
             return True
         res = self.show_message_box_modern(
@@ -950,40 +1761,90 @@ class App(MainWin):
         elif res == IDNO:
             return True
         elif res == IDYES:
-            return self.action_save()
+            return self.action_save(False)
 
     ########################################
     #
     ########################################
     def _get_caption(self):
-        return ('*' if self._is_dirty else '') + (self._filename if self._filename else tr('Untitled')) + ' - ' + APP_NAME
+        return (('*' if self._is_dirty else '') + (self._filename if self._filename else tr('Untitled')) +
+                (' [' + tr('Read-only') + ']' if self._view else '') +
+                (' [' + tr('Saving...') + ']' if self._save_thread else '') + ' - ' + APP_NAME)
 
     ########################################
     #
     ########################################
     def _check_if_text_changed(self):
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
+        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0)
         # enable/disable menu items
-        flag = MF_BYCOMMAND | (MF_ENABLED if text_len > 1 else MF_GRAYED)
-        for item_id in (IDM_FIND, IDM_FIND_NEXT, IDM_FIND_PREVIOUS, IDM_REPLACE):
-            user32.EnableMenuItem(self.hmenu, item_id, flag)
-        if text_len != self._saved_text_len:
-            return True
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        return text_buf.value != self._saved_text
+        self._enable_menu_items((IDM_FIND, IDM_FIND_NEXT, IDM_FIND_PREVIOUS, IDM_REPLACE), text_len > 0)
+        self._enable_menu_items((IDM_UNDO,), self._undo.can_undo)
+        self._enable_menu_items((IDM_REDO,), self._undo.can_redo)
+        return self._dirty.is_dirty(text_len, self._doc.substring)
+
+    ########################################
+    # Mirrors the last change of the Edit control's text in the document and reports it to the
+    # dirty tracker(s) and the undo history. Changes caused by messages not handled by
+    # _on_edit_message are unknown, so the whole text is reloaded (and can't be undone).
+    ########################################
+    def _track_change(self):
+        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0)
+        trackers = [self._dirty]
+        if self._save_job:
+            trackers.append(self._save_job[2])
+        if self._edit_state is None:
+            self._doc = PieceTable(self._get_text_range(0, text_len))
+            for tracker in trackers:
+                tracker.invalidate(text_len)
+            self._undo.clear()
+            self._incremental = None
+            return
+        sel_start, sel_end, old_len, msg = self._edit_state
+        pos_start, pos_end = self._get_sel()
+        delta = text_len - old_len
+        start = min(sel_start, pos_start)
+        old_end = max(sel_end, pos_end - delta)
+        text = self._get_text_range(start, old_end + delta)
+        if self._record_undo:
+            self._undo.record(start, self._doc.substring(start, old_end), text, msg in (WM_CHAR, WM_KEYDOWN))
+        self._doc.replace(start, old_end, text)
+        self._columns.invalidate()
+        self._snapshot = None
+        self._pagination = None
+        self._incremental = None
+        for tracker in trackers:
+            tracker.edited(start, old_end, old_end + delta)
+
+    ########################################
+    # Returns the specified range of the text (in viewer mode: of the loaded pages)
+    ########################################
+    def _get_text(self, start=0, end=None):
+        if self._view:
+            text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0)
+            return self._get_text_range(start, text_len if end is None else min(end, text_len))
+        return self._doc.substring(start, len(self._doc) if end is None else end)
+
+    ########################################
+    # Returns the specified range of the text, read directly from the Edit control's buffer.
+    # Like the buffer, the result counts UTF-16 code units: surrogate pairs are kept as two chars
+    # (and a pair cut at the range's borders as lone surrogates), so its offsets match the
+    # Edit control's.
+    ########################################
+    def _get_text_range(self, start, end):
+        hmem = self.edit.send_message(EM_GETHANDLE, 0, 0)
+        ptr = kernel32.LocalLock(hmem)
+        try:
+            return to_utf16_units(string_at(ptr + start * 2, (end - start) * 2).decode('utf-16-le', 'surrogatepass'))
+        finally:
+            kernel32.LocalUnlock(hmem)
 
     ########################################
     #
     ########################################
     def _check_if_text_selected(self):
-        char_pos_start = DWORD()
-        char_pos_end = DWORD()
-        self.edit.send_message(EM_GETSEL, byref(char_pos_start), byref(char_pos_end))
+        char_pos_start, char_pos_end = self._get_sel()
         # enable/disable menu items
-        flag = MF_BYCOMMAND | (MF_ENABLED if char_pos_end.value > char_pos_start.value else MF_GRAYED)
-        for item_id in (IDM_CUT, IDM_COPY):
-            user32.EnableMenuItem(self.hmenu, item_id, flag)
+        self._enable_menu_items((IDM_CUT, IDM_COPY), char_pos_end > char_pos_start)
 
     ########################################
     #
@@ -1011,14 +1872,40 @@ class App(MainWin):
         user32.GetMenuStringW(self.hmenu, self._eol_mode_id, buf, 24, MF_BYCOMMAND)
         self.statusbar.set_text(buf.value, STATUSBAR_PART_EOL)
 
+    ########################################
+    #
+    ########################################
+    def action_toggle_trim_whitespace(self):
+        self._trim_whitespace = not self._trim_whitespace
+        user32.CheckMenuItem(self.hmenu, IDM_TRIM_WHITESPACE,
+            MF_BYCOMMAND | (MF_CHECKED if self._trim_whitespace else MF_UNCHECKED))
+
+    ########################################
+    #
+    ########################################
+    def action_toggle_final_newline(self):
+        self._final_newline = not self._final_newline
+        user32.CheckMenuItem(self.hmenu, IDM_FINAL_NEWLINE,
+            MF_BYCOMMAND | (MF_CHECKED if self._final_newline else MF_UNCHECKED))
+
     ########################################
     #
     ########################################
     def action_set_tab_size(self, tab_size_id):
+        self._default_tab_size = TAB_SIZES[tab_size_id]
+        self._set_tab_size(self._default_tab_size)
+
+    ########################################
+    #
+    ########################################
+    def _set_tab_size(self, tab_size):
+        if tab_size == self._tab_size:
+            return
         tab_size_id_old = list(TAB_SIZES.keys())[list(TAB_SIZES.values()).index(self._tab_size)]
         user32.CheckMenuItem(self.hmenu, tab_size_id_old, MF_BYCOMMAND | MF_UNCHECKED)
-        user32.CheckMenuItem(self.hmenu, tab_size_id, MF_BYCOMMAND | MF_CHECKED)
-        self._tab_size = list(TAB_SIZES.values())[list(TAB_SIZES.keys()).index(tab_size_id)]
+        user32.CheckMenuItem(self.hmenu, list(TAB_SIZES.keys())[list(TAB_SIZES.values()).index(tab_size)],
+            MF_BYCOMMAND | MF_CHECKED)
+        self._tab_size = tab_size
         self.edit.send_message(EM_SETTABSTOPS, 1, byref(UINT(self._tab_size * 4)))
         self._calculate_char_width()
 
@@ -1029,10 +1916,14 @@ class App(MainWin):
         if not self._handle_dirty():
             user32.SetFocus(self.edit.hwnd)
             return
+        self._close_view()
         self._filename = None
         self._is_dirty = False
-        self._saved_text_len = 1
-        self._saved_text = ''
+        self._doc = PieceTable()
+        self._dirty = DirtyTracker()
+        self._undo.clear()
+        self._enable_menu_items((IDM_UNDO, IDM_REDO), False)
+        self._set_indentation(None, None)
 
         self._show_caret_pos()
 
@@ -1047,7 +1938,7 @@ class App(MainWin):
         self.statusbar.set_text(buf.value, STATUSBAR_PART_ENCODING)
 
         self.edit.send_message(WM_SETTEXT, 0, create_unicode_buffer(''))
-        self.set_window_text(self._get_caption())
+        self._update_caption()
         user32.SetFocus(self.edit.hwnd)
 
     ########################################
@@ -1073,31 +1964,24 @@ class App(MainWin):
     ########################################
     #
     ########################################
-    def action_save(self):
+    def action_save(self, background=True):
         if not self._filename:
-            return self.action_save_as()
-        if not self._save_file(self._filename):
-            return False
-        self._is_dirty = False
-        self.set_window_text(self._get_caption())
-        return True
+            return self.action_save_as(background)
+        return self._save_file(self._filename, background)
 
     ########################################
     #
     ########################################
-    def action_save_as(self):
+    def action_save_as(self, background=True):
         filename = self.get_save_filename(
             tr('Save As'),
             '.txt',
             tr('Text Documents') + ' (*.txt)\0*.txt\0' + tr('All Files') + ' (*.*)\0*.*\0\0',
             self._filename if self._filename else ''
         )
-        if not filename or not self._save_file(filename):
+        if not filename:
             return False
-        self._filename = filename
-        self._is_dirty = False
-        self.set_window_text(self._get_caption())
-        return True
+        return self._save_file(filename, background)
 
     ########################################
     #
@@ -1113,23 +1997,125 @@ class App(MainWin):
             self._print_paper_size = [psd.ptPaperSize.x, psd.ptPaperSize.y]
             self._print_margins = [psd.rtMargin.left, psd.rtMargin.top, psd.rtMargin.right, psd.rtMargin.bottom]
 
+    ########################################
+    # Creates the print font for a device with the specified vertical resolution
+    ########################################
+    def _create_print_font(self, dpi_y):
+        font_name, font_size, font_weight, font_italic = self._font
+        cHeight = -kernel32.MulDiv(font_size, dpi_y, 72)
+        return gdi32.CreateFontW(cHeight, 0, 0, 0, font_weight, font_italic, FALSE, FALSE, ANSI_CHARSET, OUT_TT_PRECIS,
+                CLIP_DEFAULT_PRECIS, DEFAULT_QUALITY, DEFAULT_PITCH | FF_DONTCARE, font_name)
+
+    ########################################
+    # Selects the print font into hdc (a printer DC) and returns (hfont, page_size, rc,
+    # pagination): page_size is the paper size and rc the rectangle to render the text in,
+    # both in device pixels. The pagination is reused as long as the text, font, paper,
+    # margins and resolution stay the same, it's only measured once.
+    ########################################
+    def _paginate(self, hdc):
+        dpi_x = gdi32.GetDeviceCaps(hdc, LOGPIXELSX)
+        dpi_y = gdi32.GetDeviceCaps(hdc, LOGPIXELSY)
+        hfont = self._create_print_font(dpi_y)
+        gdi32.SelectObject(hdc, hfont)
+
+        # page size in logical units, rc is the rectangle to render the text in (which will,
+        # of course, fit within the page)
+        page_size = (round(self._print_paper_size[0] * dpi_x * INCHES_PER_UNIT),
+                round(self._print_paper_size[1] * dpi_x * INCHES_PER_UNIT))
+        left, top, right, bottom = (round(margin * dpi_x * INCHES_PER_UNIT) for margin in self._print_margins)
+        rc = RECT(left, top, page_size[0] - right, page_size[1] - bottom)
+
+        width = rc.right - rc.left
+        def _measure(line):
+            return user32.DrawTextW(hdc, line if line else ' ', -1, byref(RECT(0, 0, width, 0)), DT_CALCRECT | DT_WORDBREAK)
+
+        if self._view:
+            lines = self._get_text().split('\r\n')
+            line_count, line_text = len(lines), lines.__getitem__
+        else:
+            line_count, line_text = self._doc.line_count(), self._doc.line_text
+        key = (self._doc, tuple(self._font), tuple(self._print_paper_size), tuple(self._print_margins),
+                dpi_x, dpi_y)
+        pagination = self._pagination
+        if pagination is None or pagination.key != key or self._view:
+            # lines that fit into the width even if each char was the widest one can't wrap
+            tm = TEXTMETRICW()
+            gdi32.GetTextMetricsW(hdc, byref(tm))
+            pagination = Pagination(line_count, line_text, _measure, rc.bottom - rc.top,
+                    tm.tmHeight, width // max(1, tm.tmMaxCharWidth), key)
+            self._pagination = pagination
+        # the layout is the same for this DC, so it can continue where the cached one stopped
+        pagination.measure = _measure
+        return hfont, page_size, rc, pagination
+
+    ########################################
+    # Draws the specified lines into rc
+    ########################################
+    def _draw_page(self, hdc, rc, line_text, lines):
+        top = rc.top
+        for i in lines:
+            line = line_text(i)
+            top += user32.DrawTextW(
+                hdc,
+                line if line else '\r',
+                -1,
+                byref(RECT(rc.left, top, rc.right, rc.bottom)),
+                DT_WORDBREAK if line else DT_SINGLELINE
+            )
+
+    ########################################
+    # Draws the current page of the print preview, scaled to fit into rc_item of the preview
+    # control. The text is drawn in printer pixels, which are mapped to the screen.
+    ########################################
+    def _draw_preview(self, hdc, rc_item):
+        hdc_printer, (page_width, page_height), rc, pagination, page = self._preview
+        gdi32.SetDCBrushColor(hdc, PREVIEW_BG_COLOR)
+        user32.FillRect(hdc, byref(rc_item), gdi32.GetStockObject(DC_BRUSH))
+
+        width, height = rc_item.right - rc_item.left, rc_item.bottom - rc_item.top
+        scale = min((width - 2 * PREVIEW_MARGIN) / page_width, (height - 2 * PREVIEW_MARGIN) / page_height)
+        w, h = max(1, round(page_width * scale)), max(1, round(page_height * scale))
+        x, y = rc_item.left + (width - w) // 2, rc_item.top + (height - h) // 2
+        gdi32.SetDCBrushColor(hdc, 0xFFFFFF)
+        user32.FillRect(hdc, byref(RECT(x, y, x + w, y + h)), gdi32.GetStockObject(DC_BRUSH))
+
+        saved = gdi32.SaveDC(hdc)
+        gdi32.SetMapMode(hdc, MM_ANISOTROPIC)
+        gdi32.SetWindowExtEx(hdc, page_width, page_height, None)
+        gdi32.SetViewportExtEx(hdc, w, h, None)
+        gdi32.SetViewportOrgEx(hdc, x, y, None)
+        hfont = self._create_print_font(gdi32.GetDeviceCaps(hdc_printer, LOGPIXELSY))
+        gdi32.SelectObject(hdc, hfont)
+        gdi32.SetBkMode(hdc, TRANSPARENT)
+        gdi32.SetTextColor(hdc, 0)
+        self._draw_page(hdc, rc, pagination.line_text, pagination.page_lines(page))
+        gdi32.RestoreDC(hdc, saved)
+        gdi32.DeleteObject(hfont)
+
     ########################################
     #
     ########################################
     def action_print(self):
-        print_paper_size = POINT(*self._print_paper_size)
-        print_margins = RECT(*self._print_margins)
-
         pdlg = PRINTDLGW()
         # hwndOwner = 0 : legacy dialog
         # hwndOwner = desktop hwnd: slightly more modern dialog (non-UWP)
         # hwndOwner = self.hwnd: modern UWP dialog, but dialog only shown for the first time
         pdlg.hwndOwner = user32.GetDesktopWindow()
+
+        # paginate for the default printer first, so the dialog can show the exact page range
+        page_count = 0
+        pdlg.Flags = PD_RETURNDC | PD_RETURNDEFAULT
+        if comdlg32.PrintDlgW(byref(pdlg)):
+            hfont, _, _, pagination = self._paginate(pdlg.hDC)
+            page_count = min(pagination.page_count(), 0xffff)
+            gdi32.DeleteDC(pdlg.hDC)
+            gdi32.DeleteObject(hfont)
+
         pdlg.Flags = PD_RETURNDC | PD_USEDEVMODECOPIES | PD_NOSELECTION  # | PD_PRINTSETUP
         pdlg.nFromPage = 1
-        pdlg.nToPage = 1
+        pdlg.nToPage = page_count or 1
         pdlg.nMinPage = 1
-        pdlg.nMaxPage = 0xffff
+        pdlg.nMaxPage = page_count or 0xffff
         pdlg.nStartPage = 0XFFFFFFFF  # START_PAGE_GENERAL
         if not comdlg32.PrintDlgW(byref(pdlg)):
             return False
@@ -1142,72 +2128,22 @@ class App(MainWin):
         if job_id <= 0:
             return False
 
-        # Get printer resolution
-        pt_dpi = POINT()
-        pt_dpi.x = gdi32.GetDeviceCaps(hdc, LOGPIXELSX)
-        pt_dpi.y = gdi32.GetDeviceCaps(hdc, LOGPIXELSY)
-
-        font_name, font_size, font_weight, font_italic = self._font
-        cHeight = -kernel32.MulDiv(font_size, pt_dpi.y, 72)
-        hfont = gdi32.CreateFontW(cHeight, 0, 0, 0, font_weight, font_italic, FALSE, FALSE, ANSI_CHARSET, OUT_TT_PRECIS,
-                CLIP_DEFAULT_PRECIS, DEFAULT_QUALITY, DEFAULT_PITCH | FF_DONTCARE, font_name)
-        gdi32.SelectObject(hdc, hfont)
-
-        # Set page rect in logical units, rcPage is the rectangle {0, 0, maxX, maxY} where
-        # maxX+1 and maxY+1 are the number of physically printable pixels in x and y.
-        # rc is the rectangle to render the text in (which will, of course, fit within the
-        # rectangle defined by rcPage).
-        rcPage = RECT()
-        rcPage.top = 0
-        rcPage.left = 0
-        rcPage.right = round(print_paper_size.x * pt_dpi.x * INCHES_PER_UNIT)
-        rcPage.bottom = round(print_paper_size.y * pt_dpi.x * INCHES_PER_UNIT)
-
-        rc = RECT()
-        rc.left = round(print_margins.left * pt_dpi.x * INCHES_PER_UNIT)
-        rc_top = rc.top = round(print_margins.top * pt_dpi.x * INCHES_PER_UNIT)
-        rc.right = rcPage.right - round(print_margins.right * pt_dpi.x * INCHES_PER_UNIT)
-        rc_bottom = rc.bottom = rcPage.bottom - round(print_margins.bottom * pt_dpi.x * INCHES_PER_UNIT)
-
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        lines = text_buf.value.split('\r\n')
-
+        # the pagination of the default printer is reused, unless another one was selected
+        hfont, _, rc, pagination = self._paginate(hdc)
         if pdlg.Flags & PD_PAGENUMS:
             first_page, last_page = pdlg.nFromPage, pdlg.nToPage
         else:
-            first_page, last_page = 1, 0xffffffff
-
-        # print with word wrap
-        success = gdi32.StartPage(hdc)
-        if success:
-            page = 1
-            for line in lines:
-                h = user32.DrawTextW(hdc, line if line else ' ', -1, byref(RECT(rc.left, 0, rc.right, 0)), DT_CALCRECT | DT_WORDBREAK)
-
-                if rc.top + h > rc_bottom:
-                    page += 1
-                    if page > last_page:
-                        break
-                    elif page > first_page:
-                        gdi32.EndPage(hdc)
-                        gdi32.StartPage(hdc)
-                    rc.top = rc_top
-
-                if page < first_page:
-                    rc.top += h
-                    continue
-
-                h = user32.DrawTextW(
-                    hdc,
-                    line if line else '\r',
-                    -1,
-                    byref(rc),
-                    DT_WORDBREAK if line else DT_SINGLELINE
-                )
-                rc.top += h
-
+            first_page, last_page = 1, pagination.page_count()
+
+        success = True
+        for page in range(first_page, last_page + 1):
+            lines = pagination.page_lines(page)
+            if not lines and page > 1:
+                break
+            success = gdi32.StartPage(hdc) > 0
+            if not success:
+                break
+            self._draw_page(hdc, rc, pagination.line_text, lines)
             gdi32.EndPage(hdc)
 
         if success:
@@ -1216,12 +2152,44 @@ class App(MainWin):
             gdi32.AbortDoc(hdc)
 
         gdi32.DeleteDC(hdc)
+        gdi32.DeleteObject(hfont)
+
+    ########################################
+    # Shows the pages as they will be printed on the default printer
+    ########################################
+    def action_print_preview(self):
+        pdlg = PRINTDLGW()
+        pdlg.Flags = PD_RETURNDC | PD_RETURNDEFAULT
+        if not comdlg32.PrintDlgW(byref(pdlg)):
+            return
+        hfont, page_size, rc, pagination = self._paginate(pdlg.hDC)
+        self._preview = [pdlg.hDC, page_size, rc, pagination, 1]
+        try:
+            res = self.dialog_show_sync(self.dialog_print_preview)
+        finally:
+            self._preview = None
+            gdi32.DeleteDC(pdlg.hDC)
+            gdi32.DeleteObject(hfont)
+        if res == 1:
+            self.action_print()
+        else:
+            user32.SetFocus(self.edit.hwnd)
 
     ########################################
     #
     ########################################
     def action_undo(self):
-        self.edit.send_message(EM_UNDO, 0, 0)
+        deltas = self._undo.undo()
+        if deltas:
+            self._undo_deltas(deltas)
+
+    ########################################
+    #
+    ########################################
+    def action_redo(self):
+        deltas = self._undo.redo()
+        if deltas:
+            self._undo_deltas(deltas)
 
     ########################################
     #
@@ -1251,7 +2219,7 @@ class App(MainWin):
                     txt = txt.replace('\n', '\r\n')
                 elif '\r' in txt and not '\n' in txt:
                     txt = txt.replace('\r', '\r\n')
-                self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(txt))
+                self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(txt))
         finally:
             user32.CloseClipboard()
 
@@ -1293,19 +2261,40 @@ class App(MainWin):
             user32.SendMessageW(self.dialog_find.hwnd, WM_CLOSE, 0, 0)
         self.dialog_show_async(self.dialog_replace)
 
+    ########################################
+    #
+    ########################################
+    def action_find_in_files(self):
+        if self.dialog_find_files.hwnd:
+            user32.SetActiveWindow(self.dialog_find_files.hwnd)
+            return
+        self.dialog_show_async(self.dialog_find_files)
+
+    ########################################
+    # Opens the Find in Files dialog with the focus in "Replace with"
+    ########################################
+    def action_replace_in_files(self):
+        if not self.dialog_find_files.hwnd:
+            self.dialog_show_async(self.dialog_find_files)
+        user32.SetActiveWindow(self.dialog_find_files.hwnd)
+        user32.SetFocus(user32.GetDlgItem(self.dialog_find_files.hwnd, ID_EDIT_REPLACE))
+
     ########################################
     #
     ########################################
     def action_go_to(self):
         line_goto = self.dialog_show_sync(self.dialog_goto)
-        if line_goto > 0:
-            total_lines = self.edit.send_message(EM_GETLINECOUNT, 0, 0)
-            if line_goto > total_lines:
+        if line_goto > 0 and self._view:
+            offset = self._view.line_offset(line_goto - 1)
+            if offset is None:
+                self.show_message_box(tr('GOTO_BEYOND'), APP_NAME + ' - ' + tr('Goto Line'))
+            else:
+                self._view_select(offset)
+        elif line_goto > 0:
+            pos = self._doc.line_offset(line_goto - 1)
+            if pos is None:
                 self.show_message_box(tr('GOTO_BEYOND'), APP_NAME + ' - ' + tr('Goto Line'))
             else:
-                if line_goto == 0:
-                    line_goto = 1
-                pos = self.edit.send_message(EM_LINEINDEX, line_goto - 1, 0)
                 self.edit.send_message(EM_SETSEL, pos, pos)
         user32.SetFocus(self.edit.hwnd)
 
@@ -1321,7 +2310,7 @@ class App(MainWin):
     ########################################
     def action_insert_time_date(self):
         date_str = time.strftime('%X %x')
-        self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(date_str))
+        self.edit.send_message(EM_REPLACESEL, FALSE, create_unicode_buffer(date_str))
 
     ########################################
     #
@@ -1385,14 +2374,10 @@ class App(MainWin):
 
         user32.CheckMenuItem(self.hmenu, IDM_WORD_WRAP,
             MF_BYCOMMAND | (MF_CHECKED if self._word_wrap else MF_UNCHECKED))
-        user32.EnableMenuItem(self.hmenu, IDM_GO_TO,
-            MF_BYCOMMAND | (MF_ENABLED if not self._word_wrap else MF_GRAYED))
+        self._enable_menu_items((IDM_GO_TO,), not self._word_wrap)
 
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        pos_start, pos_end = DWORD(), DWORD()
-        self.edit.send_message(EM_GETSEL, byref(pos_start), byref(pos_end))
+        text = self._get_text()
+        pos_start, pos_end = self._get_sel()
 
         style = user32.GetWindowLongA(self.edit.hwnd, GWL_STYLE)
         if self._word_wrap:
@@ -1405,9 +2390,11 @@ class App(MainWin):
         self._create_edit()
         if self._dark_mode:
             self.edit.apply_theme(self._dark_mode)
+        if self._view:
+            self.edit.send_message(EM_SETREADONLY, TRUE, 0)
 
-        self.edit.send_message(WM_SETTEXT, 0, byref(text_buf))
-        self.edit.send_message(EM_SETSEL, pos_start.value, pos_end.value)
+        self.edit.send_message(WM_SETTEXT, 0, text)
+        self.edit.send_message(EM_SETSEL, pos_start, pos_end)
 
         rc = self.get_client_rect()
         width = rc.right - rc.left
@@ -1455,35 +2442,17 @@ class App(MainWin):
     #
     ########################################
     def action_toggle_use_spaces(self):
-        self._use_spaces = not self._use_spaces
+        self._use_spaces = self._default_use_spaces = not self._use_spaces
         user32.CheckMenuItem(self.hmenu, IDM_TABS_AS_SPACES,
             MF_BYCOMMAND | (MF_CHECKED if self._use_spaces else MF_UNCHECKED))
 
-        # fix indentation accordingly
-        text_len = self.edit.send_message(WM_GETTEXTLENGTH, 0, 0) + 1
-        text_buf = create_unicode_buffer(text_len)
-        self.edit.send_message(WM_GETTEXT, text_len, text_buf)
-        lines = text_buf.value.split('\r\n')
-        fixed = False
-        if self._use_spaces:
-            tab_new = ' ' * self._tab_size
-            for i, line in enumerate(lines):
-                num_tabs = len(line) - len(line.lstrip('\t'))
-                if num_tabs:
-                    lines[i] = tab_new * num_tabs + lines[i][num_tabs:]
-                    fixed = True
-        else:
-            for i, line in enumerate(lines):
-                num_tabs = (len(line) - len(line.lstrip(' '))) // self._tab_size
-                if num_tabs:
-                    lines[i] = '\t' * num_tabs + lines[i][num_tabs * self._tab_size:]
-                    fixed = True
-
-        if fixed:
-            txt_new = '\r\n'.join(lines)
-            self.edit.send_message(EM_SETSEL, 0, -1)
-            self.edit.send_message(EM_REPLACESEL, 1, create_unicode_buffer(txt_new))
-            self._check_caret_pos()
+        if self._view:
+            return
+
+        # fix indentation accordingly, each changed indentation is an undo delta
+        deltas = list(iter_indent_deltas(self._doc, self._tab_size, self._use_spaces))
+        if deltas:
+            self._replace_ranges(deltas)
 
     ########################################
     #
@@ -1503,5 +2472,7 @@ class App(MainWin):
 
 
 if __name__ == "__main__":
+    # Find in Files runs worker processes, which in the frozen app are started as this exe
+    multiprocessing.freeze_support()
     app = App(sys.argv[1:])
     sys.exit(app.run())
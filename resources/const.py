@@ -7,9 +7,13 @@ IDM_SAVE = 3
 IDM_SAVE_AS = 4
 IDM_PAGE_SETUP = 5
 IDM_PRINT = 6
+IDM_PRINT_PREVIEW = 11
 IDM_EXIT = 7
+IDM_TRIM_WHITESPACE = 9
+IDM_FINAL_NEWLINE = 10
 # Edit
 IDM_UNDO = 16
+IDM_REDO = 30
 IDM_CUT = 768
 IDM_COPY = 769
 IDM_PASTE = 770
@@ -17,6 +21,8 @@ IDM_FIND = 21
 IDM_FIND_NEXT = 22
 IDM_FIND_PREVIOUS = 29
 IDM_REPLACE = 23
+IDM_FIND_IN_FILES = 31
+IDM_REPLACE_IN_FILES = 37
 IDM_GO_TO = 24
 IDM_SELECT_ALL = 25
 IDM_TIME_DATE = 26
@@ -53,15 +59,33 @@ ID_CANCEL = 2
 # Dialog Find
 ID_MATCH_CASE = 1041
 ID_WRAP_AROUND = 1042
+ID_REGEX = 1043
 ID_DIRECTION = 1072
 ID_UP = 1056
 ID_DOWN = 1057
 ID_EDIT_FIND = 1152
+ID_MATCH_COUNT = 1044
 
 # Dialog Replace
 ID_REPLACE = 1024
 ID_REPLACE_ALL = 1025
 ID_EDIT_REPLACE = 1153
 
+# Dialog Find (and Replace) in Files
+ID_STOP = 1045
+ID_RESULTS = 1046
+ID_FIND_FILES_STATUS = 1047
+ID_DRY_RUN = 1048
+ID_USE_INDEX = 1049
+ID_EDIT_FOLDER = 1154
+ID_EDIT_INCLUDE = 1155
+ID_EDIT_EXCLUDE = 1156
+
 # Dialog Goto
 ID_EDIT_GOTO = 258
+
+# Dialog Print Preview
+ID_PREVIEW = 1050
+ID_PREVIOUS_PAGE = 1051
+ID_NEXT_PAGE = 1052
+ID_PREVIEW_STATUS = 1053
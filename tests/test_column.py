@@ -0,0 +1,65 @@
+import pytest
+
+from textlib.column import ColumnCache, text_column
+from textlib.piecetable import PieceTable
+
+
+def expanded_len(text, tab_size):
+    return len(text.expandtabs(tab_size))
+
+
+@pytest.mark.parametrize('text', ['', 'abc', '\t', 'a\tb', 'abcd\t', '\t\tx', 'ab\tcd\tefghij\tk', '        \t'])
+@pytest.mark.parametrize('tab_size', [1, 2, 4, 8])
+def test_text_column(text, tab_size):
+    assert text_column(text, tab_size) == expanded_len(text, tab_size)
+
+
+def test_line_column():
+    doc = PieceTable('abc\r\n\tx\ty\r\n\r\nlast')
+    cache = ColumnCache()
+    assert cache.line_column(doc, 0, 4) == (0, 0)
+    assert cache.line_column(doc, 3, 4) == (0, 3)
+    assert [cache.line_column(doc, pos, 4) for pos in range(5, 10)] == [(1, 0), (1, 4), (1, 5), (1, 8), (1, 9)]
+    assert cache.line_column(doc, 11, 4) == (2, 0)
+    assert cache.line_column(doc, 17, 4) == (3, 4)
+    assert cache.line_column(doc, 8, 8) == (1, 16)
+
+
+def test_all_positions_match_expanded_text():
+    text = 'int main()\r\n{\r\n\tif (x)\t// c\r\n\t\treturn\t1;\r\n}\r\n\t'
+    doc = PieceTable(text)
+    cache = ColumnCache()
+    for tab_size in (2, 4, 8):
+        # forwards and backwards, so the cached line is reused and reloaded
+        for pos in list(range(len(text) + 1)) + list(range(len(text), -1, -1)):
+            line = text.count('\n', 0, pos)
+            start = text.rfind('\n', 0, pos) + 1
+            assert cache.line_column(doc, pos, tab_size) == (line, expanded_len(text[start:pos], tab_size))
+
+
+def test_cache_reuses_line():
+    class CountingDoc(PieceTable):
+        loads = 0
+
+        def line_text(self, line):
+            self.loads += 1
+            return super().line_text(line)
+
+    doc = CountingDoc('a\tb\tc\r\nd')
+    cache = ColumnCache()
+    for pos in range(6):
+        cache.line_column(doc, pos, 4)
+    assert doc.loads == 1
+    cache.line_column(doc, 7, 4)
+    cache.line_column(doc, 2, 8)
+    assert doc.loads == 3
+
+
+def test_invalidate_after_edit():
+    doc = PieceTable('a\tb')
+    cache = ColumnCache()
+    assert cache.line_column(doc, 3, 4) == (0, 5)
+    doc.replace(0, 1, 'abcd')
+    cache.invalidate()
+    assert cache.line_column(doc, 3, 4) == (0, 3)
+    assert cache.line_column(doc, 6, 4) == (0, 9)
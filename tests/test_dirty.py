@@ -0,0 +1,89 @@
+import random
+
+from textlib.dirty import DIRTY_BLOCK_SIZE, DirtyTracker, block_hashes
+
+
+class Doc(object):
+
+    def __init__(self, text):
+        self.text = text
+        self.tracker = DirtyTracker(len(text), block_hashes(text))
+        self.reads = 0
+
+    def replace(self, start, end, new):
+        self.text = self.text[:start] + new + self.text[end:]
+        self.tracker.edited(start, end, start + len(new))
+
+    def get_text(self, start, end):
+        self.reads += end - start
+        return self.text[start:end]
+
+    def is_dirty(self):
+        return self.tracker.is_dirty(len(self.text), self.get_text)
+
+
+def test_block_hashes():
+    text = 'x' * (DIRTY_BLOCK_SIZE * 2 + 1)
+    hashes = block_hashes(text)
+    assert len(hashes) == 3
+    assert hashes[0] == hashes[1] == hash('x' * DIRTY_BLOCK_SIZE) and hashes[2] == hash('x')
+    assert block_hashes(text + 'yyy', len(text)) == hashes
+    assert len(block_hashes('')) == 0
+
+
+def test_typing_back_to_saved_text():
+    doc = Doc('hello world')
+    assert not doc.is_dirty()
+    doc.replace(5, 5, '!')
+    assert doc.is_dirty()
+    doc.replace(5, 6, '')
+    assert not doc.is_dirty()
+    doc.replace(0, 1, 'H')
+    assert doc.is_dirty()
+    doc.replace(0, 1, 'h')
+    assert not doc.is_dirty()
+
+
+def test_same_length_change_is_dirty():
+    doc = Doc('abc' * DIRTY_BLOCK_SIZE)
+    doc.replace(DIRTY_BLOCK_SIZE * 2, DIRTY_BLOCK_SIZE * 2 + 1, 'x')
+    assert doc.is_dirty()
+
+
+def test_only_edited_blocks_are_rehashed():
+    doc = Doc('z' * DIRTY_BLOCK_SIZE * 1000)
+    pos = DIRTY_BLOCK_SIZE * 500 + 10
+    doc.replace(pos, pos, 'abc')
+    doc.replace(pos, pos + 3, '')
+    assert not doc.is_dirty()
+    assert doc.reads <= DIRTY_BLOCK_SIZE
+    doc.reads = 0
+    assert not doc.is_dirty()  # known to be clean
+    assert doc.reads == 0
+
+
+def test_invalidate():
+    doc = Doc('abc')
+    doc.tracker.invalidate(3)
+    assert not doc.is_dirty()
+    doc.text = 'abd'
+    doc.tracker.invalidate(3)
+    assert doc.is_dirty()
+
+
+def test_random_edits_match_comparison():
+    rnd = random.Random(8)
+    saved = ''.join(rnd.choice('ab\r\n') for _ in range(DIRTY_BLOCK_SIZE * 5 + 17))
+    doc = Doc(saved)
+    for _ in range(2000):
+        if doc.text != saved and rnd.random() < 0.1:
+            # revert the whole difference like undo would
+            start = 0
+            while start < min(len(saved), len(doc.text)) and saved[start] == doc.text[start]:
+                start += 1
+            doc.replace(start, len(doc.text), saved[start:])
+        else:
+            start = rnd.randrange(len(doc.text) + 1)
+            end = min(len(doc.text), start + rnd.randrange(3))
+            doc.replace(start, end, doc.text[start:end] if rnd.random() < 0.3 else rnd.choice(['', 'a', 'b\r\n']))
+        assert doc.is_dirty() == (doc.text != saved)
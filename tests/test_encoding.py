@@ -0,0 +1,144 @@
+import mmap
+import random
+
+import pytest
+
+from resources.const import *
+from textlib import encoding
+from textlib.encoding import SAMPLE_BLOCK_SIZE, SAMPLE_BLOCKS, _sample_blocks, detect_encoding, is_utf8, sniff_encoding
+
+
+def decodes(data):
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('data, valid', [
+    (b'', True),
+    (b'plain ASCII\r\n', True),
+    ('äöü €  \U0001F600'.encode(), True),
+    (b'\xC3', False),  # truncated
+    (b'ab\xE2\x82', False),
+    (b'\xF0\x9F\x98', False),
+    (b'\x80', False),  # continuation byte without lead byte
+    (b'\xC0\x80', False),  # overlong
+    (b'\xC1\xBF', False),
+    (b'\xE0\x80\xAF', False),
+    (b'\xF0\x80\x80\xAF', False),
+    (b'\xED\xA0\x80', False),  # surrogate
+    (b'\xF4\x90\x80\x80', False),  # above U+10FFFF
+    (b'\xF5\x80\x80\x80', False),
+    (b'\xFF', False),
+    (b'\xC3\x28', False),
+])
+def test_is_utf8(data, valid):
+    assert is_utf8(data) is valid
+    assert is_utf8(bytearray(data)) is valid
+    assert is_utf8(memoryview(data)) is valid
+
+
+def test_truncated_head_is_valid_if_not_final():
+    assert not is_utf8(b'abc\xE2\x82')
+    assert is_utf8(b'abc\xE2\x82', final=False)
+    assert not is_utf8(b'abc\xE2\x28', final=False)
+
+
+def test_sequences_across_chunks(monkeypatch):
+    monkeypatch.setattr(encoding, 'UTF8_CHUNK_SIZE', 7)
+    data = ('x' * 5 + 'ä€\U0001F600' * 3).encode() * 5
+    for i in range(len(data) + 1):
+        assert is_utf8(data[:i]) is decodes(data[:i])
+    assert not is_utf8(data + b'\xC3' + b'x' * 20)
+
+
+def test_matches_decoder_on_random_data():
+    rnd = random.Random(1)
+    pieces = [b'a', b'\r\n', 'ä'.encode(), '€'.encode(), '\U0001F600'.encode(), b'\x80', b'\xC3', b'\xED\xA0\x80']
+    for _ in range(500):
+        data = b''.join(rnd.choice(pieces) for _ in range(rnd.randrange(30)))
+        assert is_utf8(data) is decodes(data)
+
+
+def test_mmap(tmp_path):
+    filename = tmp_path / 'data.txt'
+    filename.write_bytes(b'x' * 0x10000 + 'ä'.encode() * 1000)
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert is_utf8(m)
+
+
+########################################
+# Huge data made of a repeated pattern, which counts the bytes that are read
+########################################
+class PatternData(object):
+
+    def __init__(self, pattern, size):
+        self.pattern = pattern
+        self.size = size
+        self.bytes_read = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self.pattern[key % len(self.pattern)]
+        start, stop, _ = key.indices(self.size)
+        offset = start % len(self.pattern)
+        n = max(0, stop - start)
+        self.bytes_read += n
+        return (self.pattern * ((offset + n) // len(self.pattern) + 1))[offset:offset + n]
+
+
+LATIN = 'Größenänderung der Fenster überprüfen\r\n' * 200
+
+
+@pytest.mark.parametrize('data, encoding_id', [
+    (b'', IDM_UTF_8),
+    (b'\xEF\xBB\xBFabc', IDM_UTF_8_BOM),
+    (b'\xFF\xFEa\x00', IDM_UTF_16_LE),
+    (b'\xFE\xFF\x00a', IDM_UTF_16_BE),
+    (b'plain ASCII\r\n' * 100, IDM_UTF_8),
+    (LATIN.encode(), IDM_UTF_8),
+    (LATIN.encode('utf-16-le'), IDM_UTF_16_LE),
+    (LATIN.encode('utf-16-be'), IDM_UTF_16_BE),
+    (LATIN.encode('cp1252'), IDM_ANSI),
+    (b'a\x00', IDM_UTF_16_LE),
+    (b'\x00a', IDM_UTF_16_BE),
+])
+def test_detect_encoding(data, encoding_id):
+    assert detect_encoding(data) == encoding_id
+    assert 0.5 <= sniff_encoding(data)[1] <= 1.0
+
+
+def test_confidence():
+    assert sniff_encoding(b'\xEF\xBB\xBFabc')[1] == 1.0
+    # fully checked small ASCII data is certain, but sampled ASCII isn't
+    assert sniff_encoding(b'abc')[1] == 1.0
+    assert sniff_encoding(b'abc' * 0x100000)[1] < 0.6
+    assert sniff_encoding(LATIN.encode() * 100)[1] >= 0.9
+
+
+def test_utf8_sequence_cut_at_sampled_block_start():
+    data = 'x€'.encode() * 0x40000
+    assert any(data[start] & 0xC0 == 0x80 for start, end in _sample_blocks(len(data)))
+    assert detect_encoding(data) == IDM_UTF_8
+
+
+@pytest.mark.parametrize('size', [0x1000, 0x10000, 0x100000, 0x40000000, 0x280000000])
+def test_sample_blocks(size):
+    blocks = _sample_blocks(size)
+    assert blocks == _sample_blocks(size)  # reproducible
+    assert blocks[0][0] == 0 and blocks[-1][1] == size
+    assert len(blocks) <= SAMPLE_BLOCKS
+    assert all(start % 2 == 0 for start, end in blocks)
+    assert all(a[1] <= b[0] for a, b in zip(blocks, blocks[1:]))
+
+
+@pytest.mark.parametrize('size', [10 * 0x400, 0x280000000])  # 10 KB - 10 GB
+def test_detection_cost_is_bounded(size):
+    data = PatternData(LATIN.encode('utf-16-le'), size)
+    assert detect_encoding(data) == IDM_UTF_16_LE
+    assert data.bytes_read <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE + 3
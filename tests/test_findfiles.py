@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+import re
+
+import pytest
+
+from resources.const import *
+from textlib import findfiles
+from textlib.encoding import ENCODINGS, detect_encoding
+from textlib.findfiles import (FIND_FILES_BATCH_FILES, FIND_FILES_BINARY_SAMPLE, FIND_FILES_MMAP_MIN, REPLACE_SKIPPED,
+        FindInFiles, ReplaceInFiles, byte_prefilter, decode_data, find_hits, is_binary, iter_files, replace_file,
+        replace_files, replace_template, search_files, search_pattern, split_globs)
+
+KELVIN = '\u212a'  # Kelvin sign
+# start of an executable, detected as UTF-16 because of its NUL bytes
+BINARY = b'\x7fELF\x02\x01\x01\0\0\0\0\0\0\0\0\0\x02\0>\0\x01\0\0\0find me\0'
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def run_search(search):
+    results = []
+    search.start(lambda batch: results.extend(batch or ()))
+    search.join()
+    return sorted((os.path.basename(filename), [hit[:3] for hit in hits]) for filename, hits in results)
+
+
+def test_split_globs():
+    assert split_globs(' *.py; *.txt ;;') == ['*.py', '*.txt']
+    assert split_globs('') == []
+
+
+def test_iter_files_globs(tmp_path):
+    for name in ('a.py', 'b.txt', 'sub/c.py', 'sub/d.log', '.git/e.py', 'node_modules/f.py'):
+        write(tmp_path / name, b'x')
+    found = lambda *args: [os.path.relpath(filename, str(tmp_path)).replace(os.sep, '/')
+            for filename, stat in iter_files(str(tmp_path), *args)]
+    assert found() == ['a.py', 'b.txt', '.git/e.py', 'node_modules/f.py', 'sub/c.py', 'sub/d.log']
+    assert found(['*.py']) == ['a.py', '.git/e.py', 'node_modules/f.py', 'sub/c.py']
+    # excluded folders are not entered
+    assert found(['*.py', '*.log'], ['.git', 'node_modules', 'c.*']) == ['a.py', 'sub/d.log']
+
+
+def test_is_binary():
+    assert is_binary(b'abc\0def', IDM_UTF_8)
+    assert not is_binary(b'abc def', IDM_UTF_8)
+    # NUL bytes after the sample are not checked
+    assert not is_binary(b'x' * FIND_FILES_BINARY_SAMPLE + b'\0', IDM_UTF_8)
+    # UTF-16 text has NUL bytes, but no NUL chars
+    assert not is_binary('abc'.encode('utf-16-le'), IDM_UTF_16_LE)
+    assert not is_binary('aĀā\u0100'.encode('utf-16-le'), IDM_UTF_16_LE)
+    assert not is_binary('aĀā\u0100'.encode('utf-16-be'), IDM_UTF_16_BE)
+    assert is_binary('a\0b'.encode('utf-16-le'), IDM_UTF_16_LE)
+    assert detect_encoding(BINARY) == IDM_UTF_16_LE and is_binary(BINARY, IDM_UTF_16_LE)
+
+
+def test_byte_prefilter():
+    assert byte_prefilter('needle') == b'needle'
+    assert byte_prefilter('needle', match_case=False) == b'needle'
+    assert byte_prefilter('need.e', regex=True) is None
+    assert byte_prefilter('Straße') is None
+    # these letters also match non-ASCII chars when ignoring case
+    for term in ('kilo', 'IS', 'ask'):
+        assert byte_prefilter(term) == term.encode()
+        assert byte_prefilter(term, match_case=False) is None
+
+
+def test_decode_data():
+    assert decode_data(b'') is None
+    assert decode_data(b'abc\0\0def') is None
+    assert decode_data(BINARY) is None
+    assert decode_data(b'a\nb') == ('a\r\nb', IDM_EOL_LF, IDM_UTF_8)
+    assert decode_data(b'\xFF\xFE' + 'a\0b'.encode('utf-16-le')) is None  # NUL char, not a NUL byte
+    assert decode_data(b'\xFF\xFE' + 'ab'.encode('utf-16-le')) == ('﻿ab', IDM_EOL_CRLF, IDM_UTF_16_LE)
+    # files without the prefilter's bytes are never decoded
+    assert decode_data(b'no match', b'needle') is None
+    assert decode_data(b'a NEEDLE', b'needle') is None
+    assert decode_data(b'a NEEDLE', b'needle', False) == ('a NEEDLE', IDM_EOL_CRLF, IDM_UTF_8)
+    # the prefilter only applies to ASCII compatible encodings
+    assert decode_data('needle'.encode('utf-16-le'), b'x') is not None
+
+
+def test_find_hits():
+    text = 'one\r\ntwo two\r\n\r\nthree two'
+    assert find_hits(text, search_pattern('two')) == [
+            (5, 3, 1, 'two two'), (9, 3, 1, 'two two'), (22, 3, 3, 'three two')]
+    long_line = 'x' * 1000 + 'two'
+    (hit,) = find_hits(long_line, search_pattern('two'))
+    assert hit[:3] == (1000, 3, 0) and hit[3] == 'x' * findfiles.FIND_FILES_LINE_MAX
+
+
+def test_search_files(tmp_path):
+    filenames = [
+        write(tmp_path / 'lf.txt', b'a\nfind me\n'),
+        write(tmp_path / 'utf16.txt', b'\xFF\xFE' + 'a\r\nfind me'.encode('utf-16-le')),
+        write(tmp_path / 'binary.bin', BINARY),
+        write(tmp_path / 'binary2.bin', b'find me\0' + bytes(range(256))),
+        write(tmp_path / 'big.txt', b'x' * FIND_FILES_MMAP_MIN + b'\nFind me'),  # memory-mapped
+        write(tmp_path / 'none.txt', b'nothing'),
+        str(tmp_path / 'missing.txt'),
+    ]
+    searched, results = search_files(filenames, 'find me')
+    assert searched == 7
+    assert [(os.path.basename(filename), [hit[:3] for hit in hits]) for filename, hits in results] == [
+            ('lf.txt', [(3, 7, 1)]), ('utf16.txt', [(4, 7, 1)])]
+    searched, results = search_files(filenames, 'FIND ME', match_case=False)
+    assert [os.path.basename(filename) for filename, hits in results] == ['lf.txt', 'utf16.txt', 'big.txt']
+    searched, results = search_files(filenames, r'f\w+d', regex=True)
+    assert len(results) == 2
+
+
+def test_search_files_non_ascii_case_variants(tmp_path):
+    # 'k' matches the Kelvin sign when ignoring case, so the ASCII prefilter must not skip the file
+    filename = write(tmp_path / 'kelvin.txt', '0 {}elvin'.format(KELVIN).encode())
+    assert search_files([filename], 'kelvin')[1] == []
+    (found, hits), = search_files([filename], 'kelvin', match_case=False)[1]
+    assert hits[0][:3] == (2, 6, 0)
+    (found, hits), = search_files([filename], 'ELVIN', match_case=False)[1]
+    assert hits[0][:3] == (3, 5, 0)
+
+
+def test_search_files_stops_when_cancelled(tmp_path, monkeypatch):
+    filenames = [write(tmp_path / 'a.txt', b'x'), write(tmp_path / 'b.txt', b'x')]
+    cancelled = multiprocessing.Event()
+    monkeypatch.setattr(findfiles, '_cancelled', cancelled)
+    assert search_files(filenames, 'x')[0] == 2
+    cancelled.set()
+    assert search_files(filenames, 'x') == (0, [])
+
+
+def test_find_in_files(tmp_path):
+    write(tmp_path / 'a.txt', b'hit\nmiss\nhit')
+    write(tmp_path / 'sub/b.py', b'no hit here')
+    write(tmp_path / 'sub/c.txt', b'miss')
+    write(tmp_path / 'skip/d.txt', b'hit')
+    write(tmp_path / 'e.bin', b'hit\0\0')
+    search = FindInFiles(str(tmp_path), 'hit', includes=['*.txt', '*.py', '*.bin'], excludes=['skip'], workers=1)
+    assert run_search(search) == [('a.txt', [(0, 3, 0), (11, 3, 2)]), ('b.py', [(3, 3, 0)])]
+    assert search.done and search.files_found == search.files_searched == 4
+    search = FindInFiles(str(tmp_path), 'hit', includes=['*.txt'], workers=1)
+    assert [name for name, hits in run_search(search)] == ['a.txt', 'd.txt']
+
+
+def test_find_in_files_invalid_regex(tmp_path):
+    with pytest.raises(re.error):
+        FindInFiles(str(tmp_path), '(', regex=True)
+
+
+def test_cancel_find_in_files(tmp_path):
+    for i in range(FIND_FILES_BATCH_FILES * 20):
+        write(tmp_path / 'f{:04}.txt'.format(i), b'hit')
+    search = FindInFiles(str(tmp_path), 'hit', workers=1)
+    calls = []
+
+    def callback(results):
+        calls.append(results)
+        search.cancel()
+
+    search.start(callback)
+    search.join()
+    assert search.done and search.cancelled and calls[-1] is None
+    # queued batches were dropped, the walk stopped early
+    assert search.files_searched < FIND_FILES_BATCH_FILES * 20
+    assert search.files_found < FIND_FILES_BATCH_FILES * 20
+
+
+def replace(filename, term, new, regex=False, match_case=True, dry_run=False):
+    return replace_file(filename, search_pattern(term, regex, match_case), replace_template(new, regex),
+            byte_prefilter(term, regex, match_case), match_case, dry_run)
+
+
+@pytest.mark.parametrize('bom, codec', [
+    (b'', 'utf-8'),
+    (b'\xEF\xBB\xBF', 'utf-8'),
+    (b'\xFF\xFE', 'utf-16-le'),
+    (b'\xFE\xFF', 'utf-16-be'),
+    (b'', 'utf-16-le'),
+])
+@pytest.mark.parametrize('eol', ['\r\n', '\n', '\r'])
+@pytest.mark.parametrize('size', [1, FIND_FILES_MMAP_MIN])  # read or memory-mapped
+def test_replace_changes_only_matches(tmp_path, bom, codec, eol, size):
+    line = 'foo bar Größe\tfood{}'.format(eol)
+    data = bom + (line * max(1, size // len(line))).encode(codec)
+    filename = write(tmp_path / 'file.txt', data)
+    assert replace(filename, 'foo', 'quux') == 2 * max(1, size // len(line))
+    # BOM, encoding and EOLs are kept, all other bytes are untouched
+    assert open(filename, 'rb').read() == data.replace('foo'.encode(codec), 'quux'.encode(codec))
+
+
+def test_replace_regex_backreference(tmp_path):
+    filename = write(tmp_path / 'file.txt', b'foo fooo\nbar\n')
+    assert replace(filename, r'f(o+)', r'<\1>', regex=True) == 2
+    assert open(filename, 'rb').read() == b'<oo> <ooo>\nbar\n'
+    assert replace(filename, r'^', '> ', regex=True) == 3
+    assert open(filename, 'rb').read() == b'> <oo> <ooo>\n> bar\n> '
+
+
+def test_replace_ignore_case(tmp_path):
+    filename = write(tmp_path / 'file.txt', 'Foo FOO {}ilo'.format(KELVIN).encode())
+    assert replace(filename, 'foo', 'x', match_case=False) == 2
+    assert replace(filename, 'kilo', 'k', match_case=False) == 1
+    assert open(filename, 'rb').read() == b'x x k'
+
+
+def test_dry_run_only_counts(tmp_path):
+    filename = write(tmp_path / 'file.txt', b'foo\nfoo foo\n')
+    mtime = os.stat(filename).st_mtime_ns
+    assert replace(filename, 'foo', 'bar', dry_run=True) == 3
+    assert replace(filename, 'nothing', 'bar', dry_run=True) == 0
+    assert open(filename, 'rb').read() == b'foo\nfoo foo\n'
+    assert os.stat(filename).st_mtime_ns == mtime
+
+
+def test_replace_skips_files_that_dont_round_trip(tmp_path, monkeypatch):
+    # the system codepage of a Japanese Windows: b'\x87\x90' is a duplicate of b'\x81\xe0',
+    # which is what the decoded char is encoded to, so the file would change elsewhere
+    monkeypatch.setitem(ENCODINGS, IDM_ANSI, 'cp932')
+    data = b'foo \x87\x90\r\n'
+    filename = write(tmp_path / 'file.txt', data)
+    assert replace(filename, 'foo', 'bar', dry_run=True) == 1
+    assert replace(filename, 'foo', 'bar') == REPLACE_SKIPPED
+    assert open(filename, 'rb').read() == data
+    # files that do round trip are replaced
+    write(tmp_path / 'file.txt', b'foo \x81\xe0\r\n')
+    assert replace(filename, 'foo', 'bar') == 1
+    assert open(filename, 'rb').read() == b'bar \x81\xe0\r\n'
+
+
+def test_replace_files(tmp_path, monkeypatch):
+    monkeypatch.setitem(ENCODINGS, IDM_ANSI, 'cp932')
+    filenames = [
+        write(tmp_path / 'a.txt', b'foo'),
+        write(tmp_path / 'b.txt', b'no match'),
+        write(tmp_path / 'c.bin', BINARY + b'foo'),
+        write(tmp_path / 'd.txt', b'foo \x87\x90'),
+        str(tmp_path / 'missing.txt'),
+    ]
+    searched, results = replace_files(filenames, 'foo', 'bar')
+    assert searched == 5
+    assert [(os.path.basename(filename), count, error is not None) for filename, count, error in results] == [
+            ('a.txt', 1, False), ('d.txt', REPLACE_SKIPPED, False), ('missing.txt', 0, True)]
+    assert open(filenames[2], 'rb').read() == BINARY + b'foo'
+
+
+def run_replace(replace):
+    results = []
+    replace.start(lambda batch: results.extend(batch or ()))
+    replace.join()
+    return sorted((os.path.basename(filename), count) for filename, count, error in results)
+
+
+def test_replace_in_files(tmp_path):
+    write(tmp_path / 'a.txt', b'foo\nfoo')
+    write(tmp_path / 'sub/b.py', b'foo')
+    write(tmp_path / 'skip/c.txt', b'foo')
+    args = str(tmp_path), 'foo', 'bar'
+    options = {'includes': ['*.txt', '*.py'], 'excludes': ['skip'], 'workers': 1}
+    assert run_replace(ReplaceInFiles(*args, dry_run=True, **options)) == [('a.txt', 2), ('b.py', 1)]
+    assert open(str(tmp_path / 'a.txt'), 'rb').read() == b'foo\nfoo'
+    replace = ReplaceInFiles(*args, **options)
+    assert run_replace(replace) == [('a.txt', 2), ('b.py', 1)]
+    assert replace.done and replace.files_searched == 2
+    assert open(str(tmp_path / 'a.txt'), 'rb').read() == b'bar\nbar'
+    assert open(str(tmp_path / 'sub/b.py'), 'rb').read() == b'bar'
+    assert open(str(tmp_path / 'skip/c.txt'), 'rb').read() == b'foo'
+
+
+def test_replace_in_files_invalid_backreference(tmp_path):
+    with pytest.raises(re.error):
+        ReplaceInFiles(str(tmp_path), 'a', r'\1', regex=True)
+    ReplaceInFiles(str(tmp_path), 'a', r'\1')  # literal
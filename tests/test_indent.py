@@ -0,0 +1,115 @@
+import random
+import re
+
+import pytest
+
+from textlib import indent
+from textlib.indent import (INDENT_SAMPLE_SIZE, INDENT_SAMPLES, _sample_blocks, detect_indentation, indent_block,
+        iter_indent_deltas, unindent_block)
+from textlib.piecetable import PieceTable
+from textlib.undo import apply_deltas
+
+
+########################################
+# Line by line conversion as a reference
+########################################
+def convert_lines(text, tab_size, use_spaces):
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if use_spaces:
+            indent = re.match('\t*', line).group()
+            lines[i] = ' ' * tab_size * len(indent) + line[len(indent):]
+        else:
+            indent = re.match(' *', line).group()
+            n = len(indent) // tab_size
+            lines[i] = '\t' * n + line[n * tab_size:]
+    return '\n'.join(lines)
+
+
+def test_indent_block():
+    assert indent_block('a\r\n\r\nb', '\t') == '\ta\r\n\t\r\n\tb'
+    assert indent_block('a\nb', '    ') == '    a\n    b'
+    assert unindent_block('\ta\r\n\t\tb\r\nc', '\t') == 'a\r\n\tb\r\nc'
+    assert unindent_block('    a\n  b', '    ') == 'a\n  b'
+
+
+@pytest.mark.parametrize('tab_size', [2, 4, 8])
+@pytest.mark.parametrize('use_spaces', [True, False])
+def test_indent_deltas(tab_size, use_spaces):
+    text = 'top\r\n\tone\r\n\t\ttwo\t\r\n' + ' ' * 9 + 'nine\r\n' + ' ' * 3 + '\tmixed\r\n\t' + ' ' * 5 + 'x\r\n\r\n    '
+    deltas = list(iter_indent_deltas(text, tab_size, use_spaces))
+    assert apply_deltas(text, deltas) == convert_lines(text, tab_size, use_spaces)
+    # only the indentations that change are touched
+    assert all(old != new and not old.strip(' \t') for offset, old, new in deltas)
+
+
+def test_indent_deltas_first_line():
+    assert list(iter_indent_deltas('\t\tx\n\ty', 4, True)) == [(0, '\t\t', ' ' * 8), (10, '\t', ' ' * 4)]
+    assert list(iter_indent_deltas('        x\n  y', 4, False)) == [(0, ' ' * 8, '\t\t')]
+    assert list(iter_indent_deltas('x\ny', 4, True)) == []
+
+
+def test_indent_deltas_round_trip():
+    rnd = random.Random(23)
+    text = '\r\n'.join('\t' * rnd.randrange(4) + rnd.choice(['if x:', 'pass', '', '# c\t']) for _ in range(300))
+    spaces = apply_deltas(text, list(iter_indent_deltas(text, 4, True)))
+    assert '\n\t' not in spaces and not spaces.startswith('\t')
+    assert apply_deltas(spaces, list(iter_indent_deltas(spaces, 4, False))) == text
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+@pytest.mark.parametrize('use_spaces', [True, False])
+def test_indent_deltas_in_chunks_of_piece_table(monkeypatch, chunk_size, use_spaces):
+    rnd = random.Random(chunk_size)
+    text = '\r\n'.join(rnd.choice(['\t', '    ']) * rnd.randrange(4) + rnd.choice(['x', '', '  y']) for _ in range(200))
+    expected = list(iter_indent_deltas(text, 4, use_spaces))
+    monkeypatch.setattr(indent, 'INDENT_CHUNK_SIZE', chunk_size)
+    doc = PieceTable(text)
+    doc.replace(10, 20, text[10:20])  # more than one piece
+    deltas = list(iter_indent_deltas(doc, 4, use_spaces))
+    assert deltas == expected
+    assert apply_deltas(text, deltas) == convert_lines(text, 4, use_spaces)
+
+
+def source(indent, lines=40):
+    return ''.join(indent * (i % 4) + 'line {}\r\n'.format(i) for i in range(lines))
+
+
+@pytest.mark.parametrize('text, result', [
+    (source('\t'), (False, None)),
+    (source('    '), (True, 4)),
+    (source('  '), (True, 2)),
+    (source(' ' * 8), (True, 8)),
+    (source('    ', lines=8), (None, None)),  # too few indented lines
+    (source('\t', 20) + source('    ', 20), (None, None)),  # as many tabs as spaces
+    ('x\r\n' * 100, (None, None)),
+    ('', (None, None)),
+])
+def test_detect_indentation(text, result):
+    assert detect_indentation(text) == result
+
+
+def test_detect_uses_most_common_step():
+    # continuation lines aligned to an opening parenthesis are outnumbered
+    text = ''.join('def f{}(a,\r\n      b):\r\n    if a:\r\n        return a\r\n\r\n'.format(i) for i in range(20))
+    assert detect_indentation(text) == (True, 4)
+
+
+def test_sample_blocks():
+    text = source('    ', 20000)
+    blocks = _sample_blocks(text)
+    assert len(text) > INDENT_SAMPLE_SIZE * INDENT_SAMPLES
+    assert len(blocks) == INDENT_SAMPLES
+    for start, end in blocks:
+        assert start == 0 or text[start - 1] == '\n'
+        assert text[end - 1] == '\n' and end - start <= INDENT_SAMPLE_SIZE
+    assert detect_indentation(text) == (True, 4)
+    assert _sample_blocks('short') == [(0, 5)]
+
+
+@pytest.mark.parametrize('text', [source('\t'), source('  '), source('    ', 20000), source('\t', 20000)])
+def test_detect_indentation_of_piece_table(text):
+    doc = PieceTable(text)
+    doc.replace(100, 200, text[100:200])
+    assert _sample_blocks(doc) == _sample_blocks(text)
+    assert detect_indentation(doc) == detect_indentation(text)
@@ -0,0 +1,85 @@
+import codecs
+
+import pytest
+
+from resources.const import *
+from textlib import ingest
+from textlib.ingest import decode_text, detect_eol, read_text_file, to_utf16_units
+
+
+def has_codec(name):
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize('data, eol_mode_id', [
+    ('', IDM_EOL_CRLF),
+    ('a', IDM_EOL_CRLF),
+    ('a\r\nb', IDM_EOL_CRLF),
+    ('a\nb\n', IDM_EOL_LF),
+    ('a\rb\r', IDM_EOL_CR),
+])
+def test_detect_eol(data, eol_mode_id):
+    assert detect_eol(data) == eol_mode_id
+    assert detect_eol(data.encode()) == eol_mode_id
+
+
+@pytest.mark.parametrize('data, result', [
+    (b'', ('', IDM_EOL_CRLF, IDM_UTF_8)),
+    (b'a\nb\n', ('a\r\nb\r\n', IDM_EOL_LF, IDM_UTF_8)),
+    (b'a\rb', ('a\r\nb', IDM_EOL_CR, IDM_UTF_8)),
+    (b'a\r\nb', ('a\r\nb', IDM_EOL_CRLF, IDM_UTF_8)),
+    ('ä\n€'.encode(), ('ä\r\n€', IDM_EOL_LF, IDM_UTF_8)),
+    (b'\xEF\xBB\xBFa\nb', ('a\r\nb', IDM_EOL_LF, IDM_UTF_8_BOM)),
+    # the UTF-16 BOM is kept as U+FEFF, so it's saved again
+    (b'\xFF\xFE' + 'a\nä'.encode('utf-16-le'), ('\ufeffa\r\nä', IDM_EOL_LF, IDM_UTF_16_LE)),
+    ('ab\ncd\n'.encode('utf-16-le'), ('ab\r\ncd\r\n', IDM_EOL_LF, IDM_UTF_16_LE)),
+    ('ab\ncd\n'.encode('utf-16-be'), ('ab\r\ncd\r\n', IDM_EOL_LF, IDM_UTF_16_BE)),
+])
+def test_decode_text(data, result, tmp_path):
+    assert decode_text(data) == result
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(data)
+    assert read_text_file(str(filename)) == result
+
+
+def test_mixed_eols_are_kept():
+    assert decode_text(b'a\nb\r\nc\rd') == ('a\nb\r\nc\rd', IDM_EOL_CRLF, IDM_UTF_8)
+
+
+def test_explicit_encoding(tmp_path):
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes('x\ny'.encode('utf-16-be'))
+    assert read_text_file(str(filename), IDM_UTF_16_BE) == ('x\r\ny', IDM_EOL_LF, IDM_UTF_16_BE)
+    with pytest.raises(UnicodeDecodeError):
+        decode_text(b'\xC3(', IDM_UTF_8)
+
+
+@pytest.mark.parametrize('encoding_id', [IDM_UTF_8, IDM_UTF_16_LE, IDM_UTF_16_BE])
+def test_chars_split_across_chunks(encoding_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'INGEST_CHUNK_SIZE', 5)
+    text = 'ab\nä€\U0001F600\n' * 20
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(text.encode(ingest.ENCODINGS[encoding_id]))
+    # the emoji is loaded as surrogate pair, like the Edit control stores it
+    assert read_text_file(str(filename), encoding_id) == (to_utf16_units(text.replace('\n', '\r\n')), IDM_EOL_LF, encoding_id)
+
+
+def test_crlf_split_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'INGEST_CHUNK_SIZE', 4)
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(b'abc\r\ndef\r\n' * 10)
+    assert read_text_file(str(filename)) == ('abc\r\ndef\r\n' * 10, IDM_EOL_CRLF, IDM_UTF_8)
+
+
+@pytest.mark.skipif(not has_codec('ansi'), reason='ANSI codec only exists on Windows')
+def test_invalid_utf8_falls_back_to_ansi(tmp_path):
+    # the invalid byte is in the middle, so it's only found by decoding if it isn't sampled
+    data = 'ä'.encode() * 0x20000 + b'\xE4' + 'ö'.encode() * 0x20000
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(data)
+    assert decode_text(data)[2] == IDM_ANSI
+    assert read_text_file(str(filename))[2] == IDM_ANSI
@@ -0,0 +1,98 @@
+import pytest
+
+from textlib.column import ColumnCache, text_column
+from textlib.indent import indent_block, unindent_block
+from textlib.piecetable import PieceTable
+from textlib.search import search_backward, search_forward, search_pattern
+from textlib.undo import UndoHistory, apply_deltas
+
+# the edits of each test are placed around the 16 bit limit, 1 M and 16 M chars
+LIMITS = (0x10000, 0x100000, 0x1000000)
+TEXT_LEN = 0x1100000
+LINE = 'some\ttext in a line\r\n'
+
+
+@pytest.fixture(scope='module')
+def text():
+    return (LINE * (TEXT_LEN // len(LINE) + 1))[:TEXT_LEN]
+
+
+def edit_offsets():
+    for limit in LIMITS:
+        yield from (limit - 1, limit, limit + 1, limit + 12345)
+
+
+def edited(text):
+    # the same edits applied to a PieceTable and (as reference) a str
+    doc = PieceTable(text)
+    doc.line_count()  # creates the line index, which is patched from then on
+    for i, pos in enumerate(edit_offsets()):
+        new = ('\tinserted {}\r\n'.format(i) * (i % 3)) + 'x'
+        doc.replace(pos, pos + i % 4, new)
+        text = text[:pos] + new + text[pos + i % 4:]
+    return doc, text
+
+
+def reference_line(text, pos):
+    line = text.count('\n', 0, pos)
+    start = text.rfind('\n', 0, pos) + 1
+    return line, start
+
+
+def test_piece_table_edits(text):
+    doc, ref = edited(text)
+    assert len(doc) == len(ref)
+    for pos in edit_offsets():
+        assert doc[pos - 20:pos + 20] == ref[pos - 20:pos + 20]
+        line, start = reference_line(ref, pos)
+        assert doc.line_from_offset(pos) == line
+        assert doc.line_offset(line) == start
+        end = ref.find('\r\n', pos)
+        assert doc.line_text(line) == ref[start:end]
+    assert doc.line_count() == ref.count('\n') + 1
+    assert str(doc) == ref
+
+
+def test_columns(text):
+    doc, ref = edited(text)
+    cache = ColumnCache()
+    for pos in edit_offsets():
+        line, start = reference_line(ref, pos)
+        for p in range(pos, min(pos + 8, ref.find('\n', pos) + 1)):
+            assert cache.line_column(doc, p, 8) == (line, text_column(ref[start:p], 8))
+
+
+def test_search(text):
+    doc, ref = edited(text)
+    for term in ('inserted 5', 'inserted 11'):
+        pos = ref.find(term)
+        assert pos > LIMITS[0]
+        assert search_forward(ref, search_pattern(term), LIMITS[0]).start() == doc.find(term, LIMITS[0]) == pos
+    m = search_backward(ref, search_pattern(r'inserted \d+$', regex=True))
+    assert m.start() == doc.rfind(m.group()) == ref.rfind('inserted') > LIMITS[2]
+
+
+def test_indent_and_undo_beyond_limits(text):
+    doc, ref = edited(text)
+    indented = ref
+    history = UndoHistory()
+    for limit in LIMITS:
+        line = doc.line_from_offset(limit)
+        start, end = doc.line_offset(line), doc.line_offset(line + 3) - 2
+        block = doc[start:end]
+        new = indent_block(block, '\t')
+        assert new == '\t' + block.replace('\r\n', '\r\n\t')
+        assert unindent_block(new, '\t') == block
+        history.record(start, block, new)
+        doc.replace(start, end, new)
+        indented = indented[:start] + new + indented[end:]
+    assert str(doc) == indented
+    while history.can_undo:
+        for offset, old, new in history.undo():
+            assert offset > LIMITS[0] - len(LINE)
+            assert doc[offset:offset + len(old)] == old
+            doc.replace(offset, offset + len(old), new)
+    assert str(doc) == ref
+    while history.can_redo:
+        ref = apply_deltas(ref, history.redo())
+    assert ref == indented
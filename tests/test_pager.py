@@ -0,0 +1,173 @@
+import random
+
+import pytest
+
+from resources.const import *
+from textlib import pager
+from textlib.pager import MappedFile
+from textlib.search import SearchSnapshot
+
+CODECS = {
+    IDM_UTF_8:      'utf-8',
+    IDM_UTF_16_LE:  'utf-16-le',
+    IDM_UTF_16_BE:  'utf-16-be',
+}
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(pager, 'PAGE_SIZE', 64)
+
+
+@pytest.fixture
+def open_file(tmp_path):
+    files = []
+    def _open(data, encoding_id=None):
+        filename = tmp_path / f'file{len(files)}.txt'
+        filename.write_bytes(data)
+        files.append(MappedFile(str(filename), encoding_id))
+        return files[-1]
+    yield _open
+    for f in files:
+        f.close()
+
+
+def random_text(rnd, alphabet, length, eol='\n'):
+    return ''.join(rnd.choice(alphabet + [eol]) for _ in range(length))
+
+
+########################################
+# Byte offsets at which chars start
+########################################
+def char_offsets(text, codec):
+    offsets = [0]
+    for c in text:
+        offsets.append(offsets[-1] + len(c.encode(codec)))
+    return offsets
+
+
+@pytest.mark.parametrize('encoding_id', list(CODECS))
+def test_pages_start_at_char_boundaries(open_file, encoding_id):
+    text = random_text(random.Random(1), ['a', 'ä', '€', '\U0001F600'], 500)
+    codec = CODECS[encoding_id]
+    f = open_file(text.encode(codec), encoding_id)
+    offsets = set(char_offsets(text, codec))
+    starts = [f.page_start(p) for p in range(f.page_count + 1)]
+    assert starts[0] == 0 and starts[-1] == f.size
+    assert all(start in offsets for start in starts)
+    assert ''.join(f.page_text(p) for p in range(f.page_count)) == text
+    assert all(f.page_of(offset) == p for p in range(f.page_count) for offset in range(starts[p], starts[p + 1]))
+
+
+def test_utf8_bom_is_skipped(open_file):
+    f = open_file(b'\xEF\xBB\xBF' + 'ä\n'.encode() * 100)
+    assert f.encoding_id == IDM_UTF_8_BOM
+    assert f.page_start(0) == 3 and f.page_text(0).startswith('ä\n')
+
+
+@pytest.mark.parametrize('encoding_id', list(CODECS))
+@pytest.mark.parametrize('eol', ['\r\n', '\n', '\r'])
+def test_lines_match_eol_count(open_file, encoding_id, eol):
+    codec = CODECS[encoding_id]
+    text = random_text(random.Random(2), ['a', 'bc', 'ä'], 2000, eol)
+    data = text.encode(codec)
+    eol_bytes = eol.encode(codec)
+    f = open_file(data, encoding_id)
+    for offset in sorted(set(char_offsets(text, codec)))[::7]:
+        assert f.line_from_offset(offset) == data[:offset].count(eol_bytes)
+    line_count = data.count(eol_bytes) + 1
+    assert f.line_count() == line_count
+    pos = 0
+    for line in range(line_count):
+        assert f.line_offset(line) == pos
+        pos = data.find(eol_bytes, pos) + len(eol_bytes)
+    assert f.line_offset(line_count) is None
+
+
+@pytest.mark.parametrize('eol, eol_mode_id', [('\n', IDM_EOL_LF), ('\r', IDM_EOL_CR)])
+def test_display_pos_round_trip(open_file, eol, eol_mode_id):
+    text = random_text(random.Random(3), ['a', 'ä', 'xyz'], 1000, eol)
+    data = text.encode()
+    f = open_file(data)
+    assert f.eol_mode_id == eol_mode_id
+    for first_page in (0, 2, 5):
+        window, starts = f.window(first_page, 4)
+        assert window == f.page_text(first_page).replace(eol, '\r\n') + window[starts[1]:]
+        start = f.page_start(first_page)
+        end = f.page_start(first_page + 4)
+        for offset in char_offsets(data[start:end].decode(), 'utf-8'):
+            offset += start
+            pos = f.display_pos(first_page, offset)
+            assert window[:pos] == data[start:offset].decode().replace(eol, '\r\n')
+            assert f.display_offset(first_page, pos) == offset
+
+
+########################################
+# Reference: searches the whole decoded text at once, returns byte offset of match or -1
+########################################
+def find_all_at_once(text, codec, needle, offset, match_case, search_up):
+    snapshot = SearchSnapshot(text)
+    offsets = char_offsets(text, codec)
+    pos = offsets.index(offset)
+    if search_up:
+        found = snapshot.find(needle, 0, pos + len(needle) - 1, match_case, True)
+    else:
+        found = snapshot.find(needle, pos, len(text), match_case)
+    return offsets[found[0]] if found else -1
+
+
+@pytest.mark.parametrize('encoding_id', list(CODECS))
+@pytest.mark.parametrize('match_case', [True, False])
+@pytest.mark.parametrize('search_up', [False, True])
+def test_find_across_pages(open_file, encoding_id, match_case, search_up):
+    rnd = random.Random(4)
+    codec = CODECS[encoding_id]
+    text = random_text(rnd, ['a', 'b', 'B', 'ä', 'Ä'], 3000)
+    f = open_file(text.encode(codec), encoding_id)
+    offsets = char_offsets(text, codec)
+    for _ in range(200):
+        needle = ''.join(rnd.choice('abBäÄ') for _ in range(rnd.randrange(1, 5)))
+        offset = rnd.choice(offsets)
+        assert f.find(needle, offset, match_case, search_up) == find_all_at_once(
+                text, codec, needle, offset, match_case, search_up), (needle, offset)
+
+
+def test_find_match_split_by_page_border(open_file):
+    data = b'x' * 62 + b'needle' + b'x' * 100
+    f = open_file(data)
+    assert f.page_start(1) == 64
+    for match_case in (True, False):
+        assert f.find('needle', 0, match_case) == 62
+        assert f.find('NEEDLE', 0, False) == 62
+        assert f.find('needle', len(data), match_case, True) == 62
+        assert f.find('needle', 63, match_case) == -1
+        assert f.find('needle', 62, match_case, True) == -1
+
+
+@pytest.mark.parametrize('search_up', [False, True])
+def test_find_ignore_case_after_length_changing_fold(open_file, search_up):
+    # 'İ'.lower() is 2 chars long, which must not shift the offsets of later matches
+    rnd = random.Random(5)
+    text = random_text(rnd, ['a', 'b', 'İ', 'i', 'ä'], 5000)
+    f = open_file(text.encode())
+    offsets = char_offsets(text, 'utf-8')
+    for _ in range(300):
+        needle = rnd.choice(['ab', 'BA', 'Äb', 'a', 'bİ'])
+        offset = rnd.choice(offsets)
+        found = f.find(needle, offset, False, search_up)
+        assert found == find_all_at_once(text, 'utf-8', needle, offset, False, search_up), (needle, offset)
+        if found > -1:
+            assert f._text_between(found, found + len(needle.encode()) + 4).lower().startswith(needle.lower())
+
+
+def test_find_char_not_in_codepage(open_file, monkeypatch):
+    # the real 'ansi' codec (the system codepage) only exists on Windows
+    monkeypatch.setitem(pager.PAGE_CODECS, IDM_ANSI, 'cp1252')
+    data = 'abc äöü\n'.encode('cp1252') * 20 + b'\x81x'
+    f = open_file(data, IDM_ANSI)
+    assert f.find('äöü', 0) == 4
+    assert f.find('€', 0) == -1
+    assert f.find('Ж', 0) == -1
+    # undefined bytes are decoded as U+FFFD, which can't be encoded
+    assert f.find('�x', 0) == len(data) - 2
+    assert f.find('�x', len(data), True, True) == len(data) - 2
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from textlib.pagination import Pagination
+
+
+class Lines(object):
+
+    def __init__(self, lines, line_height=10, width=20):
+        self.lines = lines
+        self.line_height = line_height
+        self.width = width
+        self.measured = 0
+
+    def line_text(self, i):
+        return self.lines[i]
+
+    def measure(self, line):
+        # wraps into the page width like DrawTextW(DT_CALCRECT | DT_WORDBREAK) would
+        self.measured += 1
+        return max(1, -(-len(line) // self.width)) * self.line_height
+
+    def pagination(self, page_height, fit_len=0):
+        return Pagination(len(self.lines), self.line_text, self.measure, page_height, self.line_height, fit_len)
+
+
+########################################
+# Lays out all lines at once, returns the line ranges of the pages
+########################################
+def reference_pages(lines, page_height):
+    pages = [[]]
+    top = 0
+    for i, line in enumerate(lines.lines):
+        h = max(1, -(-len(line) // lines.width)) * lines.line_height
+        if top + h > page_height and top > 0:
+            pages.append([])
+            top = 0
+        pages[-1].append(i)
+        top += h
+    return [range(page[0], page[-1] + 1) if page else range(0) for page in pages]
+
+
+def test_empty_text_has_one_page():
+    pagination = Lines([]).pagination(100)
+    assert pagination.done
+    assert pagination.page_count() == 1
+    assert pagination.page_lines(1) == range(0, 0)
+    assert pagination.page_lines(2) == range(0)
+
+
+def test_page_breaks():
+    pagination = Lines(['x'] * 25).pagination(100)
+    assert pagination.page_count() == 3
+    assert [pagination.page_lines(page) for page in (1, 2, 3)] == [range(0, 10), range(10, 20), range(20, 25)]
+    assert pagination.page_lines(0) == range(0) and pagination.page_lines(4) == range(0)
+
+
+def test_wrapped_line_moves_to_next_page():
+    lines = Lines(['x'] * 8 + ['y' * 50] + ['x'])  # the long line wraps into 3 lines
+    pagination = lines.pagination(100)
+    assert [pagination.page_lines(page) for page in range(1, pagination.page_count() + 1)] == [range(0, 8), range(8, 10)]
+
+
+def test_line_higher_than_page_is_cut_off():
+    lines = Lines(['x', 'y' * 500, 'x'])
+    pagination = lines.pagination(100)
+    assert pagination.page_count() == 3
+    assert pagination.page_lines(2) == range(1, 2)
+
+
+def test_short_lines_are_not_measured():
+    lines = Lines(['x' * 20] * 30 + ['y' * 21])
+    pagination = lines.pagination(100, fit_len=20)
+    assert pagination.page_count() == 4
+    assert lines.measured == 1
+
+
+def test_pages_are_laid_out_on_demand():
+    lines = Lines(['x'] * 100000)
+    pagination = lines.pagination(100)
+    assert pagination.page_lines(3) == range(20, 30)
+    assert not pagination.done
+    assert lines.measured < 100000
+    measured = lines.measured
+    # earlier pages are known, nothing is measured again
+    assert pagination.page_lines(1) == range(0, 10)
+    assert lines.measured == measured
+    assert pagination.page_count() == 10000
+    assert lines.measured == 100000
+    assert pagination.page_lines(9091) == range(90900, 90910)
+    assert lines.measured == 100000
+
+
+@pytest.mark.parametrize('max_lines', [1, 7, 1000])
+def test_steps_match_reference(max_lines):
+    rnd = random.Random(max_lines)
+    lines = Lines([' ' * rnd.choice([0, 5, 25, 60, 300]) for _ in range(500)])
+    pagination = lines.pagination(170)
+    steps = 0
+    while not pagination.step(max_lines):
+        steps += 1
+    assert steps == -(-500 // max_lines) - 1
+    expected = reference_pages(lines, 170)
+    assert [pagination.page_lines(page) for page in range(1, pagination.page_count() + 1)] == expected
+
+
+def test_key_is_kept():
+    pagination = Pagination(1, lambda i: '', len, 10, key=('doc', 'font'))
+    assert pagination.key == ('doc', 'font')
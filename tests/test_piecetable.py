@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from textlib import piecetable
+from textlib.lineindex import LineIndex, line_starts
+from textlib.piecetable import PieceTable
+
+
+def check_lines(doc, text):
+    starts = [0] + [i + 1 for i, c in enumerate(text) if c == '\n']
+    assert doc.line_count() == len(starts)
+    for line, start in enumerate(starts):
+        assert doc.line_offset(line) == start
+        end = starts[line + 1] - 1 if line + 1 < len(starts) else len(text)
+        assert doc.line_text(line) == text[start:end].removesuffix('\r')
+        for pos in (start, end):
+            assert doc.line_from_offset(pos) == line
+    assert doc.line_offset(len(starts)) is None
+    assert doc.line_text(len(starts)) is None
+
+
+def test_empty():
+    doc = PieceTable()
+    assert len(doc) == 0 and str(doc) == '' and doc[0:10] == ''
+    assert doc.line_count() == 1 and doc.line_text(0) == ''
+    doc.insert(0, 'a\r\nb')
+    assert str(doc) == 'a\r\nb'
+    check_lines(doc, 'a\r\nb')
+
+
+def test_str_like():
+    doc = PieceTable('0123456789')
+    doc.insert(5, 'abc')
+    assert str(doc) == '01234abc56789'
+    assert doc[3:9] == '34abc5' and doc[-2:] == '89' and doc[::2] == '024b579'
+    assert doc[5] == 'a' and doc[-1] == '9'
+    with pytest.raises(IndexError):
+        doc[13]
+    assert doc.substring(4, 100) == '4abc56789' and doc.substring(7, 3) == ''
+
+
+def test_typing_appends_to_previous_insert():
+    doc = PieceTable('hello world')
+    for i, c in enumerate('abc'):
+        doc.insert(5 + i, c)
+    assert str(doc) == 'helloabc world'
+    assert len(doc._pieces) == 3
+
+
+def test_snapshot_is_independent():
+    doc = PieceTable('abc\ndef')
+    doc.insert(3, 'x')
+    snapshot = doc.snapshot()
+    doc.insert(4, 'y')
+    doc.delete(0, 2)
+    assert str(snapshot) == 'abcx\ndef'
+    assert snapshot.line_text(1) == 'def'
+    assert str(doc) == 'cxy\ndef'
+
+
+@pytest.mark.parametrize('sub', ['a', 'ab', 'b\r\na', 'zz', ''])
+def test_find_across_pieces(sub):
+    doc = PieceTable('ab\r\nab')
+    text = 'ab\r\nab'
+    for pos, new in [(2, 'a'), (0, 'b'), (5, '\r\nab'), (9, 'zz')]:
+        doc.insert(pos, new)
+        text = text[:pos] + new + text[pos:]
+    assert str(doc) == text
+    for start in range(len(text) + 1):
+        for end in range(start, len(text) + 1):
+            assert doc.find(sub, start, end) == text.find(sub, start, end)
+            assert doc.rfind(sub, start, end) == text.rfind(sub, start, end)
+
+
+def test_compaction_keeps_text_and_lines(monkeypatch):
+    monkeypatch.setattr(piecetable, 'PIECE_MAX_COUNT', 16)
+    doc = PieceTable('line\n' * 20)
+    text = str(doc)
+    doc.line_count()
+    for i in range(40):
+        pos = i * 7 % len(text)
+        doc.replace(pos, pos + 1, 'X\n')
+        text = text[:pos] + 'X\n' + text[pos + 1:]
+        assert len(doc._pieces) <= 16
+    assert str(doc) == text
+    check_lines(doc, text)
+
+
+def test_random_edits():
+    rnd = random.Random(10)
+    text = ''.join(rnd.choice('abc \r\n') for _ in range(500))
+    doc = PieceTable(text)
+    prev_end = 0
+    for i in range(3000):
+        start = rnd.randrange(len(text) + 1)
+        end = min(len(text), start + rnd.choice([0, 0, 1, 2, 10]))
+        new = rnd.choice(['', 'x', '\r\n', 'yy\nz'])
+        if rnd.random() < 0.3:
+            # keep typing at the previous position
+            start = end = prev_end
+            new = 'q'
+        doc.replace(start, end, new)
+        text = text[:start] + new + text[end:]
+        prev_end = start + len(new)
+        if i % 100 == 0:
+            assert str(doc) == text
+            check_lines(doc, text)
+        a = rnd.randrange(len(text) + 1)
+        b = rnd.randrange(len(text) + 1)
+        assert doc.substring(a, b) == text[a:b]
+        assert doc.line_from_offset(a) == text.count('\n', 0, a)
+    assert str(doc) == text
+
+
+def test_line_starts():
+    assert list(line_starts('')) == [0]
+    assert list(line_starts('a\nbc\r\n\nd')) == [0, 2, 6, 7]
+
+
+def test_line_index_pending_shift():
+    text = 'aa\nbb\ncc\ndd\n'
+    index = LineIndex(text)
+    for start, end, new in [(4, 4, 'xx\n'), (0, 1, ''), (12, 13, 'yy\nzz\n'), (2, 2, '\n'), (8, 14, '')]:
+        index.replace(start, end, new)
+        text = text[:start] + new + text[end:]
+        assert len(index) == text.count('\n') + 1
+        assert [index.line_offset(line) for line in range(len(index))] == list(line_starts(text))
+        assert all(index.line_from_offset(pos) == text.count('\n', 0, pos) for pos in range(len(text) + 1))
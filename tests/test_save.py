@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from resources.const import *
+from textlib import save
+from textlib.save import (ensure_final_newline, iter_chunks, run_stages, save_stages, trim_trailing_whitespace,
+        write_atomic, write_text_file)
+
+BOM = b'\xEF\xBB\xBF'
+
+
+########################################
+# Text that can only be sliced a limited number of times, like a buffer that goes away while
+# it's being saved
+########################################
+class FailingText(object):
+
+    def __init__(self, text, max_slices):
+        self.text = text
+        self.max_slices = max_slices
+
+    def __len__(self):
+        return len(self.text)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if not self.max_slices:
+                raise OSError('chunk source failed')
+            self.max_slices -= 1
+        return self.text[key]
+
+
+def save_bytes(text, eol_mode_id=IDM_EOL_CRLF, encoding_id=IDM_UTF_8, **options):
+    return b''.join(run_stages(iter_chunks(text), save_stages(eol_mode_id, encoding_id, **options)))
+
+
+def temp_files(path):
+    return [name for name in os.listdir(path) if name.endswith('.tmp')]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(save, 'SAVE_CHUNK_SIZE', 8)
+
+
+def test_failure_keeps_original_and_removes_temp_file(tmp_path, small_chunks):
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(b'original')
+    with pytest.raises(OSError, match='chunk source failed'):
+        write_text_file(str(filename), FailingText('line\r\n' * 100, 3), IDM_EOL_LF, IDM_UTF_8_BOM)
+    assert filename.read_bytes() == b'original'
+    assert temp_files(tmp_path) == []
+
+
+def test_failure_in_stage_removes_temp_file(tmp_path):
+    def chunks():
+        yield b'partial'
+        raise KeyboardInterrupt
+
+    filename = tmp_path / 'file.txt'
+    with pytest.raises(KeyboardInterrupt):
+        write_atomic(str(filename), chunks())
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_replaces_file(tmp_path):
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(b'original')
+    write_text_file(str(filename), 'a\r\nb', IDM_EOL_LF, IDM_UTF_8)
+    assert filename.read_bytes() == b'a\nb'
+    assert temp_files(tmp_path) == []
+
+
+def test_chunks_dont_split_crlf(small_chunks):
+    text = ('x' * 7 + '\r\n') * 20 + 'y'
+    chunks = list(iter_chunks(text))
+    assert ''.join(chunks) == text
+    assert all(not chunk.endswith('\r') for chunk in chunks)
+    assert chunks[0] == 'x' * 7 + '\r\n'
+
+
+@pytest.mark.parametrize('eol_mode_id, eol', [(IDM_EOL_LF, b'\n'), (IDM_EOL_CR, b'\r'), (IDM_EOL_CRLF, b'\r\n')])
+def test_crlf_across_chunk_boundary(eol_mode_id, eol):
+    text = 'x' * (save.SAVE_CHUNK_SIZE - 1) + '\r\n' + 'y'
+    assert save_bytes(text, eol_mode_id) == b'x' * (save.SAVE_CHUNK_SIZE - 1) + eol + b'y'
+
+
+def test_bom_written_once(tmp_path, small_chunks):
+    filename = tmp_path / 'file.txt'
+    write_text_file(str(filename), 'äb\r\n' * 10, IDM_EOL_LF, IDM_UTF_8_BOM)
+    data = filename.read_bytes()
+    assert data == BOM + 'äb\n'.encode() * 10
+    assert data.count(BOM) == 1
+
+
+def test_surrogate_pair_across_chunks(small_chunks):
+    text = 'x' * 7 + '\U0001F600' + 'y'
+    assert save_bytes(text, encoding_id=IDM_UTF_16_LE) == text.encode('utf-16-le')
+
+
+def test_progress(tmp_path, small_chunks):
+    fractions = []
+    write_text_file(str(tmp_path / 'file.txt'), 'z' * 40, IDM_EOL_CRLF, IDM_UTF_8, progress=fractions.append)
+    assert fractions == [0.2, 0.4, 0.6, 0.8, 1.0]
+
+
+def test_trim_trailing_whitespace(small_chunks):
+    text = 'a  \r\nb\t \t\r\n   \r\nc    ' + ' ' * 20 + 'd \r\n  '
+    assert ''.join(trim_trailing_whitespace(iter_chunks(text))) == 'a\r\nb\r\n\r\nc' + ' ' * 24 + 'd\r\n'
+
+
+@pytest.mark.parametrize('text, result', [('', ''), ('a', 'a\r\n'), ('a\r\n', 'a\r\n'), ('a\r\nb', 'a\r\nb\r\n')])
+def test_ensure_final_newline(text, result):
+    assert ''.join(ensure_final_newline(iter_chunks(text))) == result
+
+
+def test_save_options():
+    assert save_bytes('a \r\nb ', IDM_EOL_LF, trim_whitespace=True, final_newline=True) == b'a\nb\n'
@@ -0,0 +1,122 @@
+import re
+
+import pytest
+
+from textlib.findfiles import replace_files, search_files
+from textlib.search import (COUNT_CHUNK, IncrementalSearch, MatchCounter, SearchSnapshot, crlf_regex,
+        search_backward, search_pattern, self_overlaps)
+
+
+def test_literal_term_is_escaped():
+    assert search_pattern('a.b$').findall('a.b$ axb') == ['a.b$']
+
+
+def test_dollar_matches_before_crlf():
+    pattern = search_pattern(' +$', regex=True)
+    assert [m.span() for m in pattern.finditer('foo  \r\nbar \r\nbaz')] == [(3, 5), (10, 11)]
+    assert pattern.sub('', 'foo  \r\nbar \r\n') == 'foo\r\nbar\r\n'
+
+
+def test_dollar_at_end_of_text():
+    assert search_pattern('z$', regex=True).search('xyz').span() == (2, 3)
+
+
+def test_replace_all_keeps_crlf():
+    pattern = search_pattern('o.*$', regex=True)
+    assert pattern.sub('X', 'foo\r\nbar') == 'fX\r\nbar'
+    assert search_pattern('o.*', regex=True).sub('X', 'foo\r\nbar') == 'fX\r\nbar'
+
+
+def test_whitespace_before_dollar_doesnt_take_cr():
+    assert search_pattern(r'o\s*$', regex=True).sub('X', 'foo \r\nbar') == 'foX\r\nbar'
+
+
+def test_rewrite_leaves_escapes_and_classes_alone():
+    assert crlf_regex(r'\$\.[$.][]$][^]$]') == r'\$\.[$.][]$][^]$]'
+    assert crlf_regex('a.$') == r'a[^\r\n](?=\r\n|\Z)'
+    assert crlf_regex('a.b', True) == 'a.b'
+
+
+def test_dotall_keeps_dot():
+    assert search_pattern('(?s)a.b', regex=True).search('a\nb')
+
+
+def test_invalid_regex_raises():
+    with pytest.raises(re.error):
+        search_pattern('(', regex=True)
+
+
+def test_search_backward_finds_last_match():
+    text = 'ab\r\n' * 100000
+    pattern = search_pattern('b$', regex=True)
+    assert search_backward(text, pattern).span() == (len(text) - 3, len(text) - 2)
+    assert search_backward(text, pattern, 0, 5).span() == (1, 2)
+
+
+def test_folded_snapshot_maps_offsets():
+    snapshot = SearchSnapshot('İx İy')
+    assert snapshot.find('iy', 0, 5, match_case=False) is None
+    assert snapshot.find('i̇y', 0, 5, match_case=False) == (3, 5)
+
+
+def test_incremental_search_continues_from_match():
+    snapshot = SearchSnapshot('abc abd abe')
+    inc = IncrementalSearch(0, 0)
+    assert inc.find(snapshot, 'ab') == (0, 2)
+    assert inc.find(snapshot, 'abd') == (4, 7)
+    assert inc.find(snapshot, 'abx') is None
+
+
+def test_find_in_files_dollar(tmp_path):
+    (tmp_path / 'crlf.txt').write_bytes(b'foo  \r\nbar\r\n')
+    searched, results = search_files([str(tmp_path / 'crlf.txt')], ' +$', regex=True)
+    assert searched == 1
+    (filename, hits), = results
+    assert [hit[:3] for hit in hits] == [(3, 2, 0)]
+
+
+def test_replace_in_files_keeps_eols(tmp_path):
+    crlf, lf = tmp_path / 'crlf.txt', tmp_path / 'lf.txt'
+    crlf.write_bytes(b'foo\r\nbar')
+    lf.write_bytes(b'foo  \nbar \n')
+    replace_files([str(crlf)], 'o.*$', 'X', regex=True)
+    replace_files([str(lf)], ' +$', '', regex=True)
+    assert crlf.read_bytes() == b'fX\r\nbar'
+    assert lf.read_bytes() == b'foo\nbar\n'
+
+
+def count_matches(snapshot, term, match_case=True, regex=False, previous=None):
+    counter = MatchCounter(snapshot, term, match_case, regex, previous)
+    counter.step(60)
+    assert counter.done
+    return counter
+
+
+def test_count_doesnt_overlap():
+    snapshot = SearchSnapshot('aaaa')
+    counter = count_matches(snapshot, 'aa')
+    assert counter.count == 2
+    assert [counter.index(pos) for pos in range(4)] == [1, 0, 2, 0]
+
+
+def test_count_matches_find_next_across_chunks():
+    text = 'x' * (COUNT_CHUNK - 1) + 'aaaaa' + 'b' * COUNT_CHUNK
+    assert count_matches(SearchSnapshot(text), 'aa').count == 2
+    assert count_matches(SearchSnapshot(text), 'AA', match_case=False).count == 2
+
+
+def test_count_regex_and_case():
+    snapshot = SearchSnapshot('Foo foo\r\nFOO')
+    assert count_matches(snapshot, 'foo').count == 1
+    assert count_matches(snapshot, 'foo', match_case=False).count == 3
+    assert count_matches(snapshot, 'o+$', regex=True, match_case=False).count == 2
+
+
+def test_count_reusing_prefix_matches_whole_search():
+    snapshot = SearchSnapshot('aaab abab aab ababab ' * 10 + 'y' * 0x10000)
+    for prefix, term in [('a', 'ab'), ('aa', 'aab'), ('ab', 'aba'), ('aba', 'abab'), ('ab', 'ab ')]:
+        previous = count_matches(snapshot, prefix)
+        counter = MatchCounter(snapshot, term, previous=previous)
+        assert counter._iter.__name__ == ('_iter_text' if self_overlaps(prefix) else '_iter_candidates')
+        counter.step(60)
+        assert counter.count == count_matches(snapshot, term).count == len(re.findall(re.escape(term), snapshot.text))
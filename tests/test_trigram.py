@@ -0,0 +1,161 @@
+import os
+import random
+import re
+import sqlite3
+
+import pytest
+
+from textlib import trigram
+from textlib.findfiles import FindInFiles, search_pattern
+from textlib.trigram import (IndexedFindInFiles, TrigramIndex, fold_text, index_filename, index_files,
+        query_trigrams, required_literals, text_trigrams)
+
+WORDS = 'alpha beta gamma delta epsilon zeta Straße İstanbul naïve 2024 foo_bar'.split()
+
+
+def write_files(folder, count, rnd):
+    files = {}
+    for i in range(count):
+        path = os.path.join(str(folder), 'sub{}'.format(i % 3), 'note{}.txt'.format(i))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = '\r\n'.join(' '.join(rnd.choice(WORDS) for _ in range(rnd.randrange(1, 6))) for _ in range(3))
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        files[path] = text
+    return files
+
+
+def build_index(filename, paths):
+    index = TrigramIndex(filename)
+    paths = sorted(paths)
+    index.add(index_files(paths, index.reserve_ids(len(paths))))
+    index.flush()
+    return index
+
+
+def stats(paths):
+    return {path: (os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths}
+
+
+def run_search(search):
+    results = []
+    search.start(lambda batch: results.extend(batch or ()))
+    search.join()
+    return sorted((filename, [hit[:3] for hit in hits]) for filename, hits in results)
+
+
+def test_index_filename(tmp_path):
+    a = index_filename(str(tmp_path), 'notes')
+    assert a == index_filename(str(tmp_path), os.path.join('.', 'notes'))
+    assert a != index_filename(str(tmp_path), 'other')
+    assert os.path.dirname(a) == str(tmp_path) and a.endswith('.sqlite3')
+
+
+def test_fold_text():
+    assert fold_text('ABC İ ſ ς') == 'abc i s σ'
+    assert fold_text('x\ud800y') == 'x?y'
+    assert text_trigrams('AbCd') == {'abc', 'bcd'}
+    assert text_trigrams('ab') == set()
+
+
+@pytest.mark.parametrize('term, literals', [
+    ('foo', ['foo']),
+    (r'foo\d+bar', ['foo', 'bar']),
+    ('ab*c', ['a', 'c']),
+    ('abc.def', ['abc', 'def']),
+    ('[abc]def', ['def']),
+    ('[]x]abc', ['abc']),
+    ('x(yz)w', ['x', 'w']),
+    (r'a\.b', ['a.b']),
+    (r'\bword\b', ['word']),
+    (r'\x41bcd', ['bcd']),
+    ('a|b', []),
+    ('(?i)abc', []),
+])
+def test_required_literals(term, literals):
+    assert required_literals(term, regex=True) == literals
+    assert all(re.search(re.escape(literal), 'foo1bar') for literal in required_literals(r'foo\d+bar', True))
+
+
+def test_query_trigrams():
+    assert query_trigrams('a.b|c', regex=False) == {'a.b', '.b|', 'b|c'}
+    assert query_trigrams(r'HeLLo\s+wo', regex=True) == {'hel', 'ell', 'llo'}
+    assert query_trigrams('ab.cd', regex=True) == set()
+
+
+def test_candidates_contain_all_matches(tmp_path):
+    rnd = random.Random(21)
+    files = write_files(tmp_path / 'notes', 60, rnd)
+    with build_index(str(tmp_path / 'index.sqlite3'), files) as index:
+        for term, regex, match_case in [('alpha', False, True), ('ALPHA', False, False), ('straße', False, False),
+                ('istanbul', False, False), (r'gamma\s+delta', True, True), (r'ta\b', True, True),
+                ('a.b', False, True), ('2024', False, True), ('missing', False, True), ('nope|alpha', True, True)]:
+            pattern = search_pattern(term, regex, match_case)
+            matching = {path for path, text in files.items() if pattern.search(text)}
+            candidates = index.candidates(term, regex)
+            if candidates is None:
+                assert not query_trigrams(term, regex)
+            else:
+                assert matching <= candidates
+                if not regex:
+                    assert candidates == {path for path, text in files.items() if fold_text(term) in fold_text(text)}
+
+
+def test_incremental_update(tmp_path):
+    rnd = random.Random(7)
+    files = write_files(tmp_path / 'notes', 10, rnd)
+    filename = str(tmp_path / 'index.sqlite3')
+    with build_index(filename, files):
+        pass
+    changed, removed = sorted(files)[:2]
+    with open(changed, 'a', encoding='utf-8') as f:
+        f.write(' uniqueword')
+    os.remove(removed)
+    del files[removed]
+    with TrigramIndex(filename) as index:
+        assert index.outdated(stats(files)) == [changed]
+        index.add(index_files([changed], index.reserve_ids(1)))
+        index.flush()
+        index.prune(files)
+        assert index.outdated(stats(files)) == []
+        assert index.candidates('uniqueword') == {changed}
+        assert removed not in (index.candidates('txt') or set()) | set(path for path, in index._db.execute('SELECT path FROM files'))
+
+
+def test_segments_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(trigram, 'TRIGRAM_MAX_SEGMENTS', 2)
+    files = write_files(tmp_path / 'notes', 8, random.Random(3))
+    with TrigramIndex(str(tmp_path / 'index.sqlite3')) as index:
+        for path in sorted(files):
+            index.add(index_files([path], index.reserve_ids(1)))
+            index.flush()
+            assert index._db.execute('SELECT COUNT(DISTINCT segment) FROM postings').fetchone()[0] <= 3
+        for word in ('alpha', 'zeta'):
+            assert index.candidates(word) == {path for path, text in files.items() if word in text}
+
+
+def test_other_version_is_rebuilt(tmp_path):
+    filename = str(tmp_path / 'index.sqlite3')
+    db = sqlite3.connect(filename)
+    db.execute('CREATE TABLE files (x)')
+    db.execute('PRAGMA user_version = 999')
+    db.commit()
+    db.close()
+    with TrigramIndex(filename) as index:
+        assert index.outdated({'a.txt': (1, 1)}) == ['a.txt']
+
+
+def test_indexed_search_finds_the_same(tmp_path):
+    files = write_files(tmp_path / 'notes', 30, random.Random(5))
+    folder = str(tmp_path / 'notes')
+    index_file = str(tmp_path / 'index' / 'notes.sqlite3')
+    for term, regex in [('gamma', False), (r'be\w+ ', True), ('nothing here', False)]:
+        expected = run_search(FindInFiles(folder, term, regex, workers=1))
+        assert bool(expected) == (term != 'nothing here')
+        search = IndexedFindInFiles(folder, term, regex, index_file=index_file, workers=1)
+        assert run_search(search) == expected
+        assert search.files_searched <= len(files)
+    search = IndexedFindInFiles(folder, 'delta', index_file=index_file, workers=1)
+    run_search(search)
+    assert search.files_outdated == 0
+    assert search.files_searched == sum('delta' in text for text in files.values())
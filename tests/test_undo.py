@@ -0,0 +1,144 @@
+import random
+
+import pytest
+
+from textlib.piecetable import PieceTable
+from textlib.undo import UNDO_DELTA_SIZE, UndoHistory, apply_deltas, delta_ranges, pack_deltas, shift_offset, unpack_deltas
+
+
+def replace_ranges(text, ranges):
+    doc = PieceTable(text)
+    for start, end, new in ranges:
+        doc.replace(start, end, new)
+    return str(doc)
+
+
+def replace_all(text, old, new):
+    deltas = []
+    shift = 0
+    pos = text.find(old)
+    while pos > -1:
+        deltas.append((pos + shift, old, new))
+        shift += len(new) - len(old)
+        pos = text.find(old, pos + len(old))
+    return deltas
+
+
+def undo_deltas(deltas):
+    return [(offset, new, old) for offset, old, new in reversed(deltas)]
+
+
+@pytest.mark.parametrize('max_gap', [0, 3, 100, 0x10000])
+def test_delta_ranges_apply_like_deltas(max_gap):
+    text = 'foo bar\r\nbaz foo\r\n' * 50 + 'foo'
+    for old, new in [('foo', 'x'), ('o', 'ooo'), ('\r\n', ''), ('bar', 'bar')]:
+        deltas = replace_all(text, old, new)
+        result = apply_deltas(text, deltas)
+        assert replace_ranges(text, delta_ranges(PieceTable(text), deltas, max_gap)) == result
+        undo = undo_deltas(deltas)
+        assert replace_ranges(result, delta_ranges(PieceTable(result), undo, max_gap)) == text
+
+
+def test_delta_ranges_back_to_front_and_merged():
+    text = 'a-b-c----------d'
+    deltas = replace_all(text, '-', '+-+')
+    assert delta_ranges(text, deltas, 0) == [(5, 15, '+-+' * 10), (3, 4, '+-+'), (1, 2, '+-+')]
+    assert delta_ranges(text, deltas, 1) == [(1, 15, '+-+b+-+c' + '+-+' * 10)]
+
+
+def test_delta_ranges_unsorted_in_order():
+    text = 'abcdef'
+    deltas = [(4, 'e', 'E'), (0, 'a', 'AA'), (2, 'b', '')]
+    assert delta_ranges(text, deltas, 10) == [(4, 5, 'E'), (0, 1, 'AA'), (2, 3, '')]
+    assert replace_ranges(text, delta_ranges(text, deltas, 10)) == apply_deltas(text, deltas) == 'AAcdEf'
+
+
+def test_delta_ranges_random():
+    rnd = random.Random(18)
+    text = ''.join(rnd.choice('ab\r\n') for _ in range(2000))
+    for _ in range(50):
+        deltas = replace_all(text, rnd.choice(['a', 'ab', '\r\n', 'bb']), rnd.choice(['', 'x', 'yyy']))
+        assert replace_ranges(text, delta_ranges(text, deltas, rnd.randrange(20))) == apply_deltas(text, deltas)
+
+
+def test_shift_offset():
+    deltas = replace_all('aXbXc', 'X', '--')
+    assert [shift_offset(deltas, pos) for pos in range(6)] == [0, 1, 3, 4, 6, 7]
+
+
+def entry_sizes(history):
+    return sum(size for size, _ in history._undo), sum(size for size, _ in history._redo)
+
+
+def test_typing_run_is_one_group():
+    history = UndoHistory()
+    for i, c in enumerate('abc'):
+        history.record(i, '', c, typing=True)
+    for pos in (2, 1):
+        history.record(pos, 'cb'[2 - pos], '', typing=True)  # Backspace
+    history.record(10, '', 'x')
+    assert history.undo() == [(10, 'x', '')]
+    assert history.undo() == [(1, '', 'bc')]
+    assert history.undo() == [(0, 'abc', '')]
+    assert not history.can_undo
+    assert history.redo() == [(0, '', 'abc')]
+
+
+def test_group_and_redo_cleared_by_new_change():
+    history = UndoHistory()
+    with history.group():
+        history.record(0, 'a', 'b')
+        with history.group():
+            history.record(5, '', 'c')
+    assert history.undo() == [(5, 'c', ''), (0, 'b', 'a')]
+    assert history.can_redo
+    history.record(0, '', 'z')
+    assert not history.can_redo
+
+
+def test_pack_deltas():
+    deltas = [(0, 'a', 'bc'), (7, '', 'ä\U0001F600'), (0x100000000, 'old', '')]
+    assert unpack_deltas(pack_deltas(deltas)) == deltas
+
+
+def test_undo_and_redo_sizes_are_tracked_separately():
+    history = UndoHistory()
+    for i in range(10):
+        history.add_group([(i, '', 'x' * 100)])
+    total = history.size
+    for _ in range(4):
+        history.undo()
+    assert history.size == total
+    assert (history._undo_size, history._redo_size) == entry_sizes(history)
+    history.redo()
+    assert (history._undo_size, history._redo_size) == entry_sizes(history)
+    history.record(0, '', 'y')
+    assert history._redo_size == 0 and not history.can_redo
+    assert (history._undo_size, history._redo_size) == entry_sizes(history)
+
+
+def test_trim_drops_redo_groups_first():
+    group_size = UNDO_DELTA_SIZE + 2 * 100
+    history = UndoHistory(budget=group_size * 10)
+    for i in range(10):
+        history.add_group([(i, '', str(i) * 100)])
+    for _ in range(3):
+        history.undo()
+    history.budget = group_size * 8
+    history._trim()
+    # the groups that would be redone last (9, 8) are dropped, all undo groups are kept
+    assert len(history._undo) == 7 and len(history._redo) == 1
+    assert history.size <= history.budget
+    assert (history._undo_size, history._redo_size) == entry_sizes(history)
+    assert history.redo() == [(7, '', '7' * 100)]
+    assert not history.can_redo
+
+
+def test_trim_keeps_budget_and_last_group():
+    history = UndoHistory(budget=0x10000)
+    for i in range(200):
+        history.add_group([(i, '', 'x' * 0x400)])
+        assert history.size <= history.budget
+        assert (history._undo_size, history._redo_size) == entry_sizes(history)
+    history.add_group([(0, '', 'y' * 0x20000)])
+    assert len(history._undo) == 1 and history.undo() == [(0, 'y' * 0x20000, '')]
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from resources.const import *
+from textlib import save
+from textlib.dirty import DirtyTracker, block_hashes
+from textlib.ingest import read_text_file, to_utf16_units
+from textlib.piecetable import PieceTable
+from textlib.save import iter_chunks, join_surrogates, write_text_file
+
+EMOJI = '\U0001F600'
+EMOJI_UNITS = '\ud83d\ude00'
+
+
+########################################
+# Stands in for the Edit control: a UTF-16-LE buffer that's edited at UTF-16 offsets, and read
+# like _get_text_range() does
+########################################
+class EditBuffer(object):
+
+    def __init__(self, text):
+        self.data = text.encode('utf-16-le', 'surrogatepass')
+
+    def __len__(self):
+        return len(self.data) // 2
+
+    def replace(self, start, end, new):
+        self.data = self.data[:start * 2] + new.encode('utf-16-le', 'surrogatepass') + self.data[end * 2:]
+
+    def get_text_range(self, start, end):
+        return to_utf16_units(self.data[start * 2:end * 2].decode('utf-16-le', 'surrogatepass'))
+
+
+def test_to_utf16_units():
+    assert to_utf16_units('abc') == 'abc'
+    assert to_utf16_units('äö€') == 'äö€'
+    assert to_utf16_units('a' + EMOJI + 'b') == 'a' + EMOJI_UNITS + 'b'
+    assert to_utf16_units('\U00010000\U0010FFFF') == '\ud800\udc00\udbff\udfff'
+    # already split text and lone surrogates are kept
+    assert to_utf16_units(EMOJI_UNITS + '\ud83d') == EMOJI_UNITS + '\ud83d'
+    assert join_surrogates('a' + EMOJI_UNITS + 'b\ud83d') == 'a' + EMOJI + 'b\ud83d'
+
+
+@pytest.mark.parametrize('encoding_id, codec', [
+    (IDM_UTF_8, 'utf-8'),
+    (IDM_UTF_16_LE, 'utf-16-le'),
+    (IDM_UTF_16_BE, 'utf-16-be'),
+])
+def test_loaded_text_counts_utf16_units(tmp_path, encoding_id, codec):
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(('a' + EMOJI + 'b\n' + EMOJI).encode(codec))
+    text, eol_mode_id, loaded_encoding_id = read_text_file(str(filename), encoding_id)
+    assert text == 'a' + EMOJI_UNITS + 'b\r\n' + EMOJI_UNITS
+    assert len(text) == len(EditBuffer(text))
+
+
+def test_chunks_dont_split_surrogate_pairs(monkeypatch):
+    monkeypatch.setattr(save, 'SAVE_CHUNK_SIZE', 4)
+    text = to_utf16_units(('abc' + EMOJI) * 10)
+    chunks = list(iter_chunks(text))
+    assert ''.join(chunks) == text
+    assert all(not '\ud800' <= chunk[-1] <= '\udbff' for chunk in chunks)
+
+
+@pytest.mark.parametrize('encoding_id, codec', [
+    (IDM_UTF_8, 'utf-8'),
+    (IDM_UTF_16_LE, 'utf-16-le'),
+])
+def test_edits_after_non_bmp_char(tmp_path, monkeypatch, encoding_id, codec):
+    monkeypatch.setattr(save, 'SAVE_CHUNK_SIZE', 5)
+    filename = tmp_path / 'file.txt'
+    filename.write_bytes(('x' + EMOJI + 'hello\r\nworld ' + EMOJI).encode(codec))
+    text = read_text_file(str(filename), encoding_id)[0]
+    edit, doc = EditBuffer(text), PieceTable(text)
+    tracker = DirtyTracker(len(edit), block_hashes(doc))
+    # replace 'hello' and insert after 'world', at the Edit control's offsets
+    for start, end, new in ((3, 8, 'bye' + EMOJI), (len(edit) - 2, len(edit) - 2, '!')):
+        edit.replace(start, end, new)
+        new = edit.get_text_range(start, start + len(to_utf16_units(new)))
+        doc.replace(start, end, new)
+        tracker.edited(start, end, start + len(new))
+    assert len(doc) == len(edit)
+    assert str(doc) == edit.get_text_range(0, len(edit))
+    assert tracker.is_dirty(len(edit), doc.substring)
+    write_text_file(str(filename), doc.snapshot(), IDM_EOL_CRLF, encoding_id)
+    assert filename.read_bytes() == ('x' + EMOJI + 'bye' + EMOJI + '\r\nworld !' + EMOJI).encode(codec)
+
+
+def test_random_edits_around_non_bmp_chars(tmp_path):
+    rnd = random.Random(7)
+    alphabet = ['a', 'ä', '\r\n', EMOJI, '\U0001D11E']
+    text = to_utf16_units(''.join(rnd.choice(alphabet) for _ in range(1000)))
+    edit, doc = EditBuffer(text), PieceTable(text)
+    for _ in range(300):
+        # like the Edit control, never cut a pair
+        start = rnd.randrange(len(edit) + 1)
+        end = min(start + rnd.randrange(5), len(edit))
+        start, end = [pos - 1 if 0 < pos < len(edit) and '\udc00' <= doc.substring(pos, pos + 1) <= '\udfff'
+                else pos for pos in (start, end)]
+        new = ''.join(rnd.choice(alphabet) for _ in range(rnd.randrange(4)))
+        edit.replace(start, end, new)
+        doc.replace(start, end, edit.get_text_range(start, start + len(to_utf16_units(new))))
+        assert len(doc) == len(edit)
+    assert str(doc) == edit.get_text_range(0, len(edit))
+    filename = tmp_path / 'file.txt'
+    write_text_file(str(filename), doc, IDM_EOL_CRLF, IDM_UTF_8)
+    assert filename.read_bytes() == edit.data.decode('utf-16-le').encode()
@@ -0,0 +1,75 @@
+from array import array
+from bisect import bisect_left
+
+
+########################################
+# Returns the (0-based) column at the end of text, which must not contain EOLs. Tabs are
+# expanded to the next multiple of tab_size.
+########################################
+def text_column(text, tab_size):
+    if '\t' not in text:
+        return len(text)
+    parts = text.split('\t')
+    col = 0
+    for part in parts[:-1]:
+        col = (col + len(part)) // tab_size * tab_size + tab_size
+    return col + len(parts[-1])
+
+
+########################################
+# Computes line and column of char positions in a document (anything that provides
+# line_from_offset(), line_offset() and line_text(), like PieceTable).
+#
+# The tab stops of the last queried line are cached, so moving along one line only costs a
+# bisect over the tabs of that line. invalidate() has to be called after the document changed.
+########################################
+class ColumnCache(object):
+
+    def __init__(self):
+        self.invalidate()
+
+    ########################################
+    #
+    ########################################
+    def invalidate(self):
+        self._doc = None
+        self._tab_size = 0
+        self._line = 0
+        self._start = 0
+        self._end = -1
+        self._tabs = array('Q')  # positions of the tabs in the line
+        self._cols = array('Q')  # columns after each tab
+
+    ########################################
+    # Returns (line, column) of the specified position
+    ########################################
+    def line_column(self, doc, pos, tab_size):
+        if doc is not self._doc or tab_size != self._tab_size or not self._start <= pos <= self._end:
+            self._load_line(doc, doc.line_from_offset(pos), tab_size)
+        pos -= self._start
+        k = bisect_left(self._tabs, pos)
+        if k == 0:
+            return self._line, pos
+        return self._line, self._cols[k - 1] + pos - self._tabs[k - 1] - 1
+
+    ########################################
+    #
+    ########################################
+    def _load_line(self, doc, line, tab_size):
+        text = doc.line_text(line)
+        self._doc = doc
+        self._tab_size = tab_size
+        self._line = line
+        self._start = doc.line_offset(line)
+        self._end = self._start + len(text)
+        self._tabs = array('Q')
+        self._cols = array('Q')
+        col = 0
+        last = 0
+        i = text.find('\t')
+        while i > -1:
+            col = (col + i - last) // tab_size * tab_size + tab_size
+            self._tabs.append(i)
+            self._cols.append(col)
+            last = i + 1
+            i = text.find('\t', last)
@@ -0,0 +1,71 @@
+from array import array
+
+DIRTY_BLOCK_SIZE = 0x1000  # 4 K chars
+
+
+########################################
+# Returns an array with a hash for each block of DIRTY_BLOCK_SIZE chars. text can be anything
+# that supports slicing into str, e.g. a str or a ctypes unicode buffer.
+########################################
+def block_hashes(text, text_len=None):
+    if text_len is None:
+        text_len = len(text)
+    return array('q', (hash(text[i:min(i + DIRTY_BLOCK_SIZE, text_len)]) for i in range(0, text_len, DIRTY_BLOCK_SIZE)))
+
+
+########################################
+# Tracks if a text differs from its saved version, with bounded work per edit.
+#
+# Instead of a copy of the saved text, only its length and block hashes are kept. Edits are
+# reported as replaced ranges and merged into a single span (in current text coordinates),
+# outside of which the text is known to be unchanged. Only when the text has its saved length
+# again, the blocks overlapping that span are rehashed and compared, so typing back to exactly
+# the saved content is still detected.
+########################################
+class DirtyTracker(object):
+
+    def __init__(self, text_len=0, hashes=None):
+        self.hashes = hashes if hashes is not None else array('q')
+        self.version = 0
+        self._saved_len = text_len
+        self._saved_version = 0
+        self._span = None
+
+    ########################################
+    # Range [start, old_end) of the text was replaced, the replacement ends at new_end
+    ########################################
+    def edited(self, start, old_end, new_end):
+        self.version += 1
+        if self._span is None:
+            self._span = (start, new_end)
+            return
+        lo, hi = self._span
+        if hi >= old_end:
+            hi += new_end - old_end
+        self._span = (min(lo, start), max(hi, new_end))
+
+    ########################################
+    # The text was changed in an unknown way
+    ########################################
+    def invalidate(self, text_len):
+        self.version += 1
+        self._span = (0, text_len)
+
+    ########################################
+    # get_text(start, end) must return the current text in the specified range
+    ########################################
+    def is_dirty(self, text_len, get_text):
+        if self.version == self._saved_version:
+            return False
+        if text_len != self._saved_len:
+            return True
+        lo, hi = self._span
+        hi = min(hi, text_len)
+        for block in range(lo // DIRTY_BLOCK_SIZE, -(-hi // DIRTY_BLOCK_SIZE)):
+            start = block * DIRTY_BLOCK_SIZE
+            if hash(get_text(start, min(start + DIRTY_BLOCK_SIZE, text_len))) != self.hashes[block]:
+                return True
+        # back to the saved text
+        self._span = None
+        self._saved_version = self.version
+        return False
@@ -0,0 +1,142 @@
+import codecs
+import random
+import re
+
+from resources.const import *
+
+ENCODINGS = {
+    IDM_ANSI:       'ansi',
+    IDM_UTF_16_LE:  'utf-16-le',
+    IDM_UTF_16_BE:  'utf-16-be',
+    IDM_UTF_8:      'utf-8',
+    IDM_UTF_8_BOM:  'utf-8-sig',
+}
+
+UTF8_CHUNK_SIZE = 0x100000  # 1 MB
+
+SAMPLE_BLOCK_SIZE = 0x1000  # 4 KB
+SAMPLE_BLOCKS = 16
+UTF16_MIN_PARITY_SCORE = 0.1
+
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
+
+
+########################################
+# Tries to detect the encoding of the specified bytes (or mmap)
+########################################
+def detect_encoding(data):
+    return sniff_encoding(data)[0]
+
+
+########################################
+# Detects the encoding of the specified bytes (or mmap) by only looking at a fixed number
+# of sample blocks: the head, the tail and random blocks spread over the interior.
+# So the cost doesn't depend on the data size.
+# Returns (encoding_id, confidence), confidence is between 0 and 1.
+########################################
+def sniff_encoding(data):
+    data_len = len(data)
+    if data_len == 0:
+        return IDM_UTF_8, 1.0
+    bom = get_bom(data[:3])
+    if bom:
+        return bom, 1.0
+
+    sampled = even_nulls = odd_nulls = 0
+    is_valid_utf8 = True
+    is_ascii = True
+    for start, end in _sample_blocks(data_len):
+        block = bytes(data[start:end])
+        sampled += len(block)
+        # blocks always start at even offsets, so parity is the same as in the full data
+        even_nulls += block[0::2].count(0)
+        odd_nulls += block[1::2].count(0)
+        if is_valid_utf8:
+            # interior blocks might start in the middle of a UTF-8 sequence
+            i = 0
+            while start > 0 and i < 3 and i < len(block) and block[i] & 0xC0 == 0x80:
+                i += 1
+            is_valid_utf8 = is_utf8(block[i:], end == data_len)
+            is_ascii = is_ascii and block.isascii()
+    coverage = sampled / data_len
+
+    # UTF-16 without BOM: for text in (mostly) latin script, every second byte is NUL
+    even_ratio = even_nulls / (sampled / 2)
+    odd_ratio = odd_nulls / (sampled / 2)
+    score = abs(even_ratio - odd_ratio)
+    if score > UTF16_MIN_PARITY_SCORE:
+        return (IDM_UTF_16_BE if even_ratio > odd_ratio else IDM_UTF_16_LE), min(1.0, 0.5 + score)
+    if data[0] == 0:
+        return IDM_UTF_16_BE, 0.5
+    if data_len > 1 and data[1] == 0:
+        return IDM_UTF_16_LE, 0.5
+
+    if is_valid_utf8:
+        if is_ascii:
+            # ASCII is a UTF-8 subset, but unsampled parts might still contain ANSI chars
+            return IDM_UTF_8, 0.5 + 0.5 * coverage
+        # valid multi-byte sequences are unlikely to appear by chance in ANSI text
+        return IDM_UTF_8, 0.9 + 0.1 * coverage
+    return IDM_ANSI, 0.5 if even_nulls + odd_nulls else 0.9
+
+
+########################################
+# Checks bytes for Byte-Order-Mark (BOM), returns BOM type or None
+########################################
+def get_bom(data):
+    if data[:3] == b'\xEF\xBB\xBF':
+        return IDM_UTF_8_BOM
+    elif data[:2] == b'\xFF\xFE':
+        return IDM_UTF_16_LE
+    elif data[:2] == b'\xFE\xFF':
+        return IDM_UTF_16_BE
+
+
+########################################
+# Checks bytes for invalid UTF-8 sequences
+# Notice: since ASCII is a UTF-8 subset, function also returns True for pure ASCII data
+#
+# ASCII runs are skipped with a single regex scan over the buffer (no copy), everything
+# else is fed chunk-wise to an incremental decoder, so sequences split at chunk borders
+# are handled. Truncated trailing sequences are reported as invalid, unless final is False
+# (i.e. data is only the head of a larger buffer).
+########################################
+def is_utf8(data, final=True):
+    mv = memoryview(data).cast('B')
+    data_len = len(mv)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pos = 0
+    try:
+        while pos < data_len:
+            if not decoder.getstate()[0]:
+                # no pending partial sequence, so we can jump to the next non-ASCII byte
+                m = _NON_ASCII.search(mv, pos)
+                if m is None:
+                    break
+                pos = m.start()
+            end = min(pos + UTF8_CHUNK_SIZE, data_len)
+            decoder.decode(mv[pos:end])
+            pos = end
+        if final:
+            decoder.decode(b'', True)
+    except UnicodeDecodeError:
+        return False  # invalid UTF-8 sequence
+    return True
+
+
+########################################
+# Returns (start, end) ranges of the blocks sampled by sniff_encoding(). Interior blocks are
+# picked randomly within equal strides, seeded by the data size, so results are reproducible.
+########################################
+def _sample_blocks(data_len):
+    if data_len <= SAMPLE_BLOCK_SIZE * SAMPLE_BLOCKS:
+        return [(0, data_len)]
+    blocks = [(0, SAMPLE_BLOCK_SIZE)]
+    stride = (data_len - 2 * SAMPLE_BLOCK_SIZE) // (SAMPLE_BLOCKS - 2)
+    rnd = random.Random(data_len)
+    for i in range(SAMPLE_BLOCKS - 2):
+        start = (SAMPLE_BLOCK_SIZE + i * stride + rnd.randrange(stride - SAMPLE_BLOCK_SIZE + 1)) & ~1
+        blocks.append((start, start + SAMPLE_BLOCK_SIZE))
+    start = (data_len - SAMPLE_BLOCK_SIZE) & ~1
+    blocks.append((start, data_len))
+    return blocks
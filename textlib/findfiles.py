@@ -0,0 +1,427 @@
+import contextlib
+import fnmatch
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from resources.const import *
+from .encoding import detect_encoding
+from .ingest import decode_text
+from .save import iter_chunks, run_stages, save_stages, write_text_file
+from .search import replace_template, search_pattern
+
+FIND_FILES_MMAP_MIN = 0x10000  # files of at least 64 KB are memory-mapped instead of read
+FIND_FILES_BINARY_SAMPLE = 0x2000  # 8 KB at the start of a file are checked for NUL bytes
+FIND_FILES_BATCH_FILES = 64  # max. number of files passed to a worker at once
+FIND_FILES_BATCH_SIZE = 0x800000  # 8 MB, max. total size of files passed to a worker at once
+FIND_FILES_PENDING = 4  # batches queued per worker
+FIND_FILES_MAX_FILE_HITS = 1000  # more hits in a single file are dropped
+FIND_FILES_LINE_MAX = 256  # chars of the hit's line that are reported
+
+# count reported for files that Replace in Files skipped, because they wouldn't be written back
+# byte by byte (except for the replacements), i.e. their encoding or EOLs would change
+REPLACE_SKIPPED = -1
+
+# encodings in which ASCII text is stored as ASCII bytes
+ASCII_ENCODINGS = (IDM_UTF_8, IDM_UTF_8_BOM, IDM_ANSI)
+
+# with re.IGNORECASE, these ASCII letters also match non-ASCII chars (e.g. 'k' the Kelvin sign)
+UNICODE_FOLDED = frozenset('iksIKS')
+
+_cancelled = None  # multiprocessing.Event of the job the worker process belongs to
+
+
+########################################
+# Splits a list of globs like '*.py; *.txt'
+########################################
+def split_globs(text):
+    return [glob for glob in (g.strip() for g in text.split(';')) if glob]
+
+
+########################################
+# Yields (filename, stat) of all files in folder and its subfolders whose names match one of
+# includes (or all if it's empty) and none of excludes. Excluded folders are not entered.
+########################################
+def iter_files(folder, includes=(), excludes=()):
+    stack = [folder]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        folders = []
+        for entry in entries:
+            if any(fnmatch.fnmatch(entry.name, glob) for glob in excludes):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.is_file() and (not includes or any(fnmatch.fnmatch(entry.name, glob) for glob in includes)):
+                    yield entry.path, entry.stat()
+            except OSError:
+                pass
+        stack.extend(reversed(folders))
+
+
+########################################
+# Returns True if data (bytes or mmap) doesn't look like text: it contains NUL chars near the
+# start. In UTF-16, NUL bytes are common, but a NUL char (two NUL bytes at an even offset) isn't,
+# while most binary data with enough NUL bytes to be detected as UTF-16 contains one.
+########################################
+def is_binary(data, encoding_id):
+    if encoding_id not in (IDM_UTF_16_LE, IDM_UTF_16_BE):
+        return data.find(b'\0', 0, FIND_FILES_BINARY_SAMPLE) > -1
+    pos = data.find(b'\0\0', 0, FIND_FILES_BINARY_SAMPLE)
+    while pos > -1 and pos % 2:
+        pos = data.find(b'\0\0', pos + 1, FIND_FILES_BINARY_SAMPLE)
+    return pos > -1
+
+
+########################################
+# Returns the bytes that a file in an ASCII compatible encoding must contain to match term, or
+# None if there is no such prefilter. Only literal ASCII terms can be checked on the raw bytes;
+# case-insensitive ones only if none of its letters has non-ASCII case variants.
+########################################
+def byte_prefilter(term, regex=False, match_case=True):
+    if regex or not term.isascii() or (not match_case and UNICODE_FOLDED.intersection(term)):
+        return None
+    return term.encode('ascii')
+
+
+########################################
+# Yields the raw data of a file: small files are read, others memory-mapped
+########################################
+@contextlib.contextmanager
+def open_data(filename):
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < FIND_FILES_MMAP_MIN:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+########################################
+# Decodes the raw data of a file like the editor does when loading it, returns (text,
+# eol_mode_id, encoding_id) with EOLs normalized to CRLF. Returns None for empty and binary
+# files, and for files that don't contain needle (if specified) in their raw bytes, which is
+# checked before any decoding.
+########################################
+def decode_data(data, needle=None, match_case=True):
+    if not data:
+        return None
+    # without NUL bytes or BOM, the file can't be UTF-16, so it's either UTF-8 or ANSI
+    # (which is only told apart when decoding), and detection can be skipped for the prefilter
+    encoding_id = IDM_UTF_8
+    if data[:2] in (b'\xFF\xFE', b'\xFE\xFF') or data.find(b'\0', 0, FIND_FILES_BINARY_SAMPLE) > -1:
+        encoding_id = detect_encoding(data)
+        if is_binary(data, encoding_id):
+            return None
+    if needle is not None and encoding_id in ASCII_ENCODINGS:
+        if not (data.find(needle) > -1 if match_case else _find_folded(data, needle)):
+            return None
+    return decode_text(data)
+
+
+########################################
+# Searches a single file for pattern, returns a list of hits (offset, length, line, line_text),
+# with offsets referring to the text with EOLs normalized to CRLF, as loaded by the editor.
+########################################
+def search_file(filename, pattern, needle=None, match_case=True):
+    with open_data(filename) as data:
+        decoded = decode_data(data, needle, match_case)
+    return find_hits(decoded[0], pattern) if decoded else []
+
+
+########################################
+# Replaces all matches of pattern in a single file with template (see replace_template()),
+# returns the number of replacements. The file is written atomically, with the encoding and EOL
+# mode it was loaded with. If that wouldn't reproduce its unchanged data exactly (e.g. because
+# of mixed EOLs in a non-CRLF file), it's left alone and REPLACE_SKIPPED is returned.
+# With dry_run=True, only the matches are counted.
+########################################
+def replace_file(filename, pattern, template, needle=None, match_case=True, dry_run=False):
+    with open_data(filename) as data:
+        decoded = decode_data(data, needle, match_case)
+        if decoded is None:
+            return 0
+        text, eol_mode_id, encoding_id = decoded
+        if dry_run:
+            return sum(1 for _ in pattern.finditer(text))
+        new_text, count = pattern.subn(template, text)
+        if count and not _encodes_to(text, eol_mode_id, encoding_id, data):
+            return REPLACE_SKIPPED
+    if count:
+        write_text_file(filename, new_text, eol_mode_id, encoding_id)
+    return count
+
+
+########################################
+# Returns the hits (offset, length, line, line_text) of pattern in text (with CRLF EOLs)
+########################################
+def find_hits(text, pattern):
+    hits = []
+    line = line_start = last = 0
+    for m in pattern.finditer(text):
+        start = m.start()
+        lines = text.count('\n', last, start)
+        if lines:
+            line += lines
+            line_start = text.rfind('\n', 0, start) + 1
+        last = start
+        line_end = text.find('\r\n', line_start, line_start + FIND_FILES_LINE_MAX)
+        line_text = text[line_start:line_end if line_end > -1 else line_start + FIND_FILES_LINE_MAX]
+        hits.append((start, m.end() - start, line, line_text))
+        if len(hits) == FIND_FILES_MAX_FILE_HITS:
+            break
+    return hits
+
+
+########################################
+# Searches bytes (or mmap) for needle ignoring ASCII case, in chunks, so the data is never
+# copied as a whole
+########################################
+def _find_folded(data, needle):
+    needle = needle.lower()
+    step = 0x100000
+    for start in range(0, len(data), step):
+        if bytes(data[start:start + step + len(needle) - 1]).lower().find(needle) > -1:
+            return True
+    return False
+
+
+########################################
+# Returns True if encoding text like the editor does when saving results in data
+########################################
+def _encodes_to(text, eol_mode_id, encoding_id, data):
+    pos = 0
+    for chunk in run_stages(iter_chunks(text), save_stages(eol_mode_id, encoding_id)):
+        if data[pos:pos + len(chunk)] != chunk:
+            return False
+        pos += len(chunk)
+    return pos == len(data)
+
+
+########################################
+# Runs in the worker processes
+########################################
+def _init_worker(cancelled):
+    global _cancelled
+    _cancelled = cancelled
+
+
+########################################
+# Searches a batch of files (in a worker process), returns (number of files searched,
+# [(filename, hits), ...] of the files with hits). Stops early once the job is cancelled.
+########################################
+def search_files(filenames, term, regex=False, match_case=True):
+    pattern = search_pattern(term, regex, match_case)
+    needle = byte_prefilter(term, regex, match_case)
+    results = []
+    searched = 0
+    for filename in filenames:
+        if _cancelled is not None and _cancelled.is_set():
+            break
+        searched += 1
+        try:
+            hits = search_file(filename, pattern, needle, match_case)
+        except (OSError, UnicodeDecodeError, ValueError):
+            continue
+        if hits:
+            results.append((filename, hits))
+    return searched, results
+
+
+########################################
+# Replaces in a batch of files (in a worker process), returns (number of files searched,
+# [(filename, count, error), ...] of the files with matches or errors)
+########################################
+def replace_files(filenames, term, replace, regex=False, match_case=True, dry_run=False):
+    pattern = search_pattern(term, regex, match_case)
+    template = replace_template(replace, regex)
+    needle = byte_prefilter(term, regex, match_case)
+    results = []
+    searched = 0
+    for filename in filenames:
+        if _cancelled is not None and _cancelled.is_set():
+            break
+        searched += 1
+        try:
+            count = replace_file(filename, pattern, template, needle, match_case, dry_run)
+        except UnicodeDecodeError:
+            # not a text file after all, like for searching
+            continue
+        except OSError as e:
+            results.append((filename, 0, e.strerror))
+            continue
+        except (UnicodeError, ValueError) as e:
+            results.append((filename, 0, str(e)))
+            continue
+        if count:
+            results.append((filename, count, None))
+    return searched, results
+
+
+########################################
+# Find in Files: searches all files of a folder tree in a pool of worker processes.
+#
+# A thread walks the tree and passes batches of files to the pool (at most FIND_FILES_PENDING
+# per worker are queued, so the walk doesn't run ahead too far), and calls callback(results)
+# for each finished batch with hits and callback(None) when the search is finished. callback
+# is called in that thread, not the one that started the search.
+# cancel() stops the walk, drops queued batches and makes the workers stop after their
+# current file.
+########################################
+class FindInFiles(object):
+
+    def __init__(self, folder, term, regex=False, match_case=True, includes=(), excludes=(), workers=None):
+        search_pattern(term, regex, match_case)  # raises re.error for invalid regular expressions
+        self.folder = folder
+        self.term = term
+        self.regex = regex
+        self.match_case = match_case
+        self.includes = includes
+        self.excludes = excludes
+        self.workers = workers or os.cpu_count() or 1
+        self.files_found = 0
+        self.files_searched = 0
+        self.done = False
+        self._cancelled = multiprocessing.Event()
+        self._thread = None
+
+    ########################################
+    #
+    ########################################
+    def start(self, callback):
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    ########################################
+    #
+    ########################################
+    def cancel(self):
+        self._cancelled.set()
+
+    ########################################
+    #
+    ########################################
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    ########################################
+    #
+    ########################################
+    def join(self):
+        if self._thread:
+            self._thread.join()
+
+    ########################################
+    #
+    ########################################
+    def _run(self, callback):
+        try:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self._cancelled,)) as executor:
+                self._search(executor, callback)
+        finally:
+            self.done = True
+            callback(None)
+
+    ########################################
+    #
+    ########################################
+    def _search(self, executor, callback):
+        self._map(executor, self._submit, self._iter_batches(self._iter_files()),
+                lambda futures: self._collect(futures, callback))
+
+    ########################################
+    # Submits batches with submit(executor, batch) and passes the finished futures to collect()
+    ########################################
+    def _map(self, executor, submit, batches, collect):
+        pending = set()
+        for batch in batches:
+            if self.cancelled:
+                break
+            while len(pending) >= self.workers * FIND_FILES_PENDING:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(submit(executor, batch))
+        while pending and not self.cancelled:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        # if cancelled, running batches still report the files they are done with
+        for future in pending:
+            future.cancel()
+        collect(wait(pending)[0])
+
+    ########################################
+    #
+    ########################################
+    def _submit(self, executor, batch):
+        return executor.submit(search_files, batch, self.term, self.regex, self.match_case)
+
+    ########################################
+    #
+    ########################################
+    def _iter_files(self):
+        for filename, stat in iter_files(self.folder, self.includes, self.excludes):
+            if self.cancelled:
+                return
+            self.files_found += 1
+            yield filename, stat
+
+    ########################################
+    # Groups (filename, stat) into batches of at most max_files filenames
+    ########################################
+    def _iter_batches(self, files, max_files=FIND_FILES_BATCH_FILES):
+        batch = []
+        batch_size = 0
+        for filename, stat in files:
+            if self.cancelled:
+                return
+            batch.append(filename)
+            batch_size += stat.st_size
+            if len(batch) == max_files or batch_size >= FIND_FILES_BATCH_SIZE:
+                yield batch
+                batch = []
+                batch_size = 0
+        if batch:
+            yield batch
+
+    ########################################
+    #
+    ########################################
+    def _collect(self, futures, callback):
+        for future in futures:
+            if future.cancelled() or future.exception():
+                continue
+            searched, results = future.result()
+            self.files_searched += searched
+            if results:
+                callback(results)
+
+
+########################################
+# Replace in Files: like FindInFiles, but the workers replace all matches in each file (see
+# replace_file()), and report (filename, count, error) for each file with matches or errors.
+# With dry_run=True, nothing is written, the counts are what would be replaced.
+########################################
+class ReplaceInFiles(FindInFiles):
+
+    def __init__(self, folder, term, replace, regex=False, match_case=True, includes=(), excludes=(),
+            dry_run=False, workers=None):
+        super().__init__(folder, term, regex, match_case, includes, excludes, workers)
+        # raises re.error for invalid backreferences
+        search_pattern(term, regex, match_case).sub(replace_template(replace, regex), '')
+        self.replace = replace
+        self.dry_run = dry_run
+
+    ########################################
+    #
+    ########################################
+    def _submit(self, executor, batch):
+        return executor.submit(replace_files, batch, self.term, self.replace, self.regex, self.match_case, self.dry_run)
@@ -0,0 +1,121 @@
+import re
+from collections import Counter
+from itertools import chain
+
+from .search import compile_pattern
+
+INDENT_SAMPLE_SIZE = 0x4000  # 16 K chars
+INDENT_SAMPLES = 16
+INDENT_MIN_LINES = 8  # indented lines needed to detect anything
+INDENT_SIZES = (2, 4, 8)
+INDENT_CHUNK_SIZE = 0x100000  # 1 M chars, indentation is converted in chunks of whole lines
+
+_INDENTED_LINE = re.compile(r'^([ \t]*)[^ \t\r\n]', re.MULTILINE)
+
+
+########################################
+# Returns block (whole lines, separated by LF or CRLF) with tab inserted at the start of each
+# line
+########################################
+def indent_block(block, tab):
+    return tab + block.replace('\n', '\n' + tab)
+
+
+########################################
+# Returns block with one tab removed from the start of each line that starts with it
+########################################
+def unindent_block(block, tab):
+    return ('\n' + block).replace('\n' + tab, '\n')[1:]
+
+
+########################################
+# Yields the deltas (offset, old, new) that convert the leading whitespace of each line from
+# tabs to spaces (use_spaces=True) or back: leading tabs become tab_size spaces each, leading
+# spaces become a tab per tab_size, remaining spaces are kept. Only the changed indentations are
+# touched, and like the ones of Replace All, the deltas are ascending with each offset including
+# the shift of all previous ones.
+# text can be a str or anything else that supports len(), find() and slicing (e.g. a
+# PieceTable), it's only sliced into chunks of about INDENT_CHUNK_SIZE chars, so it's never
+# copied as a whole.
+########################################
+def iter_indent_deltas(text, tab_size, use_spaces):
+    indent = r'(\t+)' if use_spaces else f'((?: {{{tab_size}}})+)'
+    tab = ' ' * tab_size
+    # lines are found by their preceding LF, which regex scans a lot faster than ^ in
+    # MULTILINE mode, so the first line of each chunk is matched separately
+    first_line = compile_pattern(indent, 0)
+    next_lines = compile_pattern('\n' + indent, 0)
+    # most lines share a few indentations, so the deltas share their strings
+    indents = {}
+    text_len = len(text)
+    shift = 0
+    start = 0
+    while start < text_len:
+        end = text.find('\n', start + INDENT_CHUNK_SIZE) + 1 or text_len
+        chunk = text[start:end]
+        first = first_line.match(chunk)
+        for m in chain([first] if first else [], next_lines.finditer(chunk)):
+            delta = indents.get(m.group(1))
+            if delta is None:
+                old = m.group(1)
+                delta = indents[old] = (old, tab * len(old) if use_spaces else '\t' * (len(old) // tab_size))
+            old, new = delta
+            yield start + m.start(1) + shift, old, new
+            shift += len(new) - len(old)
+        start = end
+
+
+########################################
+# Guesses the indentation of text from a histogram of the leading whitespace of its non-blank
+# lines, only looking at a fixed number of sample blocks. Returns (use_spaces, tab_size), each
+# None if it can't be told: tab_size is the most common step by which the indentation with
+# spaces grows from one line to the next, so it's None for text indented with tabs.
+# Like for iter_indent_deltas(), text can also be a PieceTable, only the sample blocks are
+# sliced from it.
+########################################
+def detect_indentation(text):
+    tabs = spaces = 0
+    steps = Counter()
+    for start, end in _sample_blocks(text):
+        width = 0
+        for m in _INDENTED_LINE.finditer(text[start:end]):
+            indent = m.group(1)
+            if not indent:
+                width = 0
+            elif indent[0] == '\t':
+                tabs += 1
+                width = None
+            elif '\t' in indent:
+                width = None
+            else:
+                spaces += 1
+                if width is not None and len(indent) > width:
+                    steps[len(indent) - width] += 1
+                width = len(indent)
+    if tabs + spaces < INDENT_MIN_LINES or tabs == spaces:
+        return None, None
+    if tabs > spaces:
+        return False, None
+    size = max(INDENT_SIZES, key=lambda size: steps[size])
+    return True, size if steps[size] else None
+
+
+########################################
+# Returns (start, end) of the sample blocks, starting and ending at line starts: the whole text
+# if it's small, otherwise blocks spread evenly over it
+########################################
+def _sample_blocks(text):
+    text_len = len(text)
+    if text_len <= INDENT_SAMPLE_SIZE * INDENT_SAMPLES:
+        return [(0, text_len)]
+    blocks = []
+    stride = (text_len - INDENT_SAMPLE_SIZE) // (INDENT_SAMPLES - 1)
+    for i in range(INDENT_SAMPLES):
+        start = i * stride
+        if start:
+            start = text.find('\n', start) + 1
+            if not start:
+                break
+        end = text.rfind('\n', start, start + INDENT_SAMPLE_SIZE) + 1
+        blocks.append((start, end or start + INDENT_SAMPLE_SIZE))
+    return blocks
@@ -0,0 +1,142 @@
+import codecs
+import mmap
+import os
+import re
+
+from resources.const import *
+from .encoding import ENCODINGS, detect_encoding
+
+INGEST_CHUNK_SIZE = 0x100000  # 1 MB
+
+EOL_MODES = {
+    IDM_EOL_CRLF:   '\r\n',
+    IDM_EOL_LF:     '\n',
+    IDM_EOL_CR:     '\r',
+}
+
+# chars outside the BMP, which take two UTF-16 code units (a surrogate pair)
+NON_BMP_CHARS = re.compile('[\U00010000-\U0010FFFF]')
+
+
+########################################
+# Tries to detect the EOL mode of the specified bytes or str
+########################################
+def detect_eol(data):
+    cr, lf = ('\r', '\n') if isinstance(data, str) else (b'\r', b'\n')
+    if data.find(cr) < 0:
+        return IDM_EOL_LF if data.find(lf) > -1 else IDM_EOL_CRLF
+    if data.find(lf) < 0:
+        return IDM_EOL_CR
+    return IDM_EOL_CRLF
+
+
+########################################
+# Decodes raw file data and normalizes its EOLs to CRLF (as used by the Edit control).
+# Returns (text, eol_mode_id, encoding_id).
+########################################
+def decode_text(data, encoding_id=None):
+    detect = encoding_id is None
+    if detect:
+        encoding_id = detect_encoding(data)
+    try:
+        text = str(data, ENCODINGS[encoding_id])
+    except UnicodeDecodeError:
+        # sampled detection missed invalid UTF-8 sequences
+        if not detect or encoding_id != IDM_UTF_8:
+            raise
+        encoding_id = IDM_ANSI
+        text = str(data, ENCODINGS[encoding_id])
+    return _join_chunks([text]) + (encoding_id,)
+
+
+########################################
+# Returns text with each char outside the BMP split into its UTF-16 surrogate pair (as separate
+# chars), so lengths and offsets count UTF-16 code units like the Edit control does.
+# Python's UTF-16 decoder joins pairs even with 'surrogatepass', so they are split explicitly.
+########################################
+def to_utf16_units(text):
+    if text.isascii() or len(text.encode('utf-16-le', 'surrogatepass')) == 2 * len(text):
+        return text
+    return NON_BMP_CHARS.sub(_surrogate_pair, text)
+
+
+########################################
+#
+########################################
+def _surrogate_pair(match):
+    code = ord(match.group()) - 0x10000
+    return chr(0xD800 | code >> 10) + chr(0xDC00 | code & 0x3FF)
+
+
+########################################
+# Reads a text file in a single sweep and returns (text, eol_mode_id, encoding_id),
+# with EOLs normalized to CRLF and chars outside the BMP split into surrogate pairs, i.e. the
+# text exactly as stored in the Edit control.
+#
+# The file is read and decoded chunk by chunk, so the raw bytes are never held in memory
+# as a whole. Encoding detection only samples a few blocks of the (memory-mapped) file, UTF-8
+# is then validated by the decoding itself. Only if that fails (i.e. the file is ANSI), the
+# file is read a second time.
+# EOLs are detected on the decoded text, which is also correct for UTF-16 data.
+########################################
+def read_text_file(filename, encoding_id=None):
+    with open(filename, 'rb') as f:
+        detect = encoding_id is None
+        if detect:
+            encoding_id = _detect_file_encoding(f)
+        try:
+            chunks = _decode_chunks(f, encoding_id)
+        except UnicodeDecodeError:
+            if not detect or encoding_id != IDM_UTF_8:
+                raise
+            f.seek(0)
+            encoding_id = IDM_ANSI
+            chunks = _decode_chunks(f, encoding_id)
+    return _join_chunks(chunks) + (encoding_id,)
+
+
+########################################
+#
+########################################
+def _detect_file_encoding(f):
+    if os.fstat(f.fileno()).st_size == 0:
+        return detect_encoding(b'')
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return detect_encoding(mm)
+
+
+########################################
+#
+########################################
+def _decode_chunks(f, encoding_id):
+    decoder = codecs.getincrementaldecoder(ENCODINGS[encoding_id])()
+    chunks = []
+    while True:
+        data = f.read(INGEST_CHUNK_SIZE)
+        if not data:
+            break
+        chunks.append(to_utf16_units(decoder.decode(data)))
+    chunks.append(to_utf16_units(decoder.decode(b'', True)))
+    return chunks
+
+
+########################################
+# Normalizes EOLs chunk by chunk (in place), so only the final join creates a full copy.
+# Since non-CRLF modes contain either only CR or only LF, chunk borders don't matter.
+########################################
+def _join_chunks(chunks):
+    has_cr = any(c.find('\r') > -1 for c in chunks)
+    has_lf = any(c.find('\n') > -1 for c in chunks)
+    if has_lf and not has_cr:
+        eol_mode_id = IDM_EOL_LF
+    elif has_cr and not has_lf:
+        eol_mode_id = IDM_EOL_CR
+    else:
+        eol_mode_id = IDM_EOL_CRLF
+    if eol_mode_id != IDM_EOL_CRLF:
+        eol = EOL_MODES[eol_mode_id]
+        for i, chunk in enumerate(chunks):
+            chunks[i] = chunk.replace(eol, '\r\n')
+    text = ''.join(chunks)
+    chunks.clear()
+    return text, eol_mode_id
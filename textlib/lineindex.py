@@ -0,0 +1,85 @@
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, islice
+
+LINE_INDEX_CHUNK = 0x100000  # 1 M chars
+
+
+########################################
+# Returns an array with the start offsets of all lines in text (lines are separated by LF)
+########################################
+def line_starts(text):
+    starts = array('I', [0])
+    for start in range(0, len(text), LINE_INDEX_CHUNK):
+        parts = text[start:start + LINE_INDEX_CHUNK].split('\n')
+        starts.extend(islice(accumulate(map((1).__add__, map(len, parts[:-1])), initial=start), 1, None))
+    return starts
+
+
+########################################
+# Line start offsets of a text, stored in a compact array('I') and patched on each edit.
+#
+# Edits shift the offsets of all following lines. Instead of updating the whole tail each time,
+# the shift is kept pending for all lines from self._gap on and only applied when an edit
+# happens before the gap or further down. So typing on one line costs O(1), moving to
+# another line O(distance) (both done by C loops), and lookups stay O(log n).
+########################################
+class LineIndex(object):
+
+    def __init__(self, text=''):
+        self._starts = line_starts(text)
+        self._gap = len(self._starts)  # offsets from here on are missing self._delta
+        self._delta = 0
+
+    ########################################
+    #
+    ########################################
+    def __len__(self):
+        return len(self._starts)
+
+    ########################################
+    # Returns the start offset of the specified 0-based line, or None if there are less lines
+    ########################################
+    def line_offset(self, line):
+        if line < 0:
+            return 0
+        if line >= len(self._starts):
+            return None
+        return self._starts[line] + (self._delta if line >= self._gap else 0)
+
+    ########################################
+    # Returns 0-based line index of the specified offset
+    ########################################
+    def line_from_offset(self, pos):
+        starts = self._starts
+        if self._gap < len(starts) and pos >= starts[self._gap] + self._delta:
+            return bisect_right(starts, pos - self._delta, self._gap) - 1
+        return max(0, bisect_right(starts, pos, 0, self._gap) - 1)
+
+    ########################################
+    # Range [start, end) of the text was replaced by text
+    ########################################
+    def replace(self, start, end, text):
+        first = self.line_from_offset(start) + 1  # first line start that might be affected
+        self._move_gap(first)
+        last = self.line_from_offset(end) + 1 if end > start else first
+        new = line_starts(text)
+        self._starts[first:last] = array('I', map(start.__add__, islice(new, 1, None)))
+        self._gap = first + len(new) - 1
+        self._delta += len(text) - (end - start)
+
+    ########################################
+    # Applies the pending shift up to the specified line
+    ########################################
+    def _move_gap(self, line):
+        starts, gap, delta = self._starts, self._gap, self._delta
+        if line == gap or not delta:
+            self._gap = line
+            return
+        if line > gap:
+            starts[gap:line] = array('I', map(delta.__add__, starts[gap:line]))
+        else:
+            # the shift can't be moved backwards (offsets are unsigned), so apply it completely
+            starts[gap:] = array('I', map(delta.__add__, starts[gap:]))
+            self._delta = 0
+        self._gap = line
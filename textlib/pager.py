@@ -0,0 +1,326 @@
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from resources.const import *
+from .encoding import detect_encoding
+from .ingest import EOL_MODES, detect_eol
+from .search import SearchSnapshot
+
+PAGE_SIZE = 0x40000  # 256 KB
+PAGE_CACHE_SIZE = 32  # max. number of decoded pages kept in memory
+
+# Codecs used for decoding single pages, the BOM (if any) is skipped instead
+PAGE_CODECS = {
+    IDM_ANSI:       'ansi',
+    IDM_UTF_16_LE:  'utf-16-le',
+    IDM_UTF_16_BE:  'utf-16-be',
+    IDM_UTF_8:      'utf-8',
+    IDM_UTF_8_BOM:  'utf-8',
+}
+
+
+########################################
+# Read-only, memory-mapped view of a (huge) text file.
+#
+# The file is split into pages of PAGE_SIZE bytes (adjusted to char boundaries), which are
+# decoded on demand and kept in a LRU cache. A sparse line index (number of EOLs before each
+# page) is built incrementally, either in a background thread or on demand, so memory usage
+# stays bounded no matter how big the file is.
+########################################
+class MappedFile(object):
+
+    def __init__(self, filename, encoding_id=None):
+        self._file = open(filename, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+        self.encoding_id = encoding_id if encoding_id else detect_encoding(self._mm)
+        self._codec = PAGE_CODECS[self.encoding_id]
+        self._is_utf16 = self.encoding_id in (IDM_UTF_16_LE, IDM_UTF_16_BE)
+        self._data_start = len(b'\xEF\xBB\xBF') if self.encoding_id == IDM_UTF_8_BOM else 0
+        if self._is_utf16 and self._mm[:2] in (b'\xFF\xFE', b'\xFE\xFF'):
+            self._data_start = 2
+
+        self.page_count = max(1, -(-(self.size - self._data_start) // PAGE_SIZE))
+        self._pages = OrderedDict()
+
+        # EOL mode can only be sampled, from the first page(s) that contain any EOL
+        # (a trailing CR might be the first half of a CRLF split between pages)
+        for page in range(min(self.page_count, PAGE_CACHE_SIZE)):
+            sample = self.page_text(page).rstrip('\r')
+            if sample.find('\n') > -1 or sample.find('\r') > -1:
+                break
+        self.eol_mode_id = detect_eol(sample)
+        self._eol = '\r' if self.eol_mode_id == IDM_EOL_CR else '\n'
+        self._eol_bytes = None if self._is_utf16 else self._eol.encode(self._codec)
+
+        # _eol_counts[i] is the number of EOLs before page i
+        self._eol_counts = array('Q', [0])
+        self._index_lock = threading.Lock()
+        self._index_thread = None
+        self._closed = False
+
+    ########################################
+    #
+    ########################################
+    def close(self):
+        self._closed = True
+        if self._index_thread:
+            self._index_thread.join()
+        self._pages.clear()
+        if self.size:
+            self._mm.close()
+        self._file.close()
+
+    ########################################
+    # Builds the line index in a background thread
+    ########################################
+    def start_indexing(self):
+        if self._index_thread is None:
+            self._index_thread = threading.Thread(target=self._index_all, daemon=True)
+            self._index_thread.start()
+
+    ########################################
+    #
+    ########################################
+    @property
+    def is_indexed(self):
+        return len(self._eol_counts) > self.page_count
+
+    ########################################
+    # Returns the fraction (0..1) of the file that has been indexed
+    ########################################
+    @property
+    def index_progress(self):
+        return (len(self._eol_counts) - 1) / self.page_count
+
+    ########################################
+    # Returns byte offset of the first char of the specified page
+    ########################################
+    def page_start(self, page):
+        if page >= self.page_count:
+            return self.size
+        pos = self._data_start + page * PAGE_SIZE
+        if page == 0:
+            return pos
+        if self._is_utf16:
+            # don't split surrogate pairs
+            unit = self._mm[pos:pos + 2]
+            if unit[0 if self.encoding_id == IDM_UTF_16_BE else 1] & 0xFC == 0xDC:
+                pos += 2
+        elif self.encoding_id != IDM_ANSI:
+            # skip UTF-8 continuation bytes
+            end = min(pos + 3, self.size)
+            while pos < end and self._mm[pos] & 0xC0 == 0x80:
+                pos += 1
+        return pos
+
+    ########################################
+    #
+    ########################################
+    def page_of(self, offset):
+        page = min(max(offset - self._data_start, 0) // PAGE_SIZE, self.page_count - 1)
+        if page > 0 and offset < self.page_start(page):
+            page -= 1
+        return page
+
+    ########################################
+    # Returns decoded text of the specified page (raw EOLs), using the LRU cache
+    ########################################
+    def page_text(self, page):
+        text = self._pages.get(page)
+        if text is not None:
+            self._pages.move_to_end(page)
+            return text
+        text = self._decode(page)
+        self._pages[page] = text
+        if len(self._pages) > PAGE_CACHE_SIZE:
+            self._pages.popitem(last=False)
+        return text
+
+    ########################################
+    # Returns text of num_pages pages starting at first_page, with EOLs normalized
+    # to CRLF, and a list of the positions at which each page starts in this text.
+    ########################################
+    def window(self, first_page, num_pages):
+        texts = [self.page_text(page) for page in range(first_page, min(first_page + num_pages, self.page_count))]
+        starts = []
+        pos = 0
+        for text in texts:
+            starts.append(pos)
+            pos += self._display_len(text)
+        text = ''.join(texts)
+        if self.eol_mode_id != IDM_EOL_CRLF:
+            text = text.replace(EOL_MODES[self.eol_mode_id], '\r\n')
+        return text, starts
+
+    ########################################
+    # Converts byte offset into position in window text starting at first_page
+    ########################################
+    def display_pos(self, first_page, offset):
+        page = self.page_of(offset)
+        pos = sum(self._display_len(self.page_text(p)) for p in range(first_page, page))
+        return pos + self._display_len(self._text_between(self.page_start(page), offset))
+
+    ########################################
+    # Converts position in window text starting at first_page into byte offset
+    ########################################
+    def display_offset(self, first_page, pos):
+        for page in range(first_page, self.page_count):
+            text = self.page_text(page)
+            page_len = self._display_len(text)
+            if pos < page_len or page == self.page_count - 1:
+                break
+            pos -= page_len
+        if self.eol_mode_id == IDM_EOL_CRLF:
+            i = min(pos, len(text))
+        else:
+            # each EOL is 2 chars in window text
+            i = 0
+            while pos > 0:
+                k = text.find(self._eol, i)
+                if k < 0 or pos <= k - i:
+                    i = min(i + pos, len(text))
+                    break
+                pos -= k - i + 2
+                i = k + 1
+        return self.page_start(page) + self._encoded_len(text[:i])
+
+    ########################################
+    # Returns 0-based line index of the specified byte offset
+    ########################################
+    def line_from_offset(self, offset):
+        page = self.page_of(offset)
+        self._index_until(page)
+        return self._eol_counts[page] + self._count_eols(self.page_start(page), offset)
+
+    ########################################
+    # Returns byte offset of the start of the specified 0-based line, or None if the file
+    # has less lines
+    ########################################
+    def line_offset(self, line):
+        if line <= 0:
+            return self._data_start
+        while self._eol_counts[-1] < line and not self.is_indexed:
+            self._index_until(len(self._eol_counts) - 1)
+        if self._eol_counts[-1] < line:
+            return None
+        # page that contains the line-th EOL
+        page = bisect_left(self._eol_counts, line) - 1
+        n = line - self._eol_counts[page]
+        start, end = self.page_start(page), self.page_start(page + 1)
+        if self._eol_bytes:
+            pos = start - 1
+            for _ in range(n):
+                pos = self._mm.find(self._eol_bytes, pos + 1, end)
+            return pos + 1
+        text = self.page_text(page)
+        i = -1
+        for _ in range(n):
+            i = text.find(self._eol, i + 1)
+        return start + self._encoded_len(text[:i + 1])
+
+    ########################################
+    #
+    ########################################
+    def line_count(self):
+        self._index_until(self.page_count - 1)
+        return self._eol_counts[-1] + 1
+
+    ########################################
+    # Finds needle, starting at the specified byte offset. Returns byte offset of match or -1.
+    # Matches must not contain EOLs.
+    ########################################
+    def find(self, needle, offset, match_case=True, search_up=False):
+        if match_case and self._eol_bytes:
+            # fast path for 8-bit EOL encodings, search directly in the mapped file
+            try:
+                data = needle.encode(self._codec)
+            except UnicodeEncodeError:
+                # the codepage can't represent needle, but the decoded pages may contain it
+                # (e.g. as U+FFFD)
+                data = None
+            if data is not None:
+                if search_up:
+                    return self._mm.rfind(data, self._data_start, offset + len(data) - 1)
+                return self._mm.find(data, offset)
+
+        # pages are searched with SearchSnapshot, which maps matches in the case-folded text
+        # back to the page text. A match is at most as long as the (folded) needle, so that
+        # many chars of the next page are appended for matches across the page border.
+        overlap = len(needle if match_case else needle.lower()) - 1
+        page = self.page_of(offset)
+        pages = range(page, -1, -1) if search_up else range(page, self.page_count)
+        for p in pages:
+            text = self.page_text(p)
+            page_len = len(text)
+            if p + 1 < self.page_count:
+                text += self.page_text(p + 1)[:overlap]
+            snapshot = SearchSnapshot(text)
+            start, end = 0, page_len + overlap
+            if p == page:
+                i = len(self._text_between(self.page_start(p), offset))
+                if search_up:
+                    end = i + len(needle) - 1
+                else:
+                    start = i
+            found = snapshot.find(needle, start, min(end, len(text)), match_case, search_up)
+            if found:
+                return self.page_start(p) + self._encoded_len(text[:found[0]])
+        return -1
+
+    ########################################
+    #
+    ########################################
+    def _decode(self, page):
+        return str(self._mm[self.page_start(page):self.page_start(page + 1)], self._codec, 'replace')
+
+    ########################################
+    #
+    ########################################
+    def _text_between(self, start, end):
+        return str(self._mm[start:end], self._codec, 'replace')
+
+    ########################################
+    #
+    ########################################
+    def _encoded_len(self, text):
+        return len(text.encode(self._codec, 'replace'))
+
+    ########################################
+    # Length of text after EOL normalization to CRLF
+    ########################################
+    def _display_len(self, text):
+        if self.eol_mode_id == IDM_EOL_CRLF:
+            return len(text)
+        return len(text) + text.count(self._eol)
+
+    ########################################
+    #
+    ########################################
+    def _count_eols(self, start, end):
+        if self._eol_bytes:
+            return self._mm[start:end].count(self._eol_bytes)
+        return self._text_between(start, end).count(self._eol)
+
+    ########################################
+    # Extends the line index up to (including) the specified page
+    ########################################
+    def _index_until(self, page):
+        with self._index_lock:
+            while len(self._eol_counts) <= page + 1 and not self._closed:
+                p = len(self._eol_counts) - 1
+                self._eol_counts.append(self._eol_counts[-1] + self._count_eols(self.page_start(p), self.page_start(p + 1)))
+
+    ########################################
+    #
+    ########################################
+    def _index_all(self):
+        for page in range(self.page_count):
+            if self._closed:
+                break
+            self._index_until(page)
@@ -0,0 +1,76 @@
+from array import array
+
+PAGINATION_MAX_LINES = 0x10000  # lines laid out per step of the (incremental) pagination
+
+
+########################################
+# Splits lines into pages for printing. The layout matches what the printer does: each line
+# is word-wrapped into the page width, and a line that doesn't fit on the current page starts
+# the next one (unless the page is empty, then it's cut off instead of leaving a blank page).
+#
+# Only the first line of each page is stored, so the text can be printed (or previewed) from
+# any page without measuring the preceding ones again. Pages are laid out on demand, so
+# getting page n only measures the lines up to its end.
+#
+# measure(line) returns the height of a (LF-less) line when wrapped into the page width, e.g.
+# via DrawTextW(DT_CALCRECT). It's the only expensive part, so lines of at most fit_len chars,
+# which can't wrap, are assumed to be line_height high without measuring them.
+# key identifies everything the layout depends on (text version, font, paper, margins,
+# resolution), so a cached pagination can be reused as long as its key is the same.
+########################################
+class Pagination(object):
+
+    def __init__(self, line_count, line_text, measure, page_height, line_height=0, fit_len=0, key=None):
+        self.line_count = line_count
+        self.line_text = line_text
+        self.measure = measure
+        self.page_height = page_height
+        self.line_height = line_height
+        self.fit_len = fit_len
+        self.key = key
+        self.done = line_count == 0
+        self._starts = array('Q', [0])  # first line of each page
+        self._line = 0  # next line to lay out
+        self._top = 0  # its y position on the last page
+
+    ########################################
+    # Returns the total number of pages (at least 1), laying out all of them
+    ########################################
+    def page_count(self):
+        while not self.done:
+            self.step()
+        return len(self._starts)
+
+    ########################################
+    # Returns the range of the line indexes on the specified (1-based) page, which is empty if
+    # there is no such page
+    ########################################
+    def page_lines(self, page):
+        while len(self._starts) <= page and not self.done:
+            self.step()
+        if not 0 < page <= len(self._starts):
+            return range(0)
+        return range(self._starts[page - 1], self._starts[page] if page < len(self._starts) else self.line_count)
+
+    ########################################
+    # Lays out at most max_lines more lines, returns True when done
+    ########################################
+    def step(self, max_lines=PAGINATION_MAX_LINES):
+        line_text, measure, page_height = self.line_text, self.measure, self.page_height
+        line_height, fit_len = self.line_height, self.fit_len
+        starts = self._starts
+        top = self._top
+        i = self._line
+        end = min(self.line_count, i + max_lines)
+        while i < end:
+            line = line_text(i)
+            h = line_height if len(line) <= fit_len else measure(line)
+            if top + h > page_height and top > 0:
+                starts.append(i)
+                top = 0
+            top += h
+            i += 1
+        self._line = i
+        self._top = top
+        self.done = i == self.line_count
+        return self.done
@@ -0,0 +1,258 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, islice
+
+from .lineindex import LineIndex
+
+PIECE_MAX_COUNT = 0x2000  # the table is compacted into a new original text beyond this
+PIECE_APPEND_MAX = 0x400  # typed text is appended to the previous insert up to this length
+
+
+########################################
+# Piece table: the text is described by a list of pieces (buffer, start, end), which refer
+# either to the original text or to inserted strings (the "add buffer", which is split into
+# one str per insert). Since Python strings are immutable, pieces never have to be copied,
+# and a snapshot of the table is just a copy of the piece list.
+#
+# Edits only touch the pieces they overlap, so their cost depends on the number of pieces,
+# not on the size of the text. Consecutively typed chars are appended to the previous insert,
+# and the table is compacted once it consists of more than PIECE_MAX_COUNT pieces.
+#
+# Supports len(), str() and slicing like a str, so it can be passed to functions that expect
+# something sliceable into str chunks (e.g. write_text_file).
+# Lines are separated by LF (i.e. also by CRLF), the line index is created on demand and then
+# patched on each edit.
+########################################
+class PieceTable(object):
+
+    def __init__(self, text=''):
+        self._pieces = [(text, 0, len(text))] if text else []
+        self._starts = [0] if text else []  # offset of each piece
+        self._lines = None
+        self._len = len(text)
+        self._last_insert = -1  # index of the piece typed text can be appended to
+
+    def __len__(self):
+        return self._len
+
+    def __str__(self):
+        if len(self._pieces) == 1:
+            buf, start, end = self._pieces[0]
+            return buf[start:end]
+        return ''.join([buf[start:end] for buf, start, end in self._pieces])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._len)
+            if step != 1:
+                return str(self)[key]
+            return self.substring(start, stop)
+        if key < 0:
+            key += self._len
+        if not 0 <= key < self._len:
+            raise IndexError('PieceTable index out of range')
+        i = self._piece_at(key)
+        buf, start, end = self._pieces[i]
+        return buf[start + key - self._starts[i]]
+
+    ########################################
+    # Returns a copy of the table, which isn't affected by later edits
+    ########################################
+    def snapshot(self):
+        doc = PieceTable.__new__(PieceTable)
+        doc.__dict__.update(self.__dict__)
+        doc._pieces = self._pieces[:]
+        doc._starts = self._starts[:]
+        doc._lines = None
+        doc._last_insert = -1
+        return doc
+
+    ########################################
+    #
+    ########################################
+    def substring(self, start, end):
+        end = min(end, self._len)
+        if start >= end:
+            return ''
+        parts = []
+        i = self._piece_at(start)
+        while start < end:
+            buf, s, e = self._pieces[i]
+            a = s + start - self._starts[i]
+            b = min(e, s + end - self._starts[i])
+            parts.append(buf[a:b])
+            start += b - a
+            i += 1
+        return parts[0] if len(parts) == 1 else ''.join(parts)
+
+    ########################################
+    #
+    ########################################
+    def insert(self, pos, text):
+        self.replace(pos, pos, text)
+
+    ########################################
+    #
+    ########################################
+    def delete(self, start, end):
+        self.replace(start, end, '')
+
+    ########################################
+    # Replaces range [start, end) with text
+    ########################################
+    def replace(self, start, end, text):
+        start = max(0, min(start, self._len))
+        end = max(start, min(end, self._len))
+        if start == end and not text:
+            return
+        if self._lines is not None:
+            self._lines.replace(start, end, text)
+        pieces = self._pieces
+
+        # typing: append to the previous insert
+        i = self._last_insert
+        if start == end and 0 <= i < len(pieces):
+            buf, s, e = pieces[i]
+            if (self._starts[i] + e - s == start and e == len(buf) and s == 0 and
+                    len(buf) + len(text) <= PIECE_APPEND_MAX):
+                pieces[i] = (buf + text, 0, e + len(text))
+                self._shift_starts(i + 1, len(text))
+                self._len += len(text)
+                return
+
+        # pieces[i:j] are replaced by the remains of the first/last one and the new text
+        i = max(0, bisect_right(self._starts, start) - 1)
+        base = self._starts[i] if i < len(pieces) else self._len
+        new = []
+        if i < len(pieces) and start > base:
+            buf, s, e = pieces[i]
+            if start - base < e - s:
+                new.append((buf, s, s + start - base))
+            else:
+                i += 1
+                base = start
+        j = bisect_left(self._starts, end, i)
+        if text:
+            self._last_insert = i + len(new)
+            new.append((text, 0, len(text)))
+        else:
+            self._last_insert = -1
+        if j > i:
+            buf, s, e = pieces[j - 1]
+            offset = self._starts[j - 1]
+            if offset + e - s > end:
+                new.append((buf, s + end - offset, e))
+
+        pieces[i:j] = new
+        self._len += len(text) - (end - start)
+        if i < len(pieces):
+            self._starts[i:] = accumulate((e - s for _, s, e in islice(pieces, i, len(pieces) - 1)), initial=base)
+        else:
+            del self._starts[i:]
+
+        if len(pieces) > PIECE_MAX_COUNT:
+            lines = self._lines
+            self.__init__(str(self))
+            self._lines = lines
+
+    ########################################
+    # Returns the lowest index of sub in range [start, end), or -1
+    ########################################
+    def find(self, sub, start=0, end=None):
+        end = self._len if end is None else min(end, self._len)
+        overlap = len(sub) - 1
+        if overlap < 0 or end - start <= overlap:
+            return -1 if overlap >= 0 or start > end else start
+        for i in range(self._piece_at(start), len(self._pieces)):
+            buf, s, e = self._pieces[i]
+            offset = self._starts[i]
+            if offset >= end:
+                break
+            # match inside the piece
+            pos = buf.find(sub, s + max(start - offset, 0), s + min(end - offset, e - s))
+            if pos > -1:
+                return offset + pos - s
+            # match across the piece's end
+            border = offset + e - s
+            if border < end and overlap:
+                pos = self.substring(max(border - overlap, start), min(border + overlap, end)).find(sub)
+                if pos > -1:
+                    return max(border - overlap, start) + pos
+        return -1
+
+    ########################################
+    # Returns the highest index of sub in range [start, end), or -1
+    ########################################
+    def rfind(self, sub, start=0, end=None):
+        end = self._len if end is None else min(end, self._len)
+        overlap = len(sub) - 1
+        if overlap < 0 or end - start <= overlap:
+            return -1 if overlap >= 0 or start > end else end
+        for i in range(self._piece_at(end - 1), -1, -1):
+            buf, s, e = self._pieces[i]
+            offset = self._starts[i]
+            # match across the piece's end
+            border = offset + e - s
+            if border < end and overlap:
+                pos = self.substring(max(border - overlap, start), min(border + overlap, end)).rfind(sub)
+                if pos > -1:
+                    return max(border - overlap, start) + pos
+            # match inside the piece
+            pos = buf.rfind(sub, s + max(start - offset, 0), s + min(end - offset, e - s))
+            if pos > -1:
+                return offset + pos - s
+            if offset <= start:
+                break
+        return -1
+
+    ########################################
+    #
+    ########################################
+    def line_count(self):
+        return len(self._get_lines())
+
+    ########################################
+    # Returns 0-based line index of the specified position
+    ########################################
+    def line_from_offset(self, pos):
+        return self._get_lines().line_from_offset(max(0, min(pos, self._len)))
+
+    ########################################
+    # Returns the position of the start of the specified 0-based line, or None if there
+    # are less lines
+    ########################################
+    def line_offset(self, line):
+        return self._get_lines().line_offset(line)
+
+    ########################################
+    # Returns the text of the specified 0-based line without its EOL, or None if there are
+    # less lines
+    ########################################
+    def line_text(self, line):
+        start = self.line_offset(line)
+        if start is None:
+            return None
+        end = self.line_offset(line + 1)
+        text = self.substring(start, self._len if end is None else end - 1)
+        return text[:-1] if text.endswith('\r') else text
+
+    ########################################
+    #
+    ########################################
+    def _piece_at(self, pos):
+        return max(0, bisect_right(self._starts, pos) - 1)
+
+    ########################################
+    #
+    ########################################
+    def _shift_starts(self, i, delta):
+        starts = self._starts
+        for k in range(i, len(starts)):
+            starts[k] += delta
+
+    ########################################
+    #
+    ########################################
+    def _get_lines(self):
+        if self._lines is None:
+            self._lines = LineIndex(str(self))
+        return self._lines
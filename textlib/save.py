@@ -0,0 +1,200 @@
+import codecs
+import functools
+import os
+import shutil
+import tempfile
+
+from resources.const import *
+from .encoding import ENCODINGS
+from .ingest import EOL_MODES
+
+SAVE_CHUNK_SIZE = 0x100000  # 1 MB (chars)
+
+
+########################################
+# Yields text in chunks of (about) SAVE_CHUNK_SIZE chars. text can be anything that supports
+# slicing into str, e.g. a str or a ctypes unicode buffer (which avoids copying it as a whole).
+# A chunk never ends between CR and LF or inside a surrogate pair, so chunks can be
+# EOL-converted and encoded independently.
+########################################
+def iter_chunks(text, text_len=None):
+    if text_len is None:
+        text_len = len(text)
+    pos = 0
+    while pos < text_len:
+        end = min(pos + SAVE_CHUNK_SIZE, text_len)
+        chunk = text[pos:end]
+        if (chunk[-1] == '\r' or '\ud800' <= chunk[-1] <= '\udbff') and end < text_len:
+            chunk += text[end]
+            end += 1
+        yield chunk
+        pos = end
+
+
+########################################
+# Removes spaces and tabs at the end of each line. Whitespace at the end of a chunk is held
+# back until it's known whether more text follows in the same line.
+########################################
+def trim_trailing_whitespace(chunks):
+    pending = ''
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        stripped = chunk.rstrip(' \t')
+        pending = chunk[len(stripped):]
+        if stripped:
+            yield _trim_lines(stripped)
+
+
+########################################
+# Returns chunk with trailing whitespace removed from each line that ends with an EOL. Lines
+# to trim are found with str.find(), which is a lot faster than letting a regex try a match
+# at each space, and usually there are only a few of them.
+########################################
+def _trim_lines(chunk):
+    parts = []
+    pos = 0
+    space = chunk.find(' \r\n')
+    tab = chunk.find('\t\r\n')
+    while space > -1 or tab > -1:
+        eol = (space if tab < 0 or -1 < space < tab else tab) + 1
+        line_start = chunk.rfind('\n', pos, eol) + 1 or pos
+        parts.append(chunk[pos:line_start])
+        parts.append(chunk[line_start:eol].rstrip(' \t'))
+        pos = eol
+        if space > -1 and space < pos:
+            space = chunk.find(' \r\n', pos)
+        if tab > -1 and tab < pos:
+            tab = chunk.find('\t\r\n', pos)
+    if not parts:
+        return chunk
+    parts.append(chunk[pos:])
+    return ''.join(parts)
+
+
+########################################
+# Appends an EOL to non-empty text that doesn't end with one
+########################################
+def ensure_final_newline(chunks):
+    last = ''
+    for chunk in chunks:
+        if chunk:
+            last = chunk
+            yield chunk
+    if last and not last.endswith('\r\n'):
+        yield '\r\n'
+
+
+########################################
+# Converts CRLF (as used by the Edit control) to the specified EOL mode
+########################################
+def convert_eols(chunks, eol_mode_id):
+    if eol_mode_id == IDM_EOL_CRLF:
+        yield from chunks
+        return
+    eol = EOL_MODES[eol_mode_id]
+    for chunk in chunks:
+        yield chunk.replace('\r\n', eol)
+
+
+########################################
+# Joins the UTF-16 surrogate pairs of Edit control text (see ingest.to_utf16_units()) into the
+# chars they encode. Lone surrogates are kept, so encoding them fails as before.
+########################################
+def join_surrogates(text):
+    if text.isascii():
+        return text
+    return text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'surrogatepass')
+
+
+########################################
+#
+########################################
+def encode_chunks(chunks, encoding_id):
+    encoder = codecs.getincrementalencoder(ENCODINGS[encoding_id])()
+    for chunk in chunks:
+        yield encoder.encode(join_surrogates(chunk))
+    yield encoder.encode('', True)
+
+
+########################################
+# Returns the chain of save stages that turns Edit control text into the bytes of a file with
+# the specified EOL mode and encoding, optionally trimming trailing whitespace and ensuring
+# a final EOL.
+# A stage is a generator function that takes an iterable of chunks and yields the transformed
+# chunks, so any chain of them streams the text in a single pass. Text stages take and yield
+# str chunks with CRLF EOLs that never end between CR and LF, so they have to come before
+# convert_eols() and encode_chunks().
+########################################
+def save_stages(eol_mode_id, encoding_id, trim_whitespace=False, final_newline=False):
+    stages = []
+    if trim_whitespace:
+        stages.append(trim_trailing_whitespace)
+    if final_newline:
+        stages.append(ensure_final_newline)
+    stages.append(functools.partial(convert_eols, eol_mode_id=eol_mode_id))
+    stages.append(functools.partial(encode_chunks, encoding_id=encoding_id))
+    return stages
+
+
+########################################
+# Passes chunks through stages in order, returns the resulting generator
+########################################
+def run_stages(chunks, stages):
+    for stage in stages:
+        chunks = stage(chunks)
+    return chunks
+
+
+########################################
+# Calls progress with the fraction (0..1) of text_len chars passed through so far
+########################################
+def report_progress(chunks, text_len, progress):
+    done = 0
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        progress(done / text_len)
+
+
+########################################
+# Writes byte chunks atomically to filename: data is streamed into a temp file in the same
+# directory, which is flushed to disk and then moved into place. So if anything fails on the
+# way, the original file stays untouched.
+########################################
+def write_atomic(filename, chunks):
+    filename = os.path.abspath(filename)
+    fd, tmp_filename = tempfile.mkstemp(prefix='~' + os.path.basename(filename) + '.',
+            suffix='.tmp', dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in chunks:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(filename):
+            # keep permissions of the original file, the temp file was created private
+            shutil.copymode(filename, tmp_filename)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+
+########################################
+# Saves Edit control text (with CRLF EOLs) to filename, using the specified EOL mode and
+# encoding, and optionally trimming trailing whitespace and ensuring a final EOL. All of it
+# is done chunk by chunk by save_stages(), so no full copies of the text are created.
+# progress (optional) is called with the fraction (0..1) of text saved so far.
+########################################
+def write_text_file(filename, text, eol_mode_id, encoding_id, text_len=None, progress=None,
+        trim_whitespace=False, final_newline=False):
+    if text_len is None:
+        text_len = len(text)
+    chunks = iter_chunks(text, text_len)
+    if progress:
+        chunks = report_progress(chunks, text_len, progress)
+    write_atomic(filename, run_stages(chunks, save_stages(eol_mode_id, encoding_id, trim_whitespace, final_newline)))
@@ -0,0 +1,395 @@
+import functools
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+PATTERN_CACHE_SIZE = 16
+SEARCH_BACK_CHUNK = 0x10000  # 64 K chars, doubled for each step back
+FOLD_CHUNK = 0x100000  # 1 M chars
+COUNT_CHUNK = 0x40000  # 256 K chars searched between time checks
+COUNT_CANDIDATES = 0x1000  # matches checked (or found by regex) between time checks
+COUNT_REUSE_RATIO = 64  # previous matches are only checked if there are less than 1 per 64 chars
+
+
+########################################
+# Compiled patterns are kept in a small LRU cache, so repeated searches never recompile
+########################################
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern, flags):
+    return re.compile(pattern, flags)
+
+
+########################################
+# Returns compiled pattern for the search term, which is either a regular expression or
+# literal text. Raises re.error for invalid regular expressions.
+########################################
+def search_pattern(term, regex=False, match_case=True):
+    flags = re.MULTILINE | (0 if match_case else re.IGNORECASE)
+    if not regex:
+        return compile_pattern(re.escape(term), flags)
+    # compiled as is first, so errors refer to the term as typed
+    dotall = bool(compile_pattern(term, flags).flags & re.DOTALL)
+    return compile_pattern(crlf_regex(term, dotall), flags)
+
+
+########################################
+# Rewrites a regular expression for text with CRLF EOLs (as in the Edit control and decoded
+# files). In MULTILINE mode, $ matches before LF, i.e. between CR and LF, and . matches CR, so
+# matches could end with a CR or remove it. Unescaped $ outside of character classes becomes
+# a lookahead for CRLF or the end of the text, and . (unless DOTALL) doesn't match CR either.
+########################################
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def crlf_regex(regex, dotall=False):
+    parts = []
+    in_class = False
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        end = i + 1
+        piece = None
+        if c == '\\':
+            end += 1
+        elif in_class:
+            in_class = c != ']'
+        elif c == '[':
+            # ] right after [ or [^ is a literal
+            if regex.startswith('^', end):
+                end += 1
+            if regex.startswith(']', end):
+                end += 1
+            in_class = True
+        elif c == '$':
+            piece = r'(?=\r\n|\Z)'
+        elif c == '.' and not dotall:
+            piece = r'[^\r\n]'
+        parts.append(regex[i:end] if piece is None else piece)
+        i = end
+    return ''.join(parts)
+
+
+########################################
+# Returns the first match in text[start:end], or None
+########################################
+def search_forward(text, pattern, start=0, end=None):
+    return pattern.search(text, start, len(text) if end is None else end)
+
+
+########################################
+# Returns the last match that starts and ends in text[start:end], or None.
+# Instead of scanning all of text[start:end], it is searched in growing chunks backwards from
+# end, so the cost depends on the distance to the match.
+########################################
+def search_backward(text, pattern, start=0, end=None):
+    if end is None:
+        end = len(text)
+    chunk = SEARCH_BACK_CHUNK
+    bound = end  # matches starting at or after bound have been checked already
+    while bound > start:
+        lo = max(start, bound - chunk)
+        last = None
+        for m in pattern.finditer(text, lo, end):
+            if m.start() >= bound:
+                break
+            last = m
+        if last:
+            return last
+        bound = lo
+        chunk *= 2
+    return None
+
+
+########################################
+# Returns the replacement for match: for regular expressions with backreferences (\1, \g<name>)
+# expanded, otherwise literally
+########################################
+def expand_match(match, replace, regex=False):
+    if regex and '\\' in replace:
+        return match.expand(replace)
+    return replace
+
+
+########################################
+# Returns replace as template for pattern.sub(), with the same meaning as in expand_match()
+########################################
+def replace_template(replace, regex=False):
+    return replace if regex else replace.replace('\\', '\\\\')
+
+
+########################################
+# Immutable copy of a text for searching, created once per version of the document and
+# reused for all searches until it changes.
+#
+# For case-insensitive literal search, the lowercased text is created on demand. Lowercasing
+# can change the length of the text (e.g. 'İ' becomes 'i̇'), so offsets in the folded text
+# are mapped back to the original one. The map only has an entry for each char that changed
+# its length, i.e. it's usually empty.
+########################################
+class SearchSnapshot(object):
+
+    def __init__(self, text):
+        self.text = text
+        self._folded = None
+        self._orig_points = array('Q')  # original offsets after each char that changed length
+        self._fold_points = array('Q')  # same offsets in the folded text
+        self._shifts = array('q')  # total length difference up to there
+
+    ########################################
+    #
+    ########################################
+    @property
+    def folded(self):
+        if self._folded is None:
+            self._fold()
+        return self._folded
+
+    ########################################
+    # Finds term in range [start, end) of the original text. Returns (start, end) of the match
+    # in the original text or None.
+    ########################################
+    def find(self, term, start, end, match_case=True, search_up=False):
+        if match_case:
+            pos = self.text.rfind(term, start, end) if search_up else self.text.find(term, start, end)
+            return (pos, pos + len(term)) if pos > -1 else None
+        term = term.lower()
+        text = self.folded
+        start, end = self.folded_offset(start), self.folded_offset(end)
+        pos = text.rfind(term, start, end) if search_up else text.find(term, start, end)
+        if pos < 0:
+            return None
+        return self.original_offset(pos), self.original_offset(pos + len(term))
+
+    ########################################
+    # Maps an offset in the original text to the folded text
+    ########################################
+    def folded_offset(self, pos):
+        k = bisect_right(self._orig_points, pos)
+        return pos + self._shifts[k - 1] if k else pos
+
+    ########################################
+    # Maps an offset in the folded text to the original text
+    ########################################
+    def original_offset(self, pos):
+        k = bisect_right(self._fold_points, pos)
+        return pos - self._shifts[k - 1] if k else pos
+
+    ########################################
+    #
+    ########################################
+    def _fold(self):
+        text = self.text
+        chunks = []
+        shift = 0
+        for base in range(0, len(text), FOLD_CHUNK):
+            chunk = text[base:base + FOLD_CHUNK]
+            folded = chunk.lower()
+            if len(folded) != len(chunk):
+                for i, c in enumerate(chunk):
+                    n = len(c.lower())
+                    if n != 1:
+                        shift += n - 1
+                        self._orig_points.append(base + i + 1)
+                        self._fold_points.append(base + i + 1 + shift)
+                        self._shifts.append(shift)
+            chunks.append(folded)
+        self._folded = chunks[0] if len(chunks) == 1 else ''.join(chunks)
+
+
+########################################
+# Returns True if a match of term can overlap another one, e.g. "abab" in "ababab"
+########################################
+def self_overlaps(term):
+    return any(term.startswith(term[i:]) for i in range(1, len(term)))
+
+
+########################################
+# Counts the matches of a search term in a SearchSnapshot in time slices: each call of
+# step() works for at most the specified time, so it can be run from a timer without
+# blocking the UI.
+#
+# Matches are counted like Find Next (and Replace All) finds them, i.e. without overlaps: "aa"
+# matches "aaaa" twice. Each match of a term also starts a match of any prefix of it, so if
+# previous is a finished count of a prefix that can't overlap itself (and so has found all of
+# them), only its matches are checked instead of searching the whole text again (unless there
+# are so many that checking them in Python would take longer).
+########################################
+class MatchCounter(object):
+
+    def __init__(self, snapshot, term, match_case=True, regex=False, previous=None):
+        self.snapshot = snapshot
+        self.term = term
+        self.match_case = match_case
+        self.regex = regex
+        self.done = False
+        self._matches = array('Q')  # start offsets in the searched (i.e. maybe folded) text
+        if regex:
+            self._pattern = search_pattern(term, True, match_case)  # raises re.error
+            self._iter = self._iter_regex()
+        elif previous and previous.extends_to(self) and previous.count * COUNT_REUSE_RATIO < len(snapshot.text):
+            self._iter = self._iter_candidates(previous._matches)
+        else:
+            self._iter = self._iter_text()
+
+    ########################################
+    #
+    ########################################
+    @property
+    def count(self):
+        return len(self._matches)
+
+    ########################################
+    # Returns True if this is a finished count of a literal prefix of other's term
+    ########################################
+    def extends_to(self, other):
+        return (self.done and not self.regex and not other.regex and self.snapshot is other.snapshot and
+                self.match_case == other.match_case and other.term.startswith(self.term) and
+                not self_overlaps(self._searched_term()))
+
+    ########################################
+    # Returns True if this counts the matches of the specified search
+    ########################################
+    def is_counting(self, snapshot, term, match_case, regex):
+        return self.snapshot is snapshot and self.term == term and self.match_case == match_case and self.regex == regex
+
+    ########################################
+    # Counts for at most the specified time (in seconds), returns True when done
+    ########################################
+    def step(self, seconds):
+        deadline = time.perf_counter() + seconds
+        for _ in self._iter:
+            if time.perf_counter() >= deadline:
+                return False
+        self.done = True
+        return True
+
+    ########################################
+    # Returns the 1-based index of the match that starts at the specified (original) offset,
+    # or 0 if there is none
+    ########################################
+    def index(self, pos):
+        if not self.match_case and not self.regex:
+            pos = self.snapshot.folded_offset(pos)
+        i = bisect_left(self._matches, pos)
+        return i + 1 if i < len(self._matches) and self._matches[i] == pos else 0
+
+    ########################################
+    # Generators that collect matches and yield after each chunk of work
+    ########################################
+    def _searched_text(self):
+        return self.snapshot.text if self.match_case else self.snapshot.folded
+
+    def _searched_term(self):
+        return self.term if self.match_case else self.term.lower()
+
+    def _iter_text(self):
+        text, term = self._searched_text(), self._searched_term()
+        if not term:
+            return
+        next_pos = 0  # end of the last match, a match that ends in the next chunk is found in this one
+        for start in range(0, len(text), COUNT_CHUNK):
+            end = min(start + COUNT_CHUNK + len(term) - 1, len(text))
+            pos = text.find(term, max(start, next_pos), end)
+            while pos > -1:
+                self._matches.append(pos)
+                next_pos = pos + len(term)
+                pos = text.find(term, next_pos, end)
+            yield
+
+    def _iter_candidates(self, candidates):
+        text, term = self._searched_text(), self._searched_term()
+        matches = self._matches
+        next_pos = 0
+        for start in range(0, len(candidates), COUNT_CANDIDATES):
+            for pos in candidates[start:start + COUNT_CANDIDATES]:
+                if pos >= next_pos and text.startswith(term, pos):
+                    matches.append(pos)
+                    next_pos = pos + len(term)
+            yield
+
+    def _iter_regex(self):
+        n = 0
+        for m in self._pattern.finditer(self.snapshot.text):
+            self._matches.append(m.start())
+            n += 1
+            if n % COUNT_CANDIDATES == 0:
+                yield
+
+
+########################################
+# Find as you type: searches a SearchSnapshot for a term that changes with each keystroke,
+# starting at the selection (anchor) the user started typing at.
+#
+# If the new term extends the previous one, its first match can't come before the current
+# match (since each match of the term is also one of its prefix), so the search continues from
+# there: if the current match still matches, this only costs a startswith(). Otherwise (and for
+# regular expressions) the search starts over at the anchor.
+########################################
+class IncrementalSearch(object):
+
+    def __init__(self, anchor_start, anchor_end, search_up=False, wrap_around=False):
+        self.anchor_start = anchor_start
+        self.anchor_end = anchor_end
+        self.search_up = search_up
+        self.wrap_around = wrap_around
+        self.term = ''
+        self.found = None  # (start, end) of the current match
+        self.wrapped = False
+        self._options = None
+
+    ########################################
+    # Returns (start, end) of the match of term, or None. Raises re.error for invalid regular
+    # expressions.
+    ########################################
+    def find(self, snapshot, term, match_case=True, regex=False):
+        options = (snapshot, match_case, regex)
+        found = None
+        if not term:
+            pass
+        elif (self.found and not self.wrapped and not regex and options == self._options and
+                term.startswith(self.term)):
+            found = self._continue(snapshot, term, match_case)
+        else:
+            found = self._search(snapshot, term, match_case, regex)
+        self.wrapped = False
+        if found is None and term and self.wrap_around:
+            found = self._search(snapshot, term, match_case, regex, True)
+            self.wrapped = found is not None
+        self.term = term
+        self.found = found
+        self._options = options
+        return found
+
+    ########################################
+    #
+    ########################################
+    def _continue(self, snapshot, term, match_case):
+        start = self.found[0]
+        end = None
+        if match_case:
+            if snapshot.text.startswith(term, start):
+                end = start + len(term)
+        else:
+            pos = snapshot.folded_offset(start)
+            if snapshot.folded.startswith(term.lower(), pos):
+                end = snapshot.original_offset(pos + len(term.lower()))
+        if end is not None and (end <= self.anchor_end or not self.search_up):
+            return start, end
+        if self.search_up:
+            return snapshot.find(term, 0, min(self.anchor_end, self.found[0] + len(term)), match_case, True)
+        return snapshot.find(term, start + 1, len(snapshot.text), match_case)
+
+    ########################################
+    # Searches from the anchor to the end (or start) of the text, or with wrapped=True
+    # the remaining part
+    ########################################
+    def _search(self, snapshot, term, match_case, regex, wrapped=False):
+        text = snapshot.text
+        if self.search_up:
+            start, end = (self.anchor_start, len(text)) if wrapped else (0, self.anchor_end)
+        else:
+            start, end = (0, self.anchor_end) if wrapped else (self.anchor_start, len(text))
+        if not regex:
+            return snapshot.find(term, start, end, match_case, self.search_up)
+        pattern = search_pattern(term, True, match_case)
+        match = search_backward(text, pattern, start, end) if self.search_up else search_forward(text, pattern, start, end)
+        return match.span() if match else None
@@ -0,0 +1,434 @@
+import hashlib
+import os
+import sqlite3
+from array import array
+from itertools import chain, groupby
+from operator import itemgetter
+
+from .findfiles import FindInFiles, decode_data, open_data
+
+TRIGRAM_INDEX_VERSION = 1  # stored as user_version, an index with another version is rebuilt
+TRIGRAM_FLUSH_POSTINGS = 0x800000  # 8 M new ids are collected in memory before they are written as a segment
+TRIGRAM_MAX_SEGMENTS = 16  # more segments are merged into one
+TRIGRAM_BATCH_FILES = 512  # max. number of files indexed by a worker at once (bigger batches leave less work to merge)
+TRIGRAM_QUERY_PARAMS = 500  # max. number of trigrams looked up with a single statement
+TRIGRAM_LOCK_TIMEOUT = 30  # seconds to wait for another search that is updating the same index
+
+# With re.IGNORECASE, these chars match others that str.lower() doesn't map them to (Python's
+# re module treats them as equivalent), so they are folded explicitly. U+0130 (capital I with
+# dot) has to be mapped before lowercasing, which would turn it into two chars.
+FOLD_TABLE = str.maketrans({
+    '\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u00b5': '\u03bc', '\u0345': '\u03b9',
+    '\u1fbe': '\u03b9', '\u1fd3': '\u0390', '\u1fe3': '\u03b0', '\u03c2': '\u03c3',
+    '\u03d0': '\u03b2', '\u03d1': '\u03b8', '\u03d5': '\u03c6', '\u03d6': '\u03c0',
+    '\u03f0': '\u03ba', '\u03f1': '\u03c1', '\u03f5': '\u03b5', '\u1e9b': '\u1e61',
+    '\ufb05': '\ufb06', '\u1c80': '\u0432', '\u1c81': '\u0434', '\u1c82': '\u043e',
+    '\u1c83': '\u0441', '\u1c84': '\u0442', '\u1c85': '\u0442', '\u1c86': '\u044a',
+    '\u1c87': '\u0463', '\u1c88': '\ua64b',
+})
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    ids BLOB NOT NULL,
+    PRIMARY KEY (trigram, segment)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+
+########################################
+# Returns the name of the index file for folder in data_dir
+########################################
+def index_filename(data_dir, folder):
+    key = os.path.normcase(os.path.abspath(folder)).encode('utf-8', 'surrogatepass')
+    return os.path.join(data_dir, hashlib.sha1(key).hexdigest() + '.sqlite3')
+
+
+########################################
+# Folds text so that chars that re.IGNORECASE treats as equal become the same char. Lone
+# surrogates (which sqlite can't store) become '?'.
+########################################
+def fold_text(text):
+    text = text.translate(FOLD_TABLE).lower()
+    if not text.isascii():
+        text = text.encode('utf-8', 'replace').decode('utf-8')
+    return text
+
+
+########################################
+# Returns the set of trigrams of the folded text
+########################################
+def text_trigrams(text):
+    text = fold_text(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+########################################
+# Returns a list of strings that every match of term (literal or regular expression) contains.
+# Only the literal chars of a regular expression outside of groups and character classes are
+# used; with alternatives or inline flags, nothing is known and the list is empty.
+########################################
+def required_literals(term, regex=False):
+    if not regex:
+        return [term]
+    if '|' in term or '(?' in term.replace('(?:', ''):
+        return []
+    literals = []
+    run = []
+    depth = 0
+    i = 0
+    while i < len(term):
+        c = term[i]
+        i += 1
+        if c == '\\':
+            c = term[i:i + 1]
+            i += 1
+            if c and not c.isalnum():
+                if not depth:
+                    run.append(c)
+                continue
+            # class (\d), anchor (\b), char code (\x41) or backreference (\1)
+            if c in 'xuU':
+                i += {'x': 2, 'u': 4, 'U': 8}[c]
+            elif c == 'N':
+                i = term.find('}', i) + 1 or len(term)
+            else:
+                while i < len(term) and term[i].isdigit():
+                    i += 1
+        elif c == '[':
+            if term[i:i + 1] == '^':
+                i += 1
+            i += 1  # a leading ']' is a literal
+            while i < len(term) and term[i] != ']':
+                i += 2 if term[i] == '\\' else 1
+            i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth = max(0, depth - 1)
+        elif c in '*?{':
+            # the preceding char is optional
+            if run:
+                run.pop()
+            if c == '{':
+                i = term.find('}', i) + 1 or len(term)
+        elif c not in '+.^$' and not depth:
+            run.append(c)
+            continue
+        if run:
+            literals.append(''.join(run))
+            run = []
+    if run:
+        literals.append(''.join(run))
+    return literals
+
+
+########################################
+# Returns the trigrams that every file with a match of term must contain. An empty set means
+# that the index can't narrow the search down.
+########################################
+def query_trigrams(term, regex=False):
+    trigrams = set()
+    for literal in required_literals(term, regex):
+        trigrams.update(text_trigrams(literal))
+    return trigrams
+
+
+########################################
+# Reads and indexes a batch of files (in a worker process), which get consecutive ids starting
+# at first_id. Returns (files, trigrams, counts, ids): files is [(file_id, filename, mtime,
+# size), ...] (unreadable files are left out, binary ones have no trigrams), followed by the
+# postings of the batch: the trigrams joined into a single string, the number of ids of each
+# trigram and all the ids, as bytes of arrays. That's way faster to pass back than sets of
+# strings, and leaves little work to the process that updates the index.
+########################################
+def index_files(filenames, first_id):
+    files = []
+    postings = {}
+    for file_id, filename in enumerate(filenames, first_id):
+        try:
+            stat = os.stat(filename)
+            with open_data(filename) as data:
+                decoded = decode_data(data)
+        except (OSError, UnicodeDecodeError, ValueError):
+            continue
+        files.append((file_id, filename, stat.st_mtime_ns, stat.st_size))
+        if decoded:
+            for trigram in text_trigrams(decoded[0]):
+                ids = postings.get(trigram)
+                if ids is None:
+                    postings[trigram] = [file_id]
+                else:
+                    ids.append(file_id)
+    counts = array('I', map(len, postings.values()))
+    ids = array('I', chain.from_iterable(postings.values()))
+    return files, ''.join(postings), counts.tobytes(), ids.tobytes()
+
+
+########################################
+# Persistent trigram index of the text files in a folder, stored in a sqlite database.
+#
+# Each file gets an id, and for each trigram of its (case-folded) text, the ids of all files
+# that contain it are stored as arrays (in no particular order). A search then only has to check the files whose ids are
+# in the arrays of all trigrams of the term.
+#
+# Files are identified by (path, mtime, size), a changed file is removed and added again with a
+# new id. New ids are collected in memory and written as a new segment (one more array per
+# trigram), so adding files never rewrites existing arrays. Segments are merged once there are
+# more than TRIGRAM_MAX_SEGMENTS. The ids of removed files are ignored (they don't map to a file
+# anymore) and only dropped from the arrays when merging, which is also done once they make up
+# more than half of all ids.
+########################################
+class TrigramIndex(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = sqlite3.connect(filename, timeout=TRIGRAM_LOCK_TIMEOUT)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != TRIGRAM_INDEX_VERSION:
+            self._db.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS meta;')
+        self._db.executescript(SCHEMA)
+        self._db.execute(f'PRAGMA user_version = {TRIGRAM_INDEX_VERSION}')
+        self._pending = {}  # trigram -> array of new ids
+        self._pending_count = 0
+        self._segment = 0  # id of the first file added since the last flush, identifies the new segment
+        self._next_id = 0
+
+    ########################################
+    # Closes the database, pending changes that weren't flushed are discarded
+    ########################################
+    def close(self):
+        self._db.close()
+
+    ########################################
+    #
+    ########################################
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ########################################
+    # Returns the filenames of files (dict filename -> (mtime, size)) that are not indexed or
+    # have changed since
+    ########################################
+    def outdated(self, files):
+        indexed = {path: (mtime, size) for path, mtime, size in self._db.execute('SELECT path, mtime, size FROM files')}
+        return [filename for filename, stat in files.items() if indexed.get(filename) != stat]
+
+    ########################################
+    # Removes indexed files that don't exist anymore, except for the ones in keep
+    ########################################
+    def prune(self, keep=()):
+        gone = [path for path, in self._db.execute('SELECT path FROM files')
+                if path not in keep and not os.path.isfile(path)]
+        self._remove(gone)
+        self.flush()
+
+    ########################################
+    # Returns the first of count new file ids for index_files(). Ids are never reused, so
+    # the ones of removed files that are still in the postings can't be mistaken for others.
+    ########################################
+    def reserve_ids(self, count):
+        if not self._next_id:
+            row = self._db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'files'").fetchone()
+            self._next_id = (row[0] if row else 0) + 1
+        first_id = self._next_id
+        self._next_id += count
+        return first_id
+
+    ########################################
+    # Adds (or replaces) the files of a batch returned by index_files(). The changes are written
+    # by flush(), which is called automatically once TRIGRAM_FLUSH_POSTINGS ids are pending.
+    ########################################
+    def add(self, batch):
+        files, trigrams, counts, ids = batch
+        if not files:
+            return
+        self._remove([filename for _, filename, _, _ in files])
+        self._db.executemany('INSERT INTO files VALUES (?, ?, ?, ?)', files)
+        if not self._segment:
+            self._segment = files[0][0]
+        pending = self._pending
+        ids = array('I', ids)
+        pos = 0
+        for i, count in enumerate(array('I', counts)):
+            trigram = trigrams[3 * i:3 * i + 3]
+            part = ids[pos:pos + count]
+            pos += count
+            other = pending.get(trigram)
+            if other is None:
+                pending[trigram] = part
+            else:
+                other.extend(part)
+        self._pending_count += len(ids)
+        if self._pending_count >= TRIGRAM_FLUSH_POSTINGS:
+            self.flush()
+
+    ########################################
+    # Writes the pending ids as a new segment and commits all changes
+    ########################################
+    def flush(self):
+        if self._pending:
+            self._db.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                    ((trigram, self._segment, ids.tobytes()) for trigram, ids in self._pending.items()))
+            self._count('segments', 1)
+        self._db.commit()
+        self._pending = {}
+        self._pending_count = 0
+        self._segment = 0
+        self._compact_if_needed()
+
+    ########################################
+    # Returns the set of indexed filenames that may contain term, or None if the index can't
+    # narrow the search down (term has no trigrams)
+    ########################################
+    def candidates(self, term, regex=False):
+        trigrams = list(query_trigrams(term, regex))
+        if not trigrams:
+            return None
+        postings = {}
+        for start in range(0, len(trigrams), TRIGRAM_QUERY_PARAMS):
+            chunk = trigrams[start:start + TRIGRAM_QUERY_PARAMS]
+            for trigram, data in self._db.execute(
+                    f'SELECT trigram, ids FROM postings WHERE trigram IN ({",".join("?" * len(chunk))})', chunk):
+                postings.setdefault(trigram, array('I')).frombytes(data)
+        if len(postings) < len(trigrams):
+            # some trigram isn't contained in any file
+            return set()
+        arrays = sorted(postings.values(), key=len)
+        ids = set(arrays[0])
+        for other in arrays[1:]:
+            ids.intersection_update(other)
+            if not ids:
+                return set()
+        if len(ids) > TRIGRAM_QUERY_PARAMS:
+            return {path for file_id, path in self._db.execute('SELECT id, path FROM files') if file_id in ids}
+        return {path for path, in self._db.execute(f'SELECT path FROM files WHERE id IN ({",".join("?" * len(ids))})', list(ids))}
+
+    ########################################
+    #
+    ########################################
+    def _remove(self, paths):
+        removed = 0
+        for path in paths:
+            removed += self._db.execute('DELETE FROM files WHERE path = ?', (path,)).rowcount
+        if removed:
+            self._count('dead', removed)
+
+    ########################################
+    # Adds n to a counter in table meta
+    ########################################
+    def _count(self, key, n):
+        self._db.execute('INSERT INTO meta VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + ?', (key, n, n))
+
+    ########################################
+    # Merges the segments, once there are too many of them or too many dead ids
+    ########################################
+    def _compact_if_needed(self):
+        meta = dict(self._db.execute('SELECT key, value FROM meta'))
+        dead = meta.get('dead', 0)
+        if dead <= self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0] and meta.get('segments', 0) <= TRIGRAM_MAX_SEGMENTS:
+            return
+        live = {file_id for file_id, in self._db.execute('SELECT id FROM files')} if dead else None
+        self._db.execute('DROP TABLE IF EXISTS merged')
+        self._db.execute('CREATE TABLE merged (trigram TEXT, segment INTEGER, ids BLOB, PRIMARY KEY (trigram, segment)) WITHOUT ROWID')
+        rows = []
+        for trigram, group in groupby(self._db.execute('SELECT trigram, ids FROM postings ORDER BY trigram, segment'), itemgetter(0)):
+            ids = array('I')
+            for _, data in group:
+                ids.frombytes(data)
+            if live is not None:
+                ids = array('I', filter(live.__contains__, ids))
+            if ids:
+                rows.append((trigram, 0, ids.tobytes()))
+            if len(rows) >= TRIGRAM_QUERY_PARAMS:
+                self._db.executemany('INSERT INTO merged VALUES (?, ?, ?)', rows)
+                rows = []
+        self._db.executemany('INSERT INTO merged VALUES (?, ?, ?)', rows)
+        self._db.execute('DROP TABLE postings')
+        self._db.execute('ALTER TABLE merged RENAME TO postings')
+        self._db.execute('DELETE FROM meta')
+        self._db.commit()
+
+
+########################################
+# Find in Files backed by a TrigramIndex: the files of the folder are walked as usual, but only
+# the ones that are new or changed since the last search are read (by the worker processes) to
+# update the index. Then only the candidates returned by the index are searched.
+#
+# If the index can't be used (e.g. it's locked by another search for longer than
+# TRIGRAM_LOCK_TIMEOUT), all files are searched.
+########################################
+class IndexedFindInFiles(FindInFiles):
+
+    def __init__(self, folder, term, regex=False, match_case=True, includes=(), excludes=(), index_file=None,
+            workers=None):
+        super().__init__(folder, term, regex, match_case, includes, excludes, workers)
+        self.index_file = index_file
+        self.indexing = False
+        self.files_outdated = 0
+        self.files_indexed = 0
+        self._index = None
+
+    ########################################
+    #
+    ########################################
+    def _search(self, executor, callback):
+        files = {filename: stat for filename, stat in self._iter_files()}
+        if self.cancelled:
+            return
+        candidates = None
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            with TrigramIndex(self.index_file) as index:
+                self._index = index
+                self.indexing = True
+                outdated = index.outdated({filename: (stat.st_mtime_ns, stat.st_size) for filename, stat in files.items()})
+                self.files_outdated = len(outdated)
+                batches = self._iter_batches(((filename, files[filename]) for filename in outdated), TRIGRAM_BATCH_FILES)
+                self._map(executor, self._submit_index, batches, lambda futures: self._add_to_index(index, futures))
+                # also keeps what was indexed before a cancel
+                index.flush()
+                index.prune(files)
+                self.indexing = False
+                if self.cancelled:
+                    return
+                candidates = index.candidates(self.term, self.regex)
+        except (OSError, sqlite3.Error):
+            pass
+        finally:
+            self.indexing = False
+            self._index = None
+        files = ((filename, stat) for filename, stat in files.items() if candidates is None or filename in candidates)
+        self._map(executor, self._submit, self._iter_batches(files), lambda futures: self._collect(futures, callback))
+
+    ########################################
+    #
+    ########################################
+    def _submit_index(self, executor, batch):
+        return executor.submit(index_files, batch, self._index.reserve_ids(len(batch)))
+
+    ########################################
+    #
+    ########################################
+    def _add_to_index(self, index, futures):
+        for future in futures:
+            if future.cancelled() or future.exception():
+                continue
+            batch = future.result()
+            index.add(batch)
+            self.files_indexed += len(batch[0])
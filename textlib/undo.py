@@ -0,0 +1,332 @@
+import contextlib
+import marshal
+import zlib
+from array import array
+from itertools import accumulate, islice
+from operator import itemgetter
+
+from .piecetable import PieceTable
+
+UNDO_MEMORY_BUDGET = 0x4000000  # 64 MB
+UNDO_DELTA_SIZE = 160  # estimated memory usage of a delta (tuple, int and strs) without chars
+UNDO_PACK_MIN = 256  # groups with more deltas are packed right away
+UNDO_COMPRESS_MIN = 0x10000  # groups of at least 64 KB are packed once they are old
+UNDO_KEEP_RAW = 4  # number of most recent groups that are never packed
+
+
+########################################
+# Packs a list of deltas into compressed bytes: offsets and lengths are stored as arrays,
+# removed and inserted texts joined into one string each, which compresses well for the
+# repetitive deltas of e.g. Replace All.
+########################################
+def pack_deltas(deltas):
+    removed = list(map(itemgetter(1), deltas))
+    inserted = list(map(itemgetter(2), deltas))
+    data = (
+        array('Q', map(itemgetter(0), deltas)).tobytes(),
+        array('Q', map(len, removed)).tobytes(),
+        array('Q', map(len, inserted)).tobytes(),
+        ''.join(removed).encode('utf-16-le', 'surrogatepass'),
+        ''.join(inserted).encode('utf-16-le', 'surrogatepass'),
+    )
+    return zlib.compress(marshal.dumps(data), 1)
+
+
+########################################
+#
+########################################
+def unpack_deltas(data):
+    offsets, removed_lens, inserted_lens, removed, inserted = marshal.loads(zlib.decompress(data))
+    offsets, removed_lens, inserted_lens = array('Q', offsets), array('Q', removed_lens), array('Q', inserted_lens)
+    removed = removed.decode('utf-16-le', 'surrogatepass')
+    inserted = inserted.decode('utf-16-le', 'surrogatepass')
+    return list(zip(offsets, _split(removed, removed_lens), _split(inserted, inserted_lens)))
+
+
+########################################
+#
+########################################
+def _split(text, lens):
+    ends = accumulate(lens)
+    return [text[start:end] for start, end in zip(accumulate(islice(lens, len(lens) - 1), initial=0), ends)]
+
+
+########################################
+# Returns text with deltas (offset, old, new) applied in order. Deltas that are sorted (like
+# the ones of Replace All or their undo) are applied in a single pass, others one by one on a
+# piece table.
+########################################
+def apply_deltas(text, deltas):
+    if all(d[0] >= c[0] + len(c[2]) for c, d in zip(deltas, islice(deltas, 1, None))):
+        # ascending, i.e. each offset has to be corrected by the shift of all previous deltas
+        parts = []
+        pos = shift = 0
+        for offset, old, new in deltas:
+            parts.append(text[pos:offset - shift])
+            parts.append(new)
+            pos = offset - shift + len(old)
+            shift += len(new) - len(old)
+        parts.append(text[pos:])
+        return ''.join(parts)
+    if all(d[0] + len(d[1]) <= c[0] for c, d in zip(deltas, islice(deltas, 1, None))):
+        # descending, i.e. all offsets refer to the original text
+        parts = []
+        pos = len(text)
+        for offset, old, new in deltas:
+            parts.append(text[offset + len(old):pos])
+            parts.append(new)
+            pos = offset
+        parts.append(text[:pos])
+        return ''.join(reversed(parts))
+    doc = PieceTable(text)
+    for offset, old, new in deltas:
+        doc.replace(offset, offset + len(old), new)
+    return str(doc)
+
+
+########################################
+# Returns the ranges (start, end, new) to replace one after the other to apply deltas (offset,
+# old, new) to text. Sorted deltas are converted to ranges of the original text, from back to
+# front, and deltas at most max_gap chars apart are merged into a single range that includes the
+# unchanged text in between. Other deltas are returned one by one.
+########################################
+def delta_ranges(text, deltas, max_gap):
+    if all(d[0] >= c[0] + len(c[2]) for c, d in zip(deltas, islice(deltas, 1, None))):
+        shift = 0
+        ranges = []
+        for offset, old, new in deltas:
+            ranges.append((offset - shift, offset - shift + len(old), new))
+            shift += len(new) - len(old)
+        ranges.reverse()
+    elif all(d[0] + len(d[1]) <= c[0] for c, d in zip(deltas, islice(deltas, 1, None))):
+        ranges = [(offset, offset + len(old), new) for offset, old, new in deltas]
+    else:
+        return [(offset, offset + len(old), new) for offset, old, new in deltas]
+    merged = []
+    parts = []  # new texts and gaps of the range being merged, back to front
+    range_start = range_end = 0
+    for start, end, new in ranges:
+        if parts and range_start - end <= max_gap:
+            parts.append(text[end:range_start])
+        elif parts:
+            merged.append((range_start, range_end, ''.join(reversed(parts))))
+            parts = []
+            range_end = end
+        else:
+            range_end = end
+        parts.append(new)
+        range_start = start
+    if parts:
+        merged.append((range_start, range_end, ''.join(reversed(parts))))
+    return merged
+
+
+########################################
+# Returns where pos ends up after applying ascending deltas (like the ones of Replace All):
+# positions inside a replaced range move to its start. Only the deltas before pos are checked.
+########################################
+def shift_offset(deltas, pos):
+    for offset, old, new in deltas:
+        if offset >= pos:
+            break
+        if offset + len(old) > pos:
+            return offset
+        pos += len(new) - len(old)
+    return pos
+
+
+########################################
+# Multi-level undo/redo history.
+#
+# Each change is recorded as a delta (offset, removed, inserted): the text removed at offset
+# and the text that replaced it, so only the changed ranges are stored, never the whole text.
+# Related deltas are grouped and undone/redone together: explicitly with group(), and
+# consecutively typed (or deleted) chars are merged into a single delta ("typing run").
+#
+# Groups with many deltas (and big old ones) are packed into compressed bytes. If the estimated
+# memory usage still exceeds budget, the groups that can be redone are dropped first (starting
+# with the last one to redo), then the oldest undo groups, but the most recent undo group is
+# always kept. The sizes of both lists are tracked separately, as undo/redo move groups between
+# them.
+########################################
+class UndoHistory(object):
+
+    def __init__(self, budget=UNDO_MEMORY_BUDGET):
+        self.budget = budget
+        self.clear()
+
+    ########################################
+    #
+    ########################################
+    def clear(self):
+        self._undo = []  # [size, deltas or packed deltas] per group, oldest first
+        self._redo = []
+        self._undo_size = 0
+        self._redo_size = 0
+        self._group = None
+        self._depth = 0
+        self._run = False  # the last group is a typing run that can be continued
+
+    ########################################
+    #
+    ########################################
+    @property
+    def can_undo(self):
+        return len(self._undo) > 0
+
+    ########################################
+    #
+    ########################################
+    @property
+    def can_redo(self):
+        return len(self._redo) > 0
+
+    ########################################
+    # Estimated memory usage in bytes
+    ########################################
+    @property
+    def size(self):
+        return self._undo_size + self._redo_size
+
+    ########################################
+    # Records that removed at offset was replaced by inserted. typing=True allows merging
+    # with the previous delta, if it was typed as well and this one continues it.
+    ########################################
+    def record(self, offset, removed, inserted, typing=False):
+        if not removed and not inserted:
+            return
+        self._clear_redo()
+        if self._group is not None:
+            self._group.append((offset, removed, inserted))
+            return
+        if typing and self._run:
+            size, deltas = self._undo[-1]
+            o, r, i = deltas[-1]
+            merged = True
+            if not removed and o + len(i) == offset:
+                # typed on
+                deltas[-1] = (o, r, i + inserted)
+            elif not inserted and not i and offset + len(removed) == o:
+                # Backspace
+                deltas[-1] = (offset, removed + r, i)
+            elif not inserted and not i and offset == o:
+                # Del
+                deltas[-1] = (o, r + removed, i)
+            else:
+                # starts a new run
+                merged = False
+            if merged:
+                self._undo[-1][0] += 2 * (len(removed) + len(inserted))
+                self._undo_size += 2 * (len(removed) + len(inserted))
+                return
+        self._push([(offset, removed, inserted)])
+        self._run = typing
+
+    ########################################
+    # Adds a group of deltas, which have to be applied in the specified order
+    ########################################
+    def add_group(self, deltas):
+        if self._group is not None:
+            self._group.extend(deltas)
+        elif deltas:
+            self._clear_redo()
+            self._push(list(deltas))
+            self._run = False
+
+    ########################################
+    # All deltas recorded inside the with block are undone/redone as one
+    ########################################
+    @contextlib.contextmanager
+    def group(self):
+        if self._depth == 0:
+            self._group = []
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                deltas, self._group = self._group, None
+                self.add_group(deltas)
+
+    ########################################
+    # Returns the deltas (offset, old, new) that undo the last group: in this order, range
+    # [offset, offset + len(old)) has to be replaced by new. Returns None if there is nothing
+    # to undo.
+    ########################################
+    def undo(self):
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        self._redo.append(entry)
+        self._undo_size -= entry[0]
+        self._redo_size += entry[0]
+        self._run = False
+        return [(offset, inserted, removed) for offset, removed, inserted in reversed(self._deltas(entry))]
+
+    ########################################
+    # Returns the deltas (offset, old, new) that redo the last undone group, or None
+    ########################################
+    def redo(self):
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        self._undo.append(entry)
+        self._redo_size -= entry[0]
+        self._undo_size += entry[0]
+        self._run = False
+        return self._deltas(entry)
+
+    ########################################
+    #
+    ########################################
+    def _push(self, deltas):
+        if len(deltas) > UNDO_PACK_MIN:
+            deltas = pack_deltas(deltas)
+            size = len(deltas)
+        else:
+            size = sum(UNDO_DELTA_SIZE + 2 * (len(removed) + len(inserted)) for _, removed, inserted in deltas)
+        self._undo.append([size, deltas])
+        self._undo_size += size
+        if self.size > self.budget:
+            self._trim()
+
+    ########################################
+    #
+    ########################################
+    def _clear_redo(self):
+        self._redo = []
+        self._redo_size = 0
+
+    ########################################
+    # Drops redo groups, then packs and drops the oldest undo groups until the history fits into
+    # the budget
+    ########################################
+    def _trim(self):
+        while self._redo and self.size > self.budget:
+            # the bottom of the stack is redone last
+            self._redo_size -= self._redo.pop(0)[0]
+        budget = self.budget - self._redo_size
+        for entry in self._undo[:-UNDO_KEEP_RAW]:
+            if self._undo_size <= budget:
+                return
+            size, deltas = entry
+            if isinstance(deltas, list) and size >= UNDO_COMPRESS_MIN:
+                data = pack_deltas(deltas)
+                if len(data) < size:
+                    entry[:] = len(data), data
+                    self._undo_size += len(data) - size
+        drop = 0
+        while self._undo_size > budget and drop < len(self._undo) - 1:
+            self._undo_size -= self._undo[drop][0]
+            drop += 1
+        del self._undo[:drop]
+
+    ########################################
+    #
+    ########################################
+    def _deltas(self, entry):
+        deltas = entry[1]
+        if isinstance(deltas, bytes):
+            return unpack_deltas(deltas)
+        return deltas
@@ -48,21 +48,27 @@ EC_LEFTMARGIN = 1
 EC_RIGHTMARGIN = 2
 EDIT_CLASS = "EDIT"
 EM_CHARFROMPOS = 215
+EM_GETFIRSTVISIBLELINE = 206
+EM_GETHANDLE = 189
 EM_GETLINE = 196
 EM_GETLINECOUNT = 186
 EM_GETSEL = 176
 EM_LINEFROMCHAR = 201
 EM_LINEINDEX = 187
 EM_LINELENGTH = 193
+EM_LINESCROLL = 182
 EM_POSFROMCHAR = 214
 EM_REPLACESEL = 194
+EM_SCROLLCARET = 183
 EM_SETLIMITTEXT = 197
 EM_SETMARGINS = 211
+EM_SETREADONLY = 207
 EM_SETSEL = 177
 EM_SETTABSTOPS = 203
 EM_UNDO = 199
 EN_CHANGE = 768
 EN_UPDATE = 1024
+EN_VSCROLL = 1538
 ERROR = 0
 ERROR_SUCCESS = 0
 ES_AUTOVSCROLL = 64
@@ -94,6 +100,11 @@ IDRETRY = 4
 IDYES = 6
 IMAGE_BITMAP = 0
 IMAGE_ICON = 1
+LB_ADDSTRING = 384
+LB_GETCOUNT = 395
+LB_GETCURSEL = 392
+LB_RESETCONTENT = 388
+LBN_DBLCLK = 2
 LF_FACESIZE = 32
 LOGPIXELSX = 88
 LOGPIXELSY = 90
@@ -118,6 +129,7 @@ MF_POPUP = 16
 MF_SEPARATOR = 2048
 MF_STRING = 0
 MF_UNCHECKED = 0
+MM_ANISOTROPIC = 8
 MIIM_BITMAP = 128
 MIIM_ID = 2
 MIIM_STRING = 64
@@ -136,6 +148,7 @@ PD_NOSELECTION = 4
 PD_PAGENUMS = 2
 PD_PRINTSETUP = 64
 PD_RETURNDC = 256
+PD_RETURNDEFAULT = 1024
 PD_USEDEVMODECOPIES = 262144
 PSD_INHUNDREDTHSOFMILLIMETERS = 8
 PSD_MARGINS = 2
@@ -160,6 +173,7 @@ SIID_WARNING = 78
 SS_ICON = 3
 SS_LEFT = 0
 SS_NOPREFIX = 128
+SS_OWNERDRAW = 13
 SS_SIMPLE = 11
 STATUSCLASSNAME = "msctls_statusbar32"
 STM_SETICON = 368
@@ -292,6 +306,7 @@ VK_XBUTTON2 = 6
 VK_ZOOM = 251
 WC_BUTTON = "Button"
 WC_STATIC = "Static"
+WM_APP = 32768
 WM_CHANGEUISTATE = 295
 WM_CHAR = 258
 WM_CLEAR = 771
@@ -304,12 +319,14 @@ WM_CTLCOLOREDIT = 307
 WM_CTLCOLORLISTBOX = 308
 WM_CTLCOLORSTATIC = 312
 WM_CUT = 768
+WM_DRAWITEM = 43
 WM_DROPFILES = 563
 WM_ERASEBKGND = 20
 WM_GETFONT = 49
 WM_GETTEXT = 13
 WM_GETTEXTLENGTH = 14
 WM_INITDIALOG = 272
+WM_KEYDOWN = 256
 WM_KEYUP = 257
 WM_LBUTTONUP = 514
 WM_MOUSEMOVE = 512
@@ -325,6 +342,7 @@ WM_SETTINGCHANGE = 26
 WM_SIZE = 5
 WM_THEMECHANGED = 794
 WM_TIMER = 275
+WM_UNDO = 772
 WS_BORDER = 8388608
 WS_CAPTION = 12582912
 WS_CHILD = 1073741824
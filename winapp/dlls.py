@@ -127,6 +127,10 @@ gdi32.GetTextMetricsW.argtypes = (HDC, LPVOID)
 
 gdi32.MaskBlt.argtypes = (HDC, INT, INT, INT, INT, HDC, INT, INT, HBITMAP, INT, INT, DWORD)
 
+gdi32.RestoreDC.argtypes = (HDC, INT)
+
+gdi32.SaveDC.argtypes = (HDC, )
+
 gdi32.SelectObject.argtypes = (HDC, HANDLE)
 
 gdi32.SetBkColor.argtypes = (HDC, COLORREF)
@@ -142,6 +146,8 @@ gdi32.SetTextColor.argtypes = (HDC, COLORREF)
 
 gdi32.SetViewportExtEx.argtypes = (HDC, INT, INT, POINTER(SIZE))
 
+gdi32.SetViewportOrgEx.argtypes = (HDC, INT, INT, POINTER(POINT))
+
 gdi32.SetWindowExtEx.argtypes = (HDC, INT, INT, POINTER(SIZE))
 
 ########################################
@@ -172,6 +178,11 @@ kernel32.GlobalUnlock.argtypes = (HANDLE,)
 
 kernel32.LoadLibraryW.restype = HANDLE
 
+kernel32.LocalLock.argtypes = (HLOCAL, )
+kernel32.LocalLock.restype = LPVOID
+
+kernel32.LocalUnlock.argtypes = (HLOCAL, )
+
 kernel32.LoadResource.argtypes = (HANDLE, HANDLE)
 kernel32.LoadResource.restype = HANDLE
 